@@ -0,0 +1,42 @@
+import numpy as np
+from .constants import *
+
+NEAR, MID, FAR, DORMANT = range(4)
+TIER_NAMES = ('near', 'mid', 'far', 'dormant')
+TIER_INTERVALS = np.array([1, AI_MID_INTERVAL, AI_FAR_INTERVAL, 0])
+
+class AIScheduler:
+    # Level-of-detail scheduling for monster AI. Each tick monsters are
+    # bucketed by distance to the player: near (or in view) ones think every
+    # tick, mid and far ones every AI_MID_INTERVAL / AI_FAR_INTERVAL ticks
+    # with proportionally larger steps, and monsters standing on unexplored
+    # tiles away from the player stay dormant. Reduced-rate monsters are
+    # staggered by slot index so each tick updates an even share of them.
+    def __init__(self):
+        self.tick = 0
+        self.tier_counts = np.zeros(len(TIER_NAMES), dtype=np.int64)
+
+    def schedule(self, store, player, game_map):
+        # Returns (indices, scales): the monsters to update this tick and
+        # the factor their movement is multiplied by
+        tick = self.tick
+        self.tick += 1
+
+        indices = store.alive_indices()
+        x = store.x[indices]
+        y = store.y[indices]
+        player_x, player_y = player.rect.center
+        distance_sq = (x - player_x) ** 2 + (y - player_y) ** 2
+        near_sq = (AI_NEAR_RADIUS * TILE_SIZE) ** 2
+        mid_sq = (AI_MID_RADIUS * TILE_SIZE) ** 2
+
+        explored, visible = game_map.tile_states((x // TILE_SIZE).astype(np.intp),
+                                                 (y // TILE_SIZE).astype(np.intp))[1:]
+        near = visible | (distance_sq <= near_sq)
+        tiers = np.where(near, NEAR, np.where(distance_sq <= mid_sq, MID, FAR))
+        tiers[~near & ~explored] = DORMANT
+        self.tier_counts = np.bincount(tiers, minlength=len(TIER_NAMES))
+
+        intervals = TIER_INTERVALS[tiers]
+        due = (intervals > 0) & ((indices + tick) % np.maximum(intervals, 1) == 0)
+        return indices[due], intervals[due]
@@ -0,0 +1,139 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .constants import *
+from .generators import GENERATORS, make_generator
+from .regions import label_regions
+
+# maps.bin record header: seed, width, height, packed tile bytes
+RECORD_HEADER = struct.Struct('<qIII')
+
+def map_statistics(game_map, rooms):
+    floor = ~game_map.tiles
+    floor_tiles = int(floor.sum())
+
+    # Share of floor reachable from the player's spawn in the first room
+    regions = 0
+    connectivity = 0.0
+    if floor_tiles:
+        labels, sizes = label_regions(floor)
+        regions = int(len(sizes))
+        if rooms:
+            spawn_label = labels[rooms[0].center_x, rooms[0].center_y]
+            if spawn_label >= 0:
+                connectivity = float(sizes[spawn_label]) / floor_tiles
+
+    return {
+        'rooms': len(rooms),
+        'floor_ratio': floor_tiles / floor.size,
+        'regions': regions,
+        'connectivity': connectivity,
+    }
+
+def generate_one(seed, params):
+    # Returns (seed, packed tiles, stats); runs inside a worker process
+    start = time.perf_counter()
+    game_map = make_generator(seed=seed, **params).generate()
+    generation_time = time.perf_counter() - start
+
+    stats = map_statistics(game_map, game_map.rooms)
+    stats['seed'] = seed
+    stats['generation_time'] = generation_time
+    return seed, np.packbits(game_map.tiles).tobytes(), stats
+
+def _generate_chunk(seeds, params):
+    return [generate_one(seed, params) for seed in seeds]
+
+def unpack_tiles(packed, width, height):
+    bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=width * height)
+    return bits.reshape(width, height).astype(bool)
+
+def generate_batch(seeds, params=None, workers=None, chunk_size=BATCH_CHUNK_SIZE):
+    # Yields (seed, packed tiles, stats) as chunks of seeds complete, in
+    # completion order rather than seed order
+    params = params or {}
+    seeds = list(seeds)
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_generate_chunk, chunk, params) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+def write_batch(results, out_dir, width, height):
+    # Stream results to out_dir/maps.bin and out_dir/stats.jsonl, replacing
+    # any earlier batch there so offsets and stats stay in step
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    with open(os.path.join(out_dir, 'maps.bin'), 'wb') as maps_file, \
+         open(os.path.join(out_dir, 'stats.jsonl'), 'w') as stats_file:
+        for seed, packed, stats in results:
+            stats['offset'] = maps_file.tell()
+            maps_file.write(RECORD_HEADER.pack(seed, width, height, len(packed)))
+            maps_file.write(packed)
+            stats_file.write(json.dumps(stats) + '\n')
+            count += 1
+            if count % BATCH_FLUSH_INTERVAL == 0:
+                maps_file.flush()
+                stats_file.flush()
+    return count
+
+def summarize(out_dir):
+    with open(os.path.join(out_dir, 'stats.jsonl')) as stats_file:
+        stats = [json.loads(line) for line in stats_file]
+    summary = {'maps': len(stats)}
+    if not stats:
+        return summary
+    for key in ('rooms', 'floor_ratio', 'regions', 'connectivity', 'generation_time'):
+        values = np.array([entry[key] for entry in stats], dtype=float)
+        summary[key] = {
+            'mean': float(values.mean()),
+            'min': float(values.min()),
+            'p50': float(np.percentile(values, 50)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate dungeons in parallel and record per-map statistics")
+    parser.add_argument('--count', type=int, default=1000, help="number of maps")
+    parser.add_argument('--start-seed', type=int, default=0, help="first seed; seeds are consecutive")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--out', default='dungeon_batch', help="output directory")
+    parser.add_argument('--generator', choices=GENERATORS, default=MAP_ALGORITHM,
+                        help="map generation algorithm (default: %(default)s)")
+    parser.add_argument('--width', type=int, default=MAP_WIDTH)
+    parser.add_argument('--height', type=int, default=MAP_HEIGHT)
+    parser.add_argument('--max-rooms', type=int, default=None,
+                        help=f"rooms per map (default: one per {ROOM_AREA} tiles)")
+    parser.add_argument('--room-min-size', type=int, default=ROOM_MIN_SIZE)
+    parser.add_argument('--room-max-size', type=int, default=ROOM_MAX_SIZE)
+    args = parser.parse_args()
+
+    params = {
+        'algorithm': args.generator,
+        'width': args.width,
+        'height': args.height,
+    }
+    if args.generator in ('rooms', 'bsp'):
+        params['room_min_size'] = args.room_min_size
+        params['room_max_size'] = args.room_max_size
+    if args.generator == 'rooms' and args.max_rooms is not None:
+        params['max_rooms'] = args.max_rooms
+    seeds = range(args.start_seed, args.start_seed + args.count)
+
+    start = time.perf_counter()
+    count = write_batch(generate_batch(seeds, params, args.workers),
+                        args.out, args.width, args.height)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {count} maps in {elapsed:.1f}s ({count / elapsed:.0f} maps/s)")
+    print(json.dumps(summarize(args.out), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,11 @@ class Camera:
         
     def update(self, target):
         # Center the camera on the target
-        self.x = target.rect.centerx - WINDOW_WIDTH // 2
-        self.y = target.rect.centery - WINDOW_HEIGHT // 2
+        self.center_on(target.rect.centerx, target.rect.centery)
+        
+    def center_on(self, x, y):
+        self.x = x - WINDOW_WIDTH // 2
+        self.y = y - WINDOW_HEIGHT // 2
         
     def apply(self, entity):
         # Return a new rect moved by camera offset
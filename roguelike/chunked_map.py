@@ -0,0 +1,241 @@
+import os
+import dbm
+import random
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from .constants import *
+from .map_generator import GameMap, Rect
+
+class Chunk:
+    __slots__ = ('tiles', 'explored', 'visible', 'room')
+
+    def __init__(self, tiles, explored, room):
+        self.tiles = tiles
+        self.explored = explored
+        self.visible = np.zeros_like(tiles)
+        self.room = room
+
+def generate_chunk(seed, cx, cy, size=MAP_CHUNK_SIZE):
+    # One room per chunk, joined by corridors to doorways at the middle of
+    # every edge so neighbouring chunks always connect. The result depends
+    # only on (seed, cx, cy), which lets evicted chunks be regenerated.
+    rng = random.Random(f"{seed}:{cx}:{cy}")
+    tiles = np.ones((size, size), dtype=bool)
+
+    max_size = min(ROOM_MAX_SIZE, size - 3)
+    width = rng.randint(min(ROOM_MIN_SIZE, max_size), max_size)
+    height = rng.randint(min(ROOM_MIN_SIZE, max_size), max_size)
+    x = rng.randint(0, size - width - 1)
+    y = rng.randint(0, size - height - 1)
+    room = Rect(x, y, width, height)
+    tiles[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = False
+
+    center_x, center_y = room.center
+    door = size // 2
+    tiles[:center_x + 1, door] = False           # west doorway
+    tiles[center_x:, door] = False               # east doorway
+    tiles[center_x, min(center_y, door):max(center_y, door) + 1] = False
+    tiles[door, :center_y + 1] = False           # north doorway
+    tiles[door, center_y:] = False               # south doorway
+    tiles[min(center_x, door):max(center_x, door) + 1, center_y] = False
+
+    world_room = Rect(cx * size + x, cy * size + y, width, height)
+    return tiles, world_room
+
+class ChunkedGameMap(GameMap):
+    # GameMap backed by fixed-size chunks that are generated on demand
+    # around the player and evicted least-recently-used beyond
+    # CHUNKED_MAP_MAX_CHUNKS. Explored state of evicted chunks is spilled
+    # to a small on-disk database. Unloaded chunks read as solid wall.
+    def __init__(self, seed, size_in_chunks=CHUNKED_MAP_SIZE,
+                 chunk_size=MAP_CHUNK_SIZE, max_chunks=CHUNKED_MAP_MAX_CHUNKS,
+                 spill_dir=None):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.size_in_chunks = size_in_chunks
+        self.width = self.height = size_in_chunks * chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()  # (cx, cy) -> Chunk, in LRU order
+        self.stream_center = None
+
+        self.owns_spill_dir = spill_dir is None
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix='roguelike-chunks-')
+        self.spill = dbm.open(os.path.join(self.spill_dir, 'explored'), 'c')
+
+        # The player starts in the middle chunk
+        self.spawn_chunk = (size_in_chunks // 2, size_in_chunks // 2)
+        self._init_view()
+        self.stream(self.spawn_chunk[0] * chunk_size, self.spawn_chunk[1] * chunk_size)
+
+    @property
+    def rooms(self):
+        # Rooms of loaded chunks, with the spawn room first when loaded
+        rooms = [chunk.room for key, chunk in self.chunks.items()
+                 if key != self.spawn_chunk]
+        spawn = self.chunks.get(self.spawn_chunk)
+        if spawn is not None:
+            rooms.insert(0, spawn.room)
+        return rooms
+
+    def close(self):
+        # Safe to call more than once
+        if self.spill is None:
+            return
+        self.spill.close()
+        self.spill = None
+        if self.owns_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _load(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        tiles, room = generate_chunk(self.seed, *key, self.chunk_size)
+        explored = np.zeros_like(tiles)
+        spilled = self.spill.get(f"{key[0]},{key[1]}")
+        if spilled is not None:
+            bits = np.unpackbits(np.frombuffer(spilled, dtype=np.uint8),
+                                 count=tiles.size)
+            explored[...] = bits.reshape(tiles.shape)
+        chunk = self.chunks[key] = Chunk(tiles, explored, room)
+        return chunk
+
+    def _evict(self, keep):
+        for key in list(self.chunks):
+            if len(self.chunks) <= self.max_chunks:
+                break
+            if key in keep:
+                continue
+            chunk = self.chunks.pop(key)
+            if chunk.explored.any():
+                self.spill[f"{key[0]},{key[1]}"] = np.packbits(chunk.explored).tobytes()
+
+    def explored_chunks(self):
+        # (keys, packed explored bits) for every chunk with anything
+        # explored, loaded or spilled; keys is an (n, 2) array of (cx, cy)
+        entries = {}
+        for key in self.spill.keys():
+            cx, cy = key.decode().split(',')
+            entries[(int(cx), int(cy))] = np.frombuffer(self.spill[key], dtype=np.uint8)
+        for key, chunk in self.chunks.items():
+            if chunk.explored.any():
+                entries[key] = np.packbits(chunk.explored)
+        keys = np.array(list(entries), dtype=np.int64).reshape(-1, 2)
+        packed = np.array(list(entries.values()), dtype=np.uint8).reshape(
+            len(keys), -(-self.chunk_size ** 2 // 8))
+        return keys, packed
+
+    def restore_explored(self, keys, packed):
+        # Inverse of explored_chunks(); loaded chunks are updated in place
+        for (cx, cy), bits in zip(keys.tolist(), packed):
+            key = (cx, cy)
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                chunk.explored[...] = np.unpackbits(bits, count=chunk.explored.size).reshape(
+                    chunk.explored.shape)
+            else:
+                self.spill[f"{cx},{cy}"] = bits.tobytes()
+
+    def stream(self, tile_x, tile_y):
+        # Load chunks around a tile and evict far ones; cheap unless the
+        # tile moved into another chunk. Returns True if chunks changed.
+        center = (tile_x // self.chunk_size, tile_y // self.chunk_size)
+        if center == self.stream_center:
+            return False
+        self.stream_center = center
+        radius = CHUNKED_MAP_LOAD_RADIUS
+        keep = set()
+        for cx in range(max(0, center[0] - radius),
+                        min(self.size_in_chunks, center[0] + radius + 1)):
+            for cy in range(max(0, center[1] - radius),
+                            min(self.size_in_chunks, center[1] + radius + 1)):
+                keep.add((cx, cy))
+                self._load((cx, cy))
+        self._evict(keep)
+        return True
+
+    def loaded_at(self, xs, ys):
+        loaded = np.zeros(xs.shape, dtype=bool)
+        for chunk, positions, lx, ly in self._groups(xs, ys):
+            loaded[positions] = chunk is not None
+        return loaded
+
+    def is_wall(self, x, y):
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        if chunk is None:
+            return True
+        return chunk.tiles.item(x % size, y % size)
+
+    def _groups(self, xs, ys):
+        # Yield (chunk or None, positions, local xs, local ys) per chunk touched
+        if not len(xs):
+            return
+        size = self.chunk_size
+        cx = xs // size
+        cy = ys // size
+        keys = cx.astype(np.int64) * self.size_in_chunks + cy
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            positions = order[start:end]
+            first = positions[0]
+            chunk = self.chunks.get((int(cx[first]), int(cy[first])))
+            yield chunk, positions, xs[positions] % size, ys[positions] % size
+
+    def walls_at(self, xs, ys):
+        walls = np.ones(xs.shape, dtype=bool)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        inside_at = np.flatnonzero(inside)
+        for chunk, positions, lx, ly in self._groups(xs[inside], ys[inside]):
+            if chunk is not None:
+                walls[inside_at[positions]] = chunk.tiles[lx, ly]
+        return walls
+
+    def tile_states(self, xs, ys):
+        tiles = np.ones(xs.shape, dtype=bool)
+        explored = np.zeros(xs.shape, dtype=bool)
+        visible = np.zeros(xs.shape, dtype=bool)
+        for chunk, positions, lx, ly in self._groups(xs, ys):
+            if chunk is not None:
+                tiles[positions] = chunk.tiles[lx, ly]
+                explored[positions] = chunk.explored[lx, ly]
+                visible[positions] = chunk.visible[lx, ly]
+        return tiles, explored, visible
+
+    def set_visible(self, xs, ys, visible):
+        for chunk, positions, lx, ly in self._groups(xs, ys):
+            if chunk is not None:
+                chunk.visible[lx, ly] = visible
+                if visible:
+                    chunk.explored[lx, ly] = True
+
+    def region(self, x0, y0, x1, y1):
+        # Copies assembled from the chunks overlapping the clipped area
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = max(x0, min(self.width, x1)), max(y0, min(self.height, y1))
+        shape = (x1 - x0, y1 - y0)
+        tiles = np.ones(shape, dtype=bool)
+        explored = np.zeros(shape, dtype=bool)
+        visible = np.zeros(shape, dtype=bool)
+        size = self.chunk_size
+        for cx in range(x0 // size, -(-x1 // size)):
+            for cy in range(y0 // size, -(-y1 // size)):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                # Overlap of this chunk with the area, in world coordinates
+                ax0, ax1 = max(x0, cx * size), min(x1, (cx + 1) * size)
+                ay0, ay1 = max(y0, cy * size), min(y1, (cy + 1) * size)
+                src = (slice(ax0 - cx * size, ax1 - cx * size),
+                       slice(ay0 - cy * size, ay1 - cy * size))
+                dst = (slice(ax0 - x0, ax1 - x0), slice(ay0 - y0, ay1 - y0))
+                tiles[dst] = chunk.tiles[src]
+                explored[dst] = chunk.explored[src]
+                visible[dst] = chunk.visible[src]
+        return tiles, explored, visible
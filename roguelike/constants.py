@@ -12,19 +12,39 @@ BLUE = (0, 0, 255)
 TILE_SIZE = 32
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
-FPS = 60
+FPS = 60  # simulation ticks per second
+RENDER_FPS = 120  # frame cap; frames between ticks are interpolated
 
 # Player settings
 PLAYER_SPEED = 5
 PLAYER_HP = 100
 ATTACK_RANGE = 50  # pixels
+PLAYER_ATTACK_DAMAGE = 10
 
 # Map settings
 MAP_WIDTH = 50
 MAP_HEIGHT = 50
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
-MAX_ROOMS = 30
+ROOM_AREA = 250  # map tiles per room; larger maps get proportionally more rooms
+ROOM_ATTEMPTS = 3  # placements tried per room before a crowded map settles for fewer
+MAP_ALGORITHM = 'rooms'  # rooms, caves, bsp or drunkard; see generators.py
+REGION_ROOM_SPACING = 16  # tiles between room markers on caves and walks
+CAVE_WALL_CHANCE = 0.45  # initial noise density
+CAVE_SMOOTHING_STEPS = 5
+CAVE_ATTEMPTS = 8  # fresh noise tried before a map too small for open cave gives up
+BSP_MIN_LEAF = ROOM_MIN_SIZE + 2  # tiles per side of the smallest partition
+BSP_MAX_LEAF = 2 * ROOM_MAX_SIZE  # larger partitions are always split
+BSP_SPLIT_CHANCE = 0.5  # chance of splitting a partition between the two
+DRUNKARD_FLOOR_RATIO = 0.4  # share of the map to dig out
+DRUNKARD_WALKERS = 4  # fewest walkers per batch
+DRUNKARD_STEPS = 200  # steps per walker
+MAP_CHUNK_SIZE = 16  # tiles per side of a map chunk
+CHUNKED_MAP_SIZE = 4096  # chunks per side of an endless map
+CHUNKED_MAP_MAX_CHUNKS = 256  # chunks kept in memory before eviction
+CHUNKED_MAP_LOAD_RADIUS = 3  # chunks loaded around the player
+MAP_CACHE_ENABLED = True  # reuse generated maps from the on-disk cache
+MAP_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
 # Health bar settings
 HEALTH_BAR_WIDTH = 30
@@ -39,6 +59,14 @@ ATTACK_EFFECT_COLOR = (255, 255, 0)  # Yellow
 MONSTER_ATTACK_RANGE = 40  # pixels
 MONSTER_ATTACK_DAMAGE = 5
 MONSTER_ATTACK_COOLDOWN = 1000  # milliseconds
+MONSTER_SEPARATION_RADIUS = 24  # pixels between monster centers
+
+# Monster AI level of detail
+AI_NEAR_RADIUS = 12  # tiles; monsters this close (or in view) think every tick
+AI_MID_RADIUS = 32  # tiles
+AI_MID_INTERVAL = 4  # ticks between updates of mid-range monsters
+AI_FAR_INTERVAL = 16  # ticks between updates of far monsters
+AI_MAX_STEP = TILE_SIZE // 2  # pixels; scaled-up steps never skip a whole tile
 
 # Monster types
 MONSTER_TYPES = {
@@ -65,14 +93,135 @@ MONSTER_TYPES = {
     }
 }
 
+# Projectile types; speed is pixels per tick, blast_radius pixels (0 = hits
+# one monster), lifetime and cooldown milliseconds
+PROJECTILE_TYPES = {
+    'bolt': {
+        'color': (255, 255, 255),
+        'speed': 12,
+        'damage': 10,
+        'blast_radius': 0,
+        'lifetime': 1000,
+        'cooldown': 200
+    },
+    'bomb': {
+        'color': (255, 140, 0),
+        'speed': 7,
+        'damage': 20,
+        'blast_radius': 2 * TILE_SIZE,
+        'lifetime': 700,
+        'cooldown': 800
+    }
+}
+PROJECTILE_SIZE = 6  # pixels per side when drawn
+PROJECTILE_HIT_RADIUS = TILE_SIZE // 2  # pixels from a monster's center that count as a hit
+PROJECTILE_GRID_CELL = 2 * TILE_SIZE  # pixels per side of a broadphase cell
+PROJECTILE_STORE_CAPACITY = 256  # initial slots in the projectile arrays, grows as needed
+BLAST_EFFECT_DURATION = 250  # milliseconds
+
+# Particle settings. Bursts of particles are drawn for monster effects;
+# speeds are pixels per millisecond, lifetimes milliseconds and a color
+# of None means the monster's own color.
+PARTICLE_EFFECTS = {
+    'hit': {'count': 6, 'speed': (0.05, 0.15), 'lifetime': (120, 250), 'color': (255, 60, 60)},
+    'death': {'count': 24, 'speed': (0.03, 0.25), 'lifetime': (300, 700), 'color': None},
+    'spawn': {'count': 10, 'speed': (0.01, 0.06), 'lifetime': (250, 450), 'color': (170, 170, 255)},
+}
+PARTICLE_CAPACITY = 32768  # fixed pool; bursts that don't fit are dropped
+PARTICLE_EMIT_BUDGET = 4096  # most new particles per drawn frame
+PARTICLE_DRAW_BUDGET = 20000  # most particles blitted per frame, the rest are thinned out
+PARTICLE_DRAW_MS = 3.0  # frame time for particles; fewer are drawn when blitting is slower
+PARTICLE_SIZE = 3
+PARTICLE_FADE_STEPS = 4  # pre-rendered brightness levels per color
+PARTICLE_DRAG = 0.997  # velocity kept per millisecond
+PARTICLE_MAX_STEP = 100  # milliseconds; longer gaps between frames advance this much
+EFFECT_LOG_CAPACITY = 4096  # effects a monster store keeps between frames
+
 # Spawn settings
 MONSTERS_PER_ROOM = (0, 3)  # (min, max) monsters per room
 SPAWN_DISTANCE_FROM_PLAYER = 200  # Minimum pixels from player for initial spawn
 MONSTER_SPAWN_INTERVAL = 5000  # Milliseconds between spawn attempts
 MAX_MONSTERS = 30  # Maximum number of monsters allowed at once
+SPAWN_ATTEMPTS = 8  # candidate tiles tried before a single spawn gives up
+MONSTER_STORE_CAPACITY = 64  # initial slots in the monster arrays, grows as needed
+
+# Pathfinding settings
+FLOW_FIELD_RADIUS = 40  # tiles around the player covered by the flow field
+FLOW_FIELD_STEPS_PER_FRAME = 0  # BFS wavefront steps per frame, 0 = unlimited
 
 # Field of View settings
 FOV_RADIUS = 8  # tiles
 FOV_LIGHT_WALLS = True
+FOV_CACHE_SIZE = 64  # recently visited origins kept per map
 VISIBLE_COLOR = (200, 200, 200)  # Light gray for visible walls
 UNSEEN_COLOR = (30, 30, 30)    # Dark gray for unseen areas
+
+# Lighting settings
+LIGHTING_ENABLED = True
+LIGHT_LEVELS = 8  # quantization steps per colour channel
+LIGHT_AMBIENT = 0.5  # fraction of VISIBLE_COLOR an unlit visible wall keeps
+LIT_FLOOR_COLOR = (120, 110, 90)  # floor colour under full white light
+ROOM_LIGHT_RADIUS = 6  # tiles
+ROOM_LIGHT_INTENSITY = 0.8
+ROOM_LIGHT_COLORS = [(255, 180, 100), (140, 180, 255), (160, 255, 150), (255, 140, 200)]
+PLAYER_LIGHT_RADIUS = 5  # tiles
+PLAYER_LIGHT_COLOR = (255, 220, 170)
+PLAYER_LIGHT_INTENSITY = 0.6
+ATTACK_LIGHT_RADIUS = 3  # tiles, while the attack effect shows
+LIGHT_FOV_CACHE_SIZE = 64  # light origins whose line of sight is kept, apart from the player's
+
+# Minimap settings (toggle with M)
+MINIMAP_ENABLED = True
+MINIMAP_SIZE = 160  # pixels per side, at most
+MINIMAP_MAX_TILES = 512  # larger maps show a window of this many tiles
+MINIMAP_MARGIN = 8  # pixels from the window corner
+MINIMAP_FLOOR_COLOR = (45, 45, 45)
+MINIMAP_WALL_COLOR = (110, 110, 110)
+MINIMAP_VISIBLE_FLOOR_COLOR = (70, 70, 110)
+
+# Map rendering settings
+MAP_RENDER_CACHE_CHUNKS = 32  # pre-rendered chunk surfaces kept in memory
+
+# Batch generation settings
+BATCH_CHUNK_SIZE = 64  # seeds per worker task
+BATCH_FLUSH_INTERVAL = 256  # maps written between flushes
+
+# Profiler overlay settings (toggle with F3)
+PROFILER_HISTORY = 240  # frames kept in the ring buffer
+PROFILER_MAX_PHASES = 32
+PROFILER_OVERLAY_REFRESH = 15  # frames between overlay text refreshes
+PROFILER_GRAPH_HEIGHT = 60  # pixels
+PROFILER_BAR_COLOR = (255, 200, 0)
+PROFILER_GRAPH_COLOR = (0, 255, 0)
+
+# Frame pipeline settings
+SIM_MAX_CATCHUP_TICKS = 5  # ticks run back to back after a stall before giving up on the backlog
+FRAME_SNAP_DISTANCE = 2 * TILE_SIZE  # pixels; longer moves between ticks aren't interpolated
+
+# Floor settings
+FLOOR_CACHE_SIZE = 2  # visited floors kept live; older ones are compressed
+STAIRS_DOWN_COLOR = (255, 215, 0)
+STAIRS_UP_COLOR = (0, 191, 255)
+
+# Save settings
+AUTOSAVE_INTERVAL = 60000  # simulated milliseconds between autosaves; 0 disables
+
+# Replay settings
+REPLAY_CHECKSUM_INTERVAL = 60  # ticks between state checksums
+
+# Multiplayer server settings
+SERVER_TICK_RATE = 30  # ticks per second
+SERVER_ACTIVE_RADIUS = 16  # tiles around a player in which monsters are simulated
+SERVER_FOV_CACHE_SIZE = 256  # FOV results shared between clients
+SERVER_MAX_BUFFER = 1024 * 1024  # bytes queued for a client before it is dropped
+
+# Headless environment settings
+ENV_VIEW_RADIUS = 7  # tiles around the player in observations
+ENV_FRAME_SKIP = 4  # ticks each action is held for
+ENV_MAX_STEPS = 2000  # steps before an episode is truncated
+ENV_KILL_REWARD = 1.0
+ENV_DAMAGE_PENALTY = 0.01  # per hit point lost
+ENV_DESCEND_REWARD = 5.0  # per floor deeper than any reached before
+ENV_DEATH_PENALTY = 10.0
+ENV_FLOW_FIELD_RADIUS = 16  # tiles; monsters beyond it head straight for the player
+ENV_FLOW_FIELD_STEPS = 8  # BFS wavefront steps per tick; a moving player's field lags a little
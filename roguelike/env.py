@@ -0,0 +1,325 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import multiprocessing
+import random
+import time
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pygame
+from .constants import *
+from .game import Game
+from .generators import GENERATORS, make_generator
+from .input_state import InputState, RIGHT, LEFT, DOWN, UP, ATTACK, STAIRS, FIRE, THROW
+
+# Discrete actions as InputState buttons: idle, eight moves, attack, stairs,
+# shoot a bolt, throw a bomb
+ACTIONS = [0, RIGHT, LEFT, DOWN, UP, RIGHT | DOWN, RIGHT | UP, LEFT | DOWN, LEFT | UP,
+           ATTACK, STAIRS, FIRE, THROW]
+
+VIEW_SIZE = 2 * ENV_VIEW_RADIUS + 1
+# Observation arrays: 'view' is an egocentric window with channels for
+# explored walls, visible tiles, monster health and stairs (255 down,
+# 128 up); 'stats' is player health fraction, depth and episode progress
+OBSERVATION_FIELDS = {
+    'view': ((4, VIEW_SIZE, VIEW_SIZE), np.uint8),
+    'stats': ((3,), np.float32),
+}
+
+class RoguelikeEnv:
+    # Gym-style wrapper around a headless Game stepped on its simulated
+    # clock: reset() -> (observation, info), step(action) -> (observation,
+    # reward, terminated, truncated, info). Each action is held for
+    # frame_skip ticks; attack and stairs act on the first of them. Games
+    # are headless, with flow field rebuilds capped per tick, unless
+    # render() is wanted, and field of view is updated once per step.
+    def __init__(self, seed=None, horde=0, map_algorithm=MAP_ALGORITHM,
+                 frame_skip=ENV_FRAME_SKIP, max_steps=ENV_MAX_STEPS, render=False,
+                 **map_options):
+        self.rng = random.Random(seed)
+        self.horde = horde
+        self.map_algorithm = map_algorithm
+        self.map_options = map_options
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.rendering = render
+        self.game = None
+        self.steps = 0
+
+    def reset(self, seed=None):
+        info = self._start(seed)
+        return self.observation(), info
+
+    def _start(self, seed=None):
+        # reset() without the observation. Every episode gets a fresh map,
+        # built here rather than through the map cache, which would fill up
+        # with one-off maps.
+        if seed is None:
+            seed = self.rng.getrandbits(31)
+        if self.game is not None:
+            self.close()
+        game_map = make_generator(self.map_algorithm, seed=seed, **self.map_options).generate()
+        self.game = Game(horde=self.horde, seed=seed, game_map=game_map,
+                         map_algorithm=self.map_algorithm, prefetch_floors=False,
+                         headless=not self.rendering, flow_field_radius=ENV_FLOW_FIELD_RADIUS,
+                         flow_field_steps=ENV_FLOW_FIELD_STEPS)
+        self.steps = 0
+        self.deepest = 0
+        return {'seed': seed}
+
+    def step(self, action):
+        reward, terminated, truncated, info = self._advance(action)
+        return self.observation(), reward, terminated, truncated, info
+
+    def _advance(self, action):
+        # step() without the observation. Field of view is only worked out
+        # after the last tick, the one the observation sees.
+        game = self.game
+        player = game.player
+        hp, kills = player.hp, game.kills
+        buttons = ACTIONS[action]
+        for tick in range(self.frame_skip):
+            game.input = InputState(buttons if tick == 0 else buttons & ~(ATTACK | STAIRS))
+            game.update(fov=False)
+            if not game.running:
+                break
+        game.update_fov()
+        self.steps += 1
+
+        terminated = player.hp <= 0
+        truncated = not terminated and self.steps >= self.max_steps
+        reward = (ENV_KILL_REWARD * (game.kills - kills) -
+                  ENV_DAMAGE_PENALTY * max(0, hp - player.hp))
+        if game.depth > self.deepest:
+            reward += ENV_DESCEND_REWARD * (game.depth - self.deepest)
+            self.deepest = game.depth
+        if terminated:
+            reward -= ENV_DEATH_PENALTY
+        info = {'kills': game.kills, 'depth': game.depth, 'ticks': game.ticks}
+        return reward, terminated, truncated, info
+
+    def observation(self, out=None):
+        # Fills and returns `out` (a dict of OBSERVATION_FIELDS arrays) or
+        # new arrays
+        if out is None:
+            out = {name: np.zeros(shape, dtype) for name, (shape, dtype) in
+                   OBSERVATION_FIELDS.items()}
+        game = self.game
+        game_map = game.game_map
+        player = game.player
+        radius = ENV_VIEW_RADIUS
+        x0 = player.rect.centerx // TILE_SIZE - radius
+        y0 = player.rect.centery // TILE_SIZE - radius
+        view = out['view']
+        view[...] = 0
+
+        # Map layers, clipped to the map like wall_window
+        tiles, explored, visible = game_map.region(x0, y0, x0 + VIEW_SIZE, y0 + VIEW_SIZE)
+        ox, oy = max(0, -x0), max(0, -y0)
+        area = (slice(ox, ox + tiles.shape[0]), slice(oy, oy + tiles.shape[1]))
+        view[0][area] = (tiles & explored) * 255
+        view[1][area] = visible * 255
+
+        # Monsters on visible tiles, brighter when healthier
+        store = game.monsters
+        indices = store.alive_indices()
+        local_x = (store.x[indices] // TILE_SIZE).astype(np.intp) - x0
+        local_y = (store.y[indices] // TILE_SIZE).astype(np.intp) - y0
+        near = (local_x >= 0) & (local_x < VIEW_SIZE) & (local_y >= 0) & (local_y < VIEW_SIZE)
+        local_x, local_y, indices = local_x[near], local_y[near], indices[near]
+        seen = view[1, local_x, local_y] > 0
+        health = store.hp[indices[seen]] * 255 // np.maximum(store.max_hp[indices[seen]], 1)
+        np.maximum.at(view[2], (local_x[seen], local_y[seen]),
+                      np.clip(health, 1, 255).astype(np.uint8))
+
+        for stairs, value in ((game.floor.stairs_down, 255), (game.floor.stairs_up, 128)):
+            if stairs is not None:
+                sx, sy = stairs[0] - x0, stairs[1] - y0
+                if 0 <= sx < VIEW_SIZE and 0 <= sy < VIEW_SIZE and game_map.explored[stairs]:
+                    view[3, sx, sy] = value
+
+        out['stats'][:] = (max(0, player.hp) / PLAYER_HP, game.depth,
+                           self.steps / self.max_steps)
+        return out
+
+    def render(self):
+        # Draws the current frame and returns it as an (x, y, rgb) array
+        if not self.rendering:
+            raise RuntimeError("create the environment with render=True to render")
+        self.game.draw()
+        return pygame.surfarray.array3d(self.game.screen)
+
+    def close(self):
+        if self.game is not None and self.game.floors is not None:
+            self.game.floors.close()
+        self.game = None
+
+def _layout(num_envs):
+    # (offset, shape, dtype) of every shared array, 64-byte aligned
+    fields = {name: ((num_envs,) + shape, dtype) for name, (shape, dtype) in
+              OBSERVATION_FIELDS.items()}
+    fields.update({
+        'action': ((num_envs,), np.int64),
+        'reward': ((num_envs,), np.float32),
+        'terminated': ((num_envs,), bool),
+        'truncated': ((num_envs,), bool),
+    })
+    layout = {}
+    offset = 0
+    for name, (shape, dtype) in fields.items():
+        layout[name] = (offset, shape, dtype)
+        offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64
+    return layout, offset
+
+def _attach(buffer, layout):
+    return {name: np.ndarray(shape, dtype, buffer=buffer, offset=offset)
+            for name, (offset, shape, dtype) in layout.items()}
+
+def _run_envs(envs, slots, arrays, command):
+    # Applies one command to a worker's environments, writing results into
+    # their rows of the shared arrays. Finished episodes reset straight
+    # away; their final observation is not kept.
+    for slot, env in zip(slots, envs):
+        row = {name: arrays[name][slot] for name in OBSERVATION_FIELDS}
+        if command == 'reset':
+            env._start()
+        else:
+            reward, terminated, truncated, _ = env._advance(int(arrays['action'][slot]))
+            arrays['reward'][slot] = reward
+            arrays['terminated'][slot] = terminated
+            arrays['truncated'][slot] = truncated
+            if terminated or truncated:
+                env._start()
+        env.observation(row)
+
+def _worker(connection, memory_name, layout, slots, seeds, env_options):
+    memory = SharedMemory(name=memory_name)
+    arrays = _attach(memory.buf, layout)
+    envs = [RoguelikeEnv(seed=seed, **env_options) for seed in seeds]
+    try:
+        while True:
+            command = connection.recv()
+            if command == 'close':
+                break
+            try:
+                _run_envs(envs, slots, arrays, command)
+                connection.send(None)
+            except Exception as error:
+                connection.send(error)
+    finally:
+        for env in envs:
+            env.close()
+        del arrays
+        memory.close()
+        connection.close()
+
+class VectorEnv:
+    # Many RoguelikeEnvs split across worker processes. Actions and
+    # results pass through one shared memory block, so a step costs one
+    # small message per worker however many environments it holds.
+    # Episodes reset automatically when they end. With workers=0 every
+    # environment runs in this process.
+    def __init__(self, num_envs, seed=0, workers=None, copy=True, **env_options):
+        self.num_envs = num_envs
+        self.copy = copy
+        layout, size = _layout(num_envs)
+        self.memory = SharedMemory(create=True, size=size)
+        self.arrays = _attach(self.memory.buf, layout)
+        seeds = [random.Random(f"{seed}:env:{i}").getrandbits(31) for i in range(num_envs)]
+
+        workers = min(num_envs, os.cpu_count() if workers is None else workers)
+        self.local_envs = None
+        self.connections = []
+        self.processes = []
+        if not workers:
+            self.local_envs = [RoguelikeEnv(seed=s, **env_options) for s in seeds]
+            return
+        for slots in np.array_split(np.arange(num_envs), workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, daemon=True,
+                args=(child, self.memory.name, layout, slots.tolist(),
+                      [seeds[i] for i in slots.tolist()], env_options))
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def _command(self, command):
+        if self.local_envs is not None:
+            _run_envs(self.local_envs, range(self.num_envs), self.arrays, command)
+            return
+        for connection in self.connections:
+            connection.send(command)
+        errors = [connection.recv() for connection in self.connections]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _observations(self):
+        arrays = self.arrays
+        return {name: arrays[name].copy() if self.copy else arrays[name]
+                for name in OBSERVATION_FIELDS}
+
+    def reset(self):
+        self._command('reset')
+        return self._observations()
+
+    def step(self, actions):
+        # Returns (observations, rewards, terminated, truncated), one row
+        # per environment; without copy the arrays are reused next step
+        self.arrays['action'][:] = actions
+        self._command('step')
+        arrays = self.arrays
+        results = (arrays['reward'], arrays['terminated'], arrays['truncated'])
+        if self.copy:
+            results = tuple(array.copy() for array in results)
+        return (self._observations(),) + results
+
+    def close(self):
+        for connection in self.connections:
+            connection.send('close')
+        for process in self.processes:
+            process.join()
+        if self.local_envs is not None:
+            for env in self.local_envs:
+                env.close()
+        self.connections = []
+        self.processes = []
+        self.arrays = None
+        self.memory.close()
+        self.memory.unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure headless environment throughput with random actions")
+    parser.add_argument('--envs', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: CPU count; 0 runs in-process)")
+    parser.add_argument('--steps', type=int, default=500, help="vector steps to time")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--generator', choices=GENERATORS, default=MAP_ALGORITHM)
+    parser.add_argument('--frame-skip', type=int, default=ENV_FRAME_SKIP)
+    args = parser.parse_args()
+
+    envs = VectorEnv(args.envs, seed=args.seed, workers=args.workers, copy=False,
+                     map_algorithm=args.generator, frame_skip=args.frame_skip)
+    rng = np.random.default_rng(args.seed)
+    try:
+        envs.reset()
+        start = time.perf_counter()
+        episodes = 0
+        for _ in range(args.steps):
+            _, _, terminated, truncated = envs.step(rng.integers(len(ACTIONS), size=args.envs))
+            episodes += int(terminated.sum() + truncated.sum())
+        elapsed = time.perf_counter() - start
+    finally:
+        envs.close()
+    steps = args.steps * args.envs
+    print(f"{steps} steps in {elapsed:.2f}s: {steps / elapsed:.0f} steps/s, "
+          f"{steps * args.frame_skip / elapsed:.0f} ticks/s, {episodes} episodes ended")
+
+if __name__ == "__main__":
+    main()
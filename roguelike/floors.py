@@ -0,0 +1,176 @@
+import io
+import json
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from .constants import *
+from .map_generator import GameMap, Rect
+from .generators import make_generator
+from .monster_store import MonsterStore
+from .spawner import Spawner
+from .pathfinding import FlowField
+from .minimap import Minimap
+from .lighting import LightMap, room_lights
+
+def floor_seed(seed, depth):
+    # Floor 0 uses the run seed itself so it matches single-floor runs
+    if depth == 0:
+        return seed
+    return zlib.crc32(f"{seed}:floor:{depth}".encode())
+
+def generate_floor(seed, algorithm=MAP_ALGORITHM):
+    # Runs in a worker process; returns picklable (width, height, packed tiles, rooms)
+    game_map = make_generator(algorithm, seed=seed).generate()
+    rooms = np.array([(room.x1, room.y1, room.x2, room.y2) for room in game_map.rooms],
+                     dtype=np.int32).reshape(-1, 4)
+    return game_map.width, game_map.height, np.packbits(game_map.tiles), rooms
+
+def _build_map(width, height, packed, rooms):
+    tiles = np.unpackbits(packed, count=width * height).reshape(width, height).view(bool)
+    rooms = [Rect(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in rooms.tolist()]
+    return GameMap(width, height, tiles=tiles, rooms=rooms)
+
+class Floor:
+    # One dungeon level and everything that lives on it. Stairs down are in
+    # the last room, stairs up (below the top floor) in the first. Lit
+    # floors get a light in every room. Floors that are never drawn skip
+    # the minimap and light map.
+    def __init__(self, depth, game_map, monsters, spawner, stairs=True, lit=True, drawn=True):
+        self.depth = depth
+        self.game_map = game_map
+        self.monsters = monsters
+        self.spawner = spawner
+        self.flow_field = FlowField(game_map)
+        self.minimap = Minimap(game_map) if drawn else None
+        rooms = game_map.rooms
+        self.light_map = (LightMap(game_map, room_lights(rooms))
+                          if drawn and lit and LIGHTING_ENABLED else None)
+        self.stairs_down = rooms[-1].center if stairs and len(rooms) > 1 else None
+        self.stairs_up = rooms[0].center if stairs and depth > 0 else None
+
+    def snapshot(self):
+        # Arrays holding the map, exploration and monsters; see compress()
+        game_map = self.game_map
+        header = {'depth': self.depth, 'width': game_map.width, 'height': game_map.height,
+                  'spawner_rng': self.spawner.rng.bit_generator.state}
+        arrays = {
+            'header': np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+            'tiles': np.packbits(game_map.tiles),
+            'explored': np.packbits(game_map.explored),
+            'rooms': np.array([(room.x1, room.y1, room.x2, room.y2) for room in game_map.rooms],
+                              dtype=np.int32).reshape(-1, 4),
+        }
+        for name, array in self.monsters.state().items():
+            arrays['monster_' + name] = array
+        return arrays
+
+    @staticmethod
+    def compress(arrays):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_compact(cls, data, drawn=True):
+        with np.load(io.BytesIO(data)) as archive:
+            return cls.from_arrays({name: archive[name] for name in archive.files}, drawn)
+
+    @classmethod
+    def from_arrays(cls, arrays, drawn=True):
+        # Inverse of snapshot()
+        header = json.loads(arrays['header'].tobytes())
+        width, height = header['width'], header['height']
+        game_map = _build_map(width, height, arrays['tiles'], arrays['rooms'])
+        game_map.explored[...] = np.unpackbits(
+            arrays['explored'], count=width * height).reshape(width, height)
+        monsters = MonsterStore()
+        monsters.restore({name[len('monster_'):]: array for name, array in arrays.items()
+                          if name.startswith('monster_')})
+        spawner = Spawner(game_map, monsters, 0)
+        spawner.rng.bit_generator.state = header['spawner_rng']
+        return cls(header['depth'], game_map, monsters, spawner, drawn=drawn)
+
+class FloorManager:
+    # Keeps visited floors and generates the next one ahead of time. The
+    # FLOOR_CACHE_SIZE most recently left floors stay live; older ones are
+    # kept as compressed bytes, compressed on a background thread.
+    # Unvisited floors are generated in a worker process as soon as the
+    # floor above is entered, unless prefetch is off; then take() builds
+    # them on the spot. Floors restored here are drawn unless `drawn` is off.
+    def __init__(self, seed, algorithm=MAP_ALGORITHM, prefetch=True, drawn=True):
+        self.seed = seed
+        self.algorithm = algorithm
+        self.prefetch_enabled = prefetch
+        self.drawn = drawn
+        self.live = OrderedDict()  # depth -> Floor, in LRU order
+        self.compacted = {}        # depth -> Future of compressed bytes
+        self.pending = {}          # depth -> Future of generate_floor()
+        self.executor = None
+        self.compressor = ThreadPoolExecutor(max_workers=1)
+
+    def prefetch(self, depth):
+        if not self.prefetch_enabled:
+            return
+        if depth in self.live or depth in self.compacted or depth in self.pending:
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        self.pending[depth] = self.executor.submit(generate_floor, floor_seed(self.seed, depth),
+                                                   self.algorithm)
+
+    def leave(self, floor):
+        # Park the floor being left, compacting the oldest beyond the limit
+        self.live[floor.depth] = floor
+        self.live.move_to_end(floor.depth)
+        while len(self.live) > FLOOR_CACHE_SIZE:
+            depth, old = self.live.popitem(last=False)
+            self.compacted[depth] = self.compressor.submit(Floor.compress, old.snapshot())
+
+    def take(self, depth):
+        # Returns (Floor, True) for a visited floor or (GameMap, False) for a
+        # new one, which the caller populates
+        floor = self.live.pop(depth, None)
+        if floor is not None:
+            return floor, True
+        data = self.compacted.pop(depth, None)
+        if data is not None:
+            return Floor.from_compact(data.result(), self.drawn), True
+        future = self.pending.pop(depth, None)
+        if future is not None:
+            result = future.result()  # only blocks if the worker is still busy
+        else:
+            result = generate_floor(floor_seed(self.seed, depth), self.algorithm)
+        return _build_map(*result), False
+
+    def snapshot(self):
+        # Every floor held here as arrays for a save, each under a
+        # 'floor<depth>_' prefix: live floors as their snapshot(), compacted
+        # ones as the compressed bytes. 'floors_live' keeps the LRU order.
+        arrays = {'floors_live': np.array(list(self.live), dtype=np.int64)}
+        for depth, floor in self.live.items():
+            for name, array in floor.snapshot().items():
+                arrays[f'floor{depth}_{name}'] = array
+        for depth, data in self.compacted.items():
+            arrays[f'floor{depth}_compact'] = np.frombuffer(data.result(), dtype=np.uint8)
+        return arrays
+
+    def restore(self, arrays):
+        # Put back the floors from snapshot() arrays
+        for depth in arrays['floors_live'].tolist():
+            prefix = f'floor{depth}_'
+            self.live[depth] = Floor.from_arrays({name[len(prefix):]: array
+                                                  for name, array in arrays.items()
+                                                  if name.startswith(prefix)},
+                                                 self.drawn)
+        for name, array in arrays.items():
+            if name.startswith('floor') and name.endswith('_compact'):
+                data = Future()
+                data.set_result(array.tobytes())
+                self.compacted[int(name[len('floor'):-len('_compact')])] = data
+
+    def close(self):
+        self.compressor.shutdown(wait=False)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
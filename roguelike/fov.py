@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from .constants import *
+
+# Octant transforms as (xx, xy, yx, yy): a tile at (depth, col) in the
+# scanned quadrant maps to (x + depth * xx + col * xy, y + depth * yx + col * yy)
+QUADRANTS = (
+    (0, 1, -1, 0),  # north
+    (1, 0, 0, 1),   # east
+    (0, 1, 1, 0),   # south
+    (-1, 0, 0, 1),  # west
+)
+
+def _round_ties_up(num, den):
+    # floor(num / den + 1/2) for den > 0
+    return (2 * num + den) // (2 * den)
+
+def _round_ties_down(num, den):
+    # ceil(num / den - 1/2) for den > 0
+    return -((den - 2 * num) // (2 * den))
+
+def shadowcast(origin_x, origin_y, radius, is_wall, light_walls=True):
+    # Symmetric shadowcasting: a floor tile is visible iff the origin is
+    # visible from it. Slopes are kept as integer (num, den) pairs so no
+    # floating point error creeps into the symmetry check.
+    visible = {(origin_x, origin_y)}
+    radius_sq = radius * radius + radius  # round the circle's edge outwards
+
+    for xx, xy, yx, yy in QUADRANTS:
+        # Rows to scan: (depth, start_num, start_den, end_num, end_den)
+        rows = [(1, -1, 1, 1, 1)]
+        while rows:
+            depth, start_num, start_den, end_num, end_den = rows.pop()
+            if depth > radius:
+                continue
+            min_col = _round_ties_up(depth * start_num, start_den)
+            max_col = _round_ties_down(depth * end_num, end_den)
+            prev_wall = None
+            for col in range(min_col, max_col + 1):
+                tx = origin_x + depth * xx + col * xy
+                ty = origin_y + depth * yx + col * yy
+                wall = is_wall(tx, ty)
+                in_radius = depth * depth + col * col <= radius_sq
+
+                if in_radius:
+                    if wall:
+                        if light_walls:
+                            visible.add((tx, ty))
+                    elif (col * start_den >= depth * start_num and
+                          col * end_den <= depth * end_num):
+                        visible.add((tx, ty))
+
+                if prev_wall and not wall:
+                    # Leaving a shadow: narrow the start slope
+                    start_num, start_den = 2 * col - 1, 2 * depth
+                if prev_wall is False and wall:
+                    # Entering a shadow: scan the lit span below it
+                    rows.append((depth + 1, start_num, start_den,
+                                 2 * col - 1, 2 * depth))
+                prev_wall = wall
+
+            if prev_wall is False:
+                rows.append((depth + 1, start_num, start_den, end_num, end_den))
+
+    return visible
+
+class FieldOfView:
+    def __init__(self, game_map, cache_size=FOV_CACHE_SIZE):
+        self.game_map = game_map
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def compute(self, x, y, radius):
+        # Visible tile set for an origin, served from a small LRU cache
+        key = (x, y, radius)
+        visible = self._cache.get(key)
+        if visible is not None:
+            self._cache.move_to_end(key)
+            return visible
+
+        in_bounds = self.game_map.in_bounds
+        visible = frozenset(tile for tile in shadowcast(
+            x, y, radius, self.game_map.is_wall, FOV_LIGHT_WALLS)
+            if in_bounds(*tile))
+        self._cache[key] = visible
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return visible
+
+    def invalidate(self):
+        # Call whenever walls change
+        self._cache.clear()
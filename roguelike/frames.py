@@ -0,0 +1,105 @@
+import time
+import numpy as np
+from .constants import *
+
+# Monsters in a frame, visible ones only, sorted by store slot
+FRAME_MONSTER = np.dtype([('id', '<i4'), ('x', '<f4'), ('y', '<f4'), ('hp', '<i4'),
+                          ('max_hp', '<i4'), ('type_id', 'i1')])
+# Projectiles on visible tiles, sorted by store slot
+FRAME_PROJECTILE = np.dtype([('id', '<i4'), ('x', '<f4'), ('y', '<f4'), ('kind', 'i1')])
+
+class Frame:
+    # Everything drawn for one simulation tick. Frames are immutable, arrays
+    # included, so a renderer can keep the last two while the simulation
+    # moves on, and unchanged parts are shared from one frame to the next.
+    # player is (x, y, hp, facing, attack effect time); visible is an
+    # (n, 2) array of the tiles seen from fov_origin; blasts are the
+    # projectile store's recent explosions and effects the monster effects
+    # since the last frame.
+    __slots__ = ('tick', 'time', 'depth', 'player', 'monsters', 'projectiles', 'blasts',
+                 'effects', 'fov_origin', 'visible', 'sim_ms')
+
+    def __init__(self, tick, time, depth, player, monsters, projectiles, blasts, effects,
+                 fov_origin, visible, sim_ms=0.0):
+        values = (tick, time, depth, tuple(player), monsters, projectiles, blasts, effects,
+                  fov_origin, visible, sim_ms)
+        for name, value in zip(self.__slots__, values):
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("frames are immutable")
+
+    def __reduce__(self):
+        return (Frame, tuple(getattr(self, name) for name in self.__slots__))
+
+def capture(game, previous=None, sim_ms=0.0):
+    # Frame of the game's current state; `previous` is the last frame
+    # captured, whose visible tiles are reused while the view hasn't moved.
+    # Takes the monster effects logged since the last capture.
+    player = game.player
+    store = game.monsters
+    game_map = game.game_map
+    indices = store.visible_indices(game_map)
+    monsters = np.empty(len(indices), dtype=FRAME_MONSTER)
+    monsters['id'] = indices
+    for name in FRAME_MONSTER.names[1:]:
+        monsters[name] = getattr(store, name)[indices]
+
+    shots = game.projectiles
+    indices = shots.alive_indices()
+    indices = indices[game_map.tile_states((shots.x[indices] // TILE_SIZE).astype(np.intp),
+                                           (shots.y[indices] // TILE_SIZE).astype(np.intp))[2]]
+    projectiles = np.empty(len(indices), dtype=FRAME_PROJECTILE)
+    projectiles['id'] = indices
+    for name in FRAME_PROJECTILE.names[1:]:
+        projectiles[name] = getattr(shots, name)[indices]
+
+    origin = game_map.fov_origin
+    if previous is not None and previous.depth == game.depth and previous.fov_origin == origin:
+        visible = previous.visible
+    else:
+        visible = np.array(list(game_map.visible_tiles), dtype=np.int32).reshape(-1, 2)
+    return Frame(game.ticks, game.time, game.depth,
+                 (player.rect.x, player.rect.y, player.hp, player.facing,
+                  player.attack_effect_time),
+                 monsters, projectiles, shots.blasts.copy(), store.effects.drain(), origin,
+                 visible, sim_ms)
+
+class FrameBuffer:
+    # Double buffer of the two most recent frames. The renderer draws
+    # between them, so what it shows is at most one tick old and never
+    # waits on the tick in progress. Effects are collected from every
+    # frame published, including those that are never drawn, until
+    # take_effects(); at most EFFECT_LOG_CAPACITY are held, oldest
+    # dropped first.
+    def __init__(self):
+        self.previous = None
+        self.latest = None
+        self.published_at = 0.0
+        self.effects = []
+        self.effect_count = 0
+
+    def publish(self, frame):
+        if self.latest is not None and self.latest.depth != frame.depth:
+            self.take_effects()  # they happened on the floor just left
+        self.previous, self.latest = self.latest, frame
+        self.published_at = time.perf_counter()
+        if len(frame.effects):
+            self.effects.append(frame.effects)
+            self.effect_count += len(frame.effects)
+            while self.effect_count > EFFECT_LOG_CAPACITY:
+                self.effect_count -= len(self.effects.pop(0))
+
+    def take_effects(self):
+        # Effects of the frames published since the last call
+        effects = np.concatenate(self.effects) if self.effects else None
+        self.effects = []
+        self.effect_count = 0
+        return effects
+
+    def alpha(self):
+        # How far to blend from previous to latest: the fraction of a tick
+        # since latest arrived
+        return min(1.0, (time.perf_counter() - self.published_at) * FPS)
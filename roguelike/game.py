@@ -1,19 +1,51 @@
+import time
+import zlib
 import pygame
 import random
+import numpy as np
 from .constants import *
 from .player import Player
-from .map_generator import MapGenerator
-from .entities import Monster
-from .camera import Camera
+from .generators import make_generator
+from .map_cache import MapCache, load_map_file
+from .chunked_map import ChunkedGameMap
+from .monster_store import MonsterStore
+from .projectiles import ProjectileStore
+from .spawner import Spawner
+from .floors import Floor, FloorManager
+from .ai_scheduler import AIScheduler, TIER_NAMES
+from .profiler import FrameProfiler
+from .frames import FrameBuffer, capture
+from .renderer import Renderer
+from .input_state import InputState, poll_input, read_events
 
 class Game:
-    def __init__(self):
+    def __init__(self, horde=0, seed=None, map_file=None, endless=False,
+                 recorder=None, game_map=None, populate=True, autosaver=None, depth=0,
+                 map_algorithm=MAP_ALGORITHM, prefetch_floors=True, headless=False,
+                 flow_field_radius=FLOW_FIELD_RADIUS,
+                 flow_field_steps=FLOW_FIELD_STEPS_PER_FRAME):
+        # Headless games only simulate: no window, renderer, minimaps or
+        # light maps, so they are cheap to build and tear down
         pygame.init()
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        self.headless = headless
+        self.screen = None if headless else pygame.display.set_mode((WINDOW_WIDTH,
+                                                                     WINDOW_HEIGHT))
         pygame.display.set_caption("Roguelike Adventure")
+        self.flow_field_radius = flow_field_radius
+        self.flow_field_steps = flow_field_steps
         self.clock = pygame.time.Clock()
         self.running = True
-        self.last_spawn_time = pygame.time.get_ticks()
+        self.profiler = FrameProfiler()
+        
+        # The simulation runs on its own clock of fixed ticks so that a run
+        # is reproducible from its seed and per-tick input
+        self.ticks = 0
+        self.time = 0  # simulated milliseconds
+        self.last_spawn_time = 0
+        self.kills = 0
+        self.input = InputState()
+        self.recorder = recorder
+        self.autosaver = autosaver
         
         # Initialize joysticks
         pygame.joystick.init()
@@ -21,133 +53,281 @@ class Game:
         for joy in self.joysticks:
             joy.init()
         
-        self.map_gen = MapGenerator()
-        self.game_map = self.map_gen.generate()
+        # Curated maps load from a file; generated maps go through the cache;
+        # endless maps stream chunks around the player; saved games pass
+        # their restored map in
+        self.endless = endless
+        self.map_file = map_file
+        self.map_algorithm = map_algorithm
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.rng = random.Random(f"{self.seed}:spawns")
+        if game_map is not None:
+            self.game_map = game_map
+        elif map_file is not None:
+            self.game_map = load_map_file(map_file)
+        elif endless:
+            self.game_map = ChunkedGameMap(self.seed)
+        else:
+            map_gen = make_generator(map_algorithm, seed=self.seed)
+            if MAP_CACHE_ENABLED:
+                self.game_map = MapCache().load_or_generate(map_gen)
+            else:
+                self.game_map = map_gen.generate()
         
         # Spawn player in the first room
-        first_room = self.map_gen.rooms[0]
+        first_room = self.rooms[0]
         spawn_x = first_room.center_x * TILE_SIZE
         spawn_y = first_room.center_y * TILE_SIZE
         self.player = Player(spawn_x, spawn_y)
         
-        self.monsters = pygame.sprite.Group()
-        self.camera = Camera()
-        self.spawn_monsters()
+        # Everything tied to one dungeon level lives on its Floor; endless
+        # maps have a single floor without stairs or lighting
+        monsters = MonsterStore()
+        spawner = Spawner(self.game_map, monsters, self.rng.getrandbits(64))
+        self.set_floor(Floor(depth, self.game_map, monsters, spawner,
+                             stairs=not endless, lit=not endless, drawn=not headless))
+        self.floors = None if endless else FloorManager(self.seed, map_algorithm,
+                                                        prefetch=prefetch_floors,
+                                                        drawn=not headless)
+        self.ai_scheduler = AIScheduler()
+        self.projectiles = ProjectileStore()
+        
+        # Each tick publishes an immutable frame; drawing reads only frames
+        # and the floor's drawing state
+        self.frames = FrameBuffer()
+        self.renderer = None if headless else Renderer(self.screen, self.profiler)
+        
+        # Horde mode replaces the normal spawns with a fixed crowd
+        self.horde = horde
+        if not populate:
+            pass  # monsters come from a saved game
+        elif horde:
+            self.spawn_horde(horde)
+        else:
+            self.spawn_monsters()
+        
+        if recorder is not None:
+            recorder.start(self)
+        if self.floors is not None:
+            self.floors.prefetch(self.depth + 1)
+        
+    @property
+    def rooms(self):
+        return self.game_map.rooms
+        
+    def set_floor(self, floor):
+        self.floor = floor
+        self.depth = floor.depth
+        self.game_map = floor.game_map
+        self.monsters = floor.monsters
+        self.spawner = floor.spawner
+        self.flow_field = floor.flow_field
+        self.flow_field.radius = self.flow_field_radius
+        self.flow_field.steps_per_frame = self.flow_field_steps
+        self.minimap = floor.minimap
+        pygame.display.set_caption(f"Roguelike Adventure - Floor {floor.depth + 1}")
+        
+    def change_floor(self, depth):
+        # Swap in another floor; new floors come pre-generated from the
+        # worker, so this normally does no map generation at all
+        going_down = depth > self.depth
+        self.monsters.effects.drain()  # nothing left behind shows on the way back
+        self.floors.leave(self.floor)
+        floor, visited = self.floors.take(depth)
+        if not visited:
+            monsters = MonsterStore()
+            spawner = Spawner(floor, monsters, self.rng.getrandbits(64))
+            floor = Floor(depth, floor, monsters, spawner, drawn=not self.headless)
+        self.set_floor(floor)
+        self.projectiles.clear()
+        
+        # Arrive on the stairs leading back
+        x, y = floor.stairs_up if going_down else floor.stairs_down
+        self.player.rect.x = x * TILE_SIZE
+        self.player.rect.y = y * TILE_SIZE
+        if not visited:
+            self.spawn_monsters()
+        self.floors.prefetch(depth + 1)
+        
+    def use_stairs(self):
+        tile = (self.player.rect.centerx // TILE_SIZE, self.player.rect.centery // TILE_SIZE)
+        if tile == self.floor.stairs_down:
+            self.change_floor(self.depth + 1)
+        elif tile == self.floor.stairs_up:
+            self.change_floor(self.depth - 1)
         
     def spawn_monsters(self):
-        # Don't spawn in first room (player spawn)
-        for room in self.map_gen.rooms[1:]:
+        # Don't spawn in first room (player spawn); the index leaves it out
+        for room_id in range(self.spawner.index.room_count):
             # Random number of monsters per room
-            num_monsters = random.randint(*MONSTERS_PER_ROOM)
+            num_monsters = self.rng.randint(*MONSTERS_PER_ROOM)
             
             for _ in range(num_monsters):
-                self.spawn_single_monster(room)
+                self.spawner.spawn(self.player, room_id)
                 
-    def spawn_single_monster(self, specific_room=None):
-        # Choose a random room (not the first room)
-        available_rooms = self.map_gen.rooms[1:] if specific_room is None else [specific_room]
-        if not available_rooms:
-            return
-            
-        room = random.choice(available_rooms)
-        
-        # Random position within room
-        x = random.randint(room.x1 + 1, room.x2 - 1) * TILE_SIZE
-        y = random.randint(room.y1 + 1, room.y2 - 1) * TILE_SIZE
-        
-        # Check distance from player
-        dx = x - self.player.rect.x
-        dy = y - self.player.rect.y
-        if (dx * dx + dy * dy) < SPAWN_DISTANCE_FROM_PLAYER * SPAWN_DISTANCE_FROM_PLAYER:
-            return
-        
-        # Choose monster type based on spawn weights
-        weights = [info['spawn_weight'] for info in MONSTER_TYPES.values()]
-        monster_type = random.choices(list(MONSTER_TYPES.keys()), 
-                                   weights=weights, k=1)[0]
-        
-        monster = Monster(x, y, monster_type)
-        self.monsters.add(monster)
+    def spawn_horde(self, count):
+        self.spawner.spawn_many(self.player, count)
+                
+    def spawn_single_monster(self):
+        return self.spawner.spawn(self.player)
     
     def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.running = False
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.handle_attack()
-            elif event.type == pygame.JOYBUTTONDOWN and event.button == 0:
-                self.handle_attack()
-            self.player.handle_event(event)
+        quit, attack, stairs, keys = read_events()
+        if quit:
+            self.running = False
+        for key in keys:
+            if key == pygame.K_F5 and self.autosaver is not None:
+                self.autosaver.save(self)
+            else:
+                self.renderer.handle_key(key)
+        
+        # Everything the next tick reads from the player; presses wait for
+        # a tick to use them
+        self.input = self.input.then(poll_input(self.joysticks, attack, stairs))
             
     def handle_attack(self):
-        attack_rect = self.player.attack()
-        for monster in list(self.monsters):  # Create list copy since we'll modify group
-            if attack_rect.colliderect(monster.rect):
-                if monster.take_damage(10):  # Deal 10 damage
-                    self.monsters.remove(monster)
+        self.kills += self.monsters.damage_in_rect(self.player.attack(self.time),
+                                                   PLAYER_ATTACK_DAMAGE)
     
-    def update(self):
+    def update_fov(self):
+        self.game_map.compute_fov(self.player.rect.centerx // TILE_SIZE,
+                                  self.player.rect.centery // TILE_SIZE, FOV_RADIUS)
+
+    def update(self, fov=True):
+        # Callers that only look at the map now and then can pass fov=False
+        # and call update_fov() when they do
         if self.player.hp <= 0:
             self.running = False
             return
             
-        current_time = pygame.time.get_ticks()
-        if (current_time - self.last_spawn_time >= MONSTER_SPAWN_INTERVAL and 
-            len(self.monsters) < MAX_MONSTERS):
-            self.spawn_single_monster()
-            self.last_spawn_time = current_time
+        profiler = self.profiler
+        current_time = self.time
+        if self.input.attack:
+            self.handle_attack()
+        if self.input.fire:
+            self.player.shoot(self.projectiles, 'bolt', current_time)
+        elif self.input.throw:
+            self.player.shoot(self.projectiles, 'bomb', current_time)
+        if self.input.stairs and self.floors is not None:
+            with profiler.phase('update.stairs'):
+                self.use_stairs()
+        with profiler.phase('update.spawn'):
+            if (not self.horde and
+                current_time - self.last_spawn_time >= MONSTER_SPAWN_INTERVAL and 
+                len(self.monsters) < MAX_MONSTERS):
+                self.spawn_single_monster()
+                self.last_spawn_time = current_time
             
-        self.player.update(self.game_map)
-        self.monsters.update(self.player, self.game_map)
-        self.camera.update(self.player)
-        
-        # Update field of view
+        with profiler.phase('update.player'):
+            self.player.update(self.game_map, self.input)
         player_tile_x = self.player.rect.centerx // TILE_SIZE
         player_tile_y = self.player.rect.centery // TILE_SIZE
-        self.game_map.compute_fov(player_tile_x, player_tile_y, FOV_RADIUS)
-        
-    def draw(self):
-        self.screen.fill(BLACK)
-        self.game_map.draw(self.screen, self.camera)
-        
-        # Draw player with camera offset, attack effect, and health bar
-        player_rect = self.camera.apply(self.player)
-        self.screen.blit(self.player.image, player_rect)
-        self.player.draw_attack_effect(self.screen, (self.camera.x, self.camera.y))
-        
-        # Draw health bar at correct screen position
-        health_x = player_rect.x
-        health_y = player_rect.y - HEALTH_BAR_OFFSET - HEALTH_BAR_HEIGHT
-        health_width = int(HEALTH_BAR_WIDTH * (self.player.hp / PLAYER_HP))
-        
-        # Background (empty health)
-        pygame.draw.rect(self.screen, RED,
-                        (health_x, health_y, HEALTH_BAR_WIDTH, HEALTH_BAR_HEIGHT))
-        # Foreground (current health)
-        if health_width > 0:
-            pygame.draw.rect(self.screen, GREEN,
-                           (health_x, health_y, health_width, HEALTH_BAR_HEIGHT))
-        
-        # Draw only visible monsters with camera offset and health bars
-        for monster in self.monsters:
-            monster_tile_x = monster.rect.centerx // TILE_SIZE
-            monster_tile_y = monster.rect.centery // TILE_SIZE
-            
-            # Only draw if monster's position is visible
-            if (0 <= monster_tile_x < self.game_map.width and 
-                0 <= monster_tile_y < self.game_map.height and 
-                self.game_map.visible[monster_tile_x][monster_tile_y]):
-                monster_rect = self.camera.apply(monster)
-                self.screen.blit(monster.image, monster_rect)
-                monster.draw_health_bar(self.screen, (self.camera.x, self.camera.y))
-            
-        pygame.display.flip()
+        if self.endless:
+            with profiler.phase('update.stream'):
+                if self.game_map.stream(player_tile_x, player_tile_y):
+                    self.monsters.despawn_unloaded(self.game_map)
+                    self.spawner.refresh()
+        
+        with profiler.phase('update.flow_field'):
+            self.flow_field.update(player_tile_x, player_tile_y)
+        with profiler.phase('update.monsters'):
+            self.monsters.update(self.player, self.game_map, self.flow_field,
+                                 current_time, self.ai_scheduler)
+        with profiler.phase('update.projectiles'):
+            self.kills += self.projectiles.update(self.game_map, self.monsters, current_time)
+        
+        # Update field of view
+        if fov:
+            with profiler.phase('update.fov'):
+                self.update_fov()
+        profiler.count('monsters', len(self.monsters))
+        profiler.count('projectiles', len(self.projectiles))
+        if profiler.enabled:
+            profiler.count('ai tiers', ' / '.join(
+                f"{name} {count}" for name, count in
+                zip(TIER_NAMES, self.ai_scheduler.tier_counts.tolist())))
+        
+        self.ticks += 1
+        self.time = self.ticks * 1000 // FPS
+        if self.recorder is not None:
+            self.recorder.tick(self)
+        if self.autosaver is not None:
+            self.autosaver.update(self)
+        
+    def step(self):
+        # One tick of live play: record and apply the input, then publish
+        # the tick's frame
+        if self.recorder is not None:
+            self.recorder.record(self.input)
+        start = time.perf_counter()
+        self.update()
+        sim_ms = (time.perf_counter() - start) * 1000
+        self.frames.publish(capture(self, self.frames.latest, sim_ms))
+        self.input = self.input.held()
+        
+    def state_checksum(self):
+        # CRC of the simulation state, used to detect replay desyncs
+        store = self.monsters
+        size = store.size
+        checksum = zlib.crc32(np.array(
+            [self.ticks, self.depth, self.player.rect.x, self.player.rect.y, self.player.hp,
+             store.count, size], dtype=np.int64).tobytes())
+        for array in (store.alive, store.x, store.y, store.hp, store.last_attack):
+            checksum = zlib.crc32(np.ascontiguousarray(array[:size]).tobytes(), checksum)
+        projectiles = self.projectiles
+        for array in (projectiles.alive, projectiles.x, projectiles.y):
+            checksum = zlib.crc32(array[:projectiles.size].tobytes(), checksum)
+        return checksum
+        
+    def draw(self, alpha=1.0):
+        # Draw `alpha` of the way from the previous tick's frame to the
+        # latest; callers stepping update() themselves get a fresh frame
+        if self.headless:
+            raise RuntimeError("headless games can't draw")
+        frames = self.frames
+        latest = frames.latest
+        if latest is None or latest.tick != self.ticks or latest.depth != self.depth:
+            frames.publish(capture(self, latest))
+        self.renderer.draw(self.floor, frames.previous, frames.latest, alpha,
+                           frames.take_effects())
         
     def run(self):
+        # Ticks run at FPS on the wall clock however fast frames are drawn;
+        # after a stall up to SIM_MAX_CATCHUP_TICKS ticks run back to back
+        # and the rest of the backlog is dropped
+        profiler = self.profiler
+        tick_seconds = 1 / FPS
+        lag = 0.0
+        last = time.perf_counter()
         while self.running:
-            self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
-        
+            profiler.begin_frame()
+            with profiler.phase('events'):
+                self.handle_events()
+            now = time.perf_counter()
+            lag += now - last
+            last = now
+            with profiler.phase('update'):
+                ticks = 0
+                while lag >= tick_seconds and self.running:
+                    self.step()
+                    lag -= tick_seconds
+                    ticks += 1
+                    if ticks == SIM_MAX_CATCHUP_TICKS:
+                        lag = min(lag, tick_seconds)
+                        break
+            with profiler.phase('draw'):
+                self.draw(min(1.0, lag / tick_seconds))
+            with profiler.phase('wait'):
+                self.clock.tick(RENDER_FPS)
+        self.close()
         pygame.quit()
+        
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.autosaver is not None:
+            self.autosaver.close()
+        if self.floors is not None:
+            self.floors.close()
+        if isinstance(self.game_map, ChunkedGameMap):
+            self.game_map.close()  # removes its spill directory
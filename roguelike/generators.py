@@ -0,0 +1,295 @@
+import numpy as np
+from .constants import *
+from .map_generator import GameMap, MapGenerator, Rect
+from .regions import label_regions
+
+# Map generation algorithms. A generator is built from a seed, a size and
+# its own options, exposes `params` (everything besides the seed that
+# shapes the map, used for cache keys) and `generate()`, which returns a
+# GameMap whose rooms start with the player's and end with the room
+# farthest from it. VERSION is part of `params` and is bumped whenever the
+# same seed and options give a different map. New algorithms go in
+# GENERATORS.
+
+def carve(tiles, x1, y1, x2, y2):
+    # Clear many half-open rectangles [x1, x2) x [y1, y2) at once: mark
+    # their corners in a difference grid, then prefix-sum both axes
+    width, height = tiles.shape
+    diff = np.zeros((width + 1, height + 1), dtype=np.int32)
+    np.add.at(diff, (x1, y1), 1)
+    np.add.at(diff, (x2, y1), -1)
+    np.add.at(diff, (x1, y2), -1)
+    np.add.at(diff, (x2, y2), 1)
+    tiles &= diff.cumsum(axis=0).cumsum(axis=1)[:width, :height] == 0
+
+def order_rooms(rooms, first):
+    # rooms[first] leads, the rest follow by distance from it, so stairs
+    # down end up far from the start
+    centers = np.array([room.center for room in rooms]).reshape(-1, 2)
+    distance = ((centers - centers[first]) ** 2).sum(axis=1)
+    distance[first] = -1
+    return [rooms[i] for i in np.argsort(distance, kind='stable').tolist()]
+
+def region_rooms(tiles, rng, spacing=REGION_ROOM_SPACING):
+    # Room markers for maps without real rooms: in every spacing-sized
+    # block that is at least a quarter floor, a square centred on the
+    # floor tile nearest the block centre
+    width, height = tiles.shape
+    xs, ys = np.nonzero(~tiles)
+    if not len(xs):
+        return []
+    blocks_y = -(-height // spacing)
+    block = (xs // spacing) * blocks_y + ys // spacing
+    distance = (xs % spacing - spacing // 2) ** 2 + (ys % spacing - spacing // 2) ** 2
+    order = np.lexsort((distance, block))
+    blocks, first, counts = np.unique(block[order], return_index=True, return_counts=True)
+    keep = counts >= spacing * spacing // 4
+    if not keep.any():
+        keep = counts == counts.max()
+    cx = xs[order[first[keep]]]
+    cy = ys[order[first[keep]]]
+    radius = np.minimum.reduce([np.full(len(cx), max(1, spacing // 4)),
+                                cx, cy, width - 1 - cx, height - 1 - cy])
+    rooms = [Rect(x - r, y - r, 2 * r, 2 * r)
+             for x, y, r in zip(cx.tolist(), cy.tolist(), radius.tolist())]
+    return order_rooms(rooms, int(rng.integers(len(rooms))))
+
+def keep_largest_region(tiles):
+    # Fill every floor region but the largest, so the whole map is reachable
+    labels, sizes = label_regions(~tiles)
+    if len(sizes):
+        tiles |= labels != np.argmax(sizes)
+
+class CaveGenerator:
+    # Cellular automata: random noise smoothed by the 4-5 rule, counting
+    # wall neighbours with eight shifted views of a padded grid
+    VERSION = 1
+
+    def __init__(self, seed=None, width=MAP_WIDTH, height=MAP_HEIGHT,
+                 wall_chance=CAVE_WALL_CHANCE, smoothing_steps=CAVE_SMOOTHING_STEPS,
+                 attempts=CAVE_ATTEMPTS):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.wall_chance = wall_chance
+        self.smoothing_steps = smoothing_steps
+        self.attempts = attempts
+
+    @property
+    def params(self):
+        return {
+            'algorithm': 'caves',
+            'version': self.VERSION,
+            'width': self.width,
+            'height': self.height,
+            'wall_chance': self.wall_chance,
+            'smoothing_steps': self.smoothing_steps,
+        }
+
+    def generate(self):
+        # Small maps can smooth away every floor tile; start over from new
+        # noise a few times before giving up
+        for _ in range(self.attempts):
+            tiles = self.smooth()
+            if not tiles.all():
+                keep_largest_region(tiles)
+                return GameMap(self.width, self.height, tiles=tiles,
+                               rooms=region_rooms(tiles, self.rng))
+        raise ValueError(f"no open cave in {self.attempts} attempts on a "
+                         f"{self.width}x{self.height} map; use a larger map "
+                         f"or a lower wall_chance")
+
+    def smooth(self):
+        width, height = self.width, self.height
+        walls = np.ones((width + 2, height + 2), dtype=np.uint8)  # padded with wall
+        walls[2:-2, 2:-2] = self.rng.random((width - 2, height - 2)) < self.wall_chance
+        inner = walls[1:-1, 1:-1]
+        for _ in range(self.smoothing_steps):
+            count = (walls[:-2, :-2] + walls[1:-1, :-2] + walls[2:, :-2] +
+                     walls[:-2, 1:-1] + walls[2:, 1:-1] +
+                     walls[:-2, 2:] + walls[1:-1, 2:] + walls[2:, 2:])
+            inner[...] = (count >= 5) | (inner & (count >= 4))
+            inner[[0, -1], :] = 1
+            inner[:, [0, -1]] = 1
+
+        return inner.astype(bool)
+
+class BSPGenerator:
+    # Binary space partition, split a whole tree level at a time: every
+    # leaf big enough is cut across its longer side, then each final leaf
+    # gets a room, and the two halves of every split are joined by an L
+    # corridor between a room on each side
+    VERSION = 1
+
+    def __init__(self, seed=None, width=MAP_WIDTH, height=MAP_HEIGHT,
+                 min_leaf=BSP_MIN_LEAF, max_leaf=BSP_MAX_LEAF,
+                 room_min_size=ROOM_MIN_SIZE, room_max_size=ROOM_MAX_SIZE):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.min_leaf = min_leaf
+        self.max_leaf = max_leaf
+        self.room_min_size = room_min_size
+        self.room_max_size = room_max_size
+
+    @property
+    def params(self):
+        return {
+            'algorithm': 'bsp',
+            'version': self.VERSION,
+            'width': self.width,
+            'height': self.height,
+            'min_leaf': self.min_leaf,
+            'max_leaf': self.max_leaf,
+            'room_min_size': self.room_min_size,
+            'room_max_size': self.room_max_size,
+        }
+
+    def split(self):
+        # Returns (leaves, splits, node count): leaves as (id, x, y, w, h)
+        # arrays and, per tree level, the (parent, left, right) ids of its
+        # splits
+        rng = self.rng
+        min_leaf = self.min_leaf
+        # The last row and column stay wall, as in MapGenerator
+        ids, x, y, w, h = (np.array([value]) for value in
+                           (0, 0, 0, self.width - 1, self.height - 1))
+        next_id = 1
+        leaves = []
+        splits = []
+        while len(ids):
+            can_x = w >= 2 * min_leaf
+            can_y = h >= 2 * min_leaf
+            wanted = (np.maximum(w, h) > self.max_leaf) | (rng.random(len(ids)) < BSP_SPLIT_CHANCE)
+            cut = (can_x | can_y) & wanted
+            leaves.append(tuple(part[~cut] for part in (ids, x, y, w, h)))
+
+            ids, x, y, w, h = (part[cut] for part in (ids, x, y, w, h))
+            can_x, can_y = can_x[cut], can_y[cut]
+            coin = rng.random(len(ids)) < 0.5
+            across_x = can_x & (~can_y | (w > h * 1.25) | ((h <= w * 1.25) & coin))
+            size = np.where(across_x, w, h)
+            at = rng.integers(min_leaf, size - min_leaf + 1)
+
+            left = next_id + 2 * np.arange(len(ids))
+            right = left + 1
+            next_id += 2 * len(ids)
+            splits.append((ids, left, right))
+            ids = np.concatenate([left, right])
+            x = np.concatenate([x, np.where(across_x, x + at, x)])
+            y = np.concatenate([y, np.where(across_x, y, y + at)])
+            w = np.concatenate([np.where(across_x, at, w), np.where(across_x, w - at, w)])
+            h = np.concatenate([np.where(across_x, h, at), np.where(across_x, h, h - at)])
+        return tuple(np.concatenate(parts) for parts in zip(*leaves)), splits, next_id
+
+    def generate(self):
+        rng = self.rng
+        (ids, x, y, w, h), splits, node_count = self.split()
+
+        # One room per leaf, wholly inside it
+        room_w = rng.integers(np.minimum(self.room_min_size, w),
+                              np.minimum(self.room_max_size, w) + 1)
+        room_h = rng.integers(np.minimum(self.room_min_size, h),
+                              np.minimum(self.room_max_size, h) + 1)
+        room_x = x + rng.integers(0, w - room_w + 1)
+        room_y = y + rng.integers(0, h - room_h + 1)
+        center_x = room_x + room_w // 2
+        center_y = room_y + room_h // 2
+
+        # Each node is represented by a room in its subtree, found bottom up
+        represent = np.full(node_count, -1)
+        represent[ids] = np.arange(len(ids))
+        for parents, left, right in reversed(splits):
+            represent[parents] = represent[left]
+        joined = [(represent[left], represent[right]) for _, left, right in splits]
+        a = np.concatenate([pair[0] for pair in joined]) if joined else np.zeros(0, int)
+        b = np.concatenate([pair[1] for pair in joined]) if joined else np.zeros(0, int)
+        ax, ay, bx, by = center_x[a], center_y[a], center_x[b], center_y[b]
+
+        # Room interiors, then horizontal and vertical corridor legs
+        tiles = np.ones((self.width, self.height), dtype=bool)
+        carve(tiles,
+              np.concatenate([room_x + 1, np.minimum(ax, bx), bx]),
+              np.concatenate([room_y + 1, ay, np.minimum(ay, by)]),
+              np.concatenate([room_x + room_w, np.maximum(ax, bx) + 1, bx + 1]),
+              np.concatenate([room_y + room_h, ay + 1, np.maximum(ay, by) + 1]))
+
+        rooms = [Rect(*room) for room in zip(room_x.tolist(), room_y.tolist(),
+                                              room_w.tolist(), room_h.tolist())]
+        return GameMap(self.width, self.height, tiles=tiles,
+                       rooms=order_rooms(rooms, int(rng.integers(len(rooms)))))
+
+class DrunkardGenerator:
+    # Drunkard's walk tunnels: batches of walkers start on freshly dug
+    # floor (the first from the centre) and stagger about until enough of
+    # the map is dug. A whole batch of walks is one cumulative sum; walkers
+    # pushed against the border slide along it.
+    VERSION = 1
+    STEPS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+    def __init__(self, seed=None, width=MAP_WIDTH, height=MAP_HEIGHT,
+                 floor_ratio=DRUNKARD_FLOOR_RATIO, walkers=DRUNKARD_WALKERS,
+                 steps=DRUNKARD_STEPS):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.floor_ratio = floor_ratio
+        self.walkers = walkers
+        self.steps = steps
+
+    @property
+    def params(self):
+        return {
+            'algorithm': 'drunkard',
+            'version': self.VERSION,
+            'width': self.width,
+            'height': self.height,
+            'floor_ratio': self.floor_ratio,
+            'walkers': self.walkers,
+            'steps': self.steps,
+        }
+
+    def generate(self):
+        rng = self.rng
+        width, height = self.width, self.height
+        tiles = np.ones((width, height), dtype=bool)
+        # Walkers set out from the tiles the previous batch dug, which lie
+        # mostly on the edge of the dug area; starting anywhere on the floor
+        # wastes most steps retracing old tunnels
+        new = np.array([(width // 2) * height + height // 2])  # flat indices
+        tiles.flat[new] = False
+        target = int(self.floor_ratio * (width - 2) * (height - 2))
+        dug = 1
+        while dug < target:
+            # Enough walkers to reach the target if none of them overlapped
+            walkers = max(self.walkers, (target - dug) // self.steps)
+            start = new[rng.integers(len(new), size=walkers)]
+            moves = self.STEPS[rng.integers(4, size=(walkers, self.steps))]
+            path = np.cumsum(moves, axis=1)
+            xs = np.clip(start[:, None] // height + path[..., 0], 1, width - 2)
+            ys = np.clip(start[:, None] % height + path[..., 1], 1, height - 2)
+            visited = (xs * height + ys).ravel()
+            fresh = np.unique(visited[tiles.flat[visited]])
+            if len(fresh):
+                new = fresh
+                tiles.flat[new] = False
+                dug += len(new)
+        return GameMap(width, height, tiles=tiles, rooms=region_rooms(tiles, rng))
+
+GENERATORS = {
+    'rooms': MapGenerator,
+    'caves': CaveGenerator,
+    'bsp': BSPGenerator,
+    'drunkard': DrunkardGenerator,
+}
+
+def make_generator(algorithm=MAP_ALGORITHM, seed=None, **options):
+    try:
+        generator_class = GENERATORS[algorithm]
+    except KeyError:
+        raise ValueError(f"unknown map algorithm {algorithm!r}; "
+                         f"expected one of {', '.join(GENERATORS)}") from None
+    return generator_class(seed=seed, **options)
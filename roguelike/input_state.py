@@ -0,0 +1,122 @@
+import struct
+import pygame
+from .constants import *
+
+# Button bits of one tick of input
+RIGHT = 1
+LEFT = 2
+DOWN = 4
+UP = 8
+ATTACK = 16
+STAIRS = 32
+FIRE = 64   # held: shoot bolts as fast as the cooldown allows
+THROW = 128  # held: throw bombs
+
+PRESSES = ATTACK | STAIRS  # act once per press rather than while held
+
+AXIS_SCALE = 63  # analog input is quantized to int8 steps of 1/63
+
+class InputState:
+    # Everything the simulation reads from the player during one tick,
+    # quantized so that live play and replays see identical values
+    __slots__ = ('buttons', 'axis_x', 'axis_y')
+    FORMAT = struct.Struct('<Bbb')
+
+    def __init__(self, buttons=0, axis_x=0, axis_y=0):
+        self.buttons = buttons
+        self.axis_x = axis_x
+        self.axis_y = axis_y
+
+    @property
+    def attack(self):
+        return bool(self.buttons & ATTACK)
+
+    @property
+    def stairs(self):
+        return bool(self.buttons & STAIRS)
+
+    @property
+    def fire(self):
+        return bool(self.buttons & FIRE)
+
+    @property
+    def throw(self):
+        return bool(self.buttons & THROW)
+
+    @property
+    def move_x(self):
+        return ((self.buttons & RIGHT) > 0) - ((self.buttons & LEFT) > 0) + self.axis_x / AXIS_SCALE
+
+    @property
+    def move_y(self):
+        return ((self.buttons & DOWN) > 0) - ((self.buttons & UP) > 0) + self.axis_y / AXIS_SCALE
+
+    def held(self):
+        # This input with the presses used up, for the ticks after the first
+        return InputState(self.buttons & ~PRESSES, self.axis_x, self.axis_y)
+
+    def then(self, newer):
+        # Newer held input, keeping presses no tick has used yet
+        return InputState(newer.buttons | (self.buttons & PRESSES), newer.axis_x, newer.axis_y)
+
+    def pack(self):
+        return self.FORMAT.pack(self.buttons, self.axis_x, self.axis_y)
+
+    @classmethod
+    def unpack(cls, data):
+        return cls(*cls.FORMAT.unpack(data))
+
+def _quantize(value):
+    return max(-127, min(127, round(value * AXIS_SCALE)))
+
+def read_events():
+    # Drain pygame's event queue: (quit requested, attack pressed, stairs
+    # pressed, other keys pressed)
+    quit = attack = stairs = False
+    keys = []
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            quit = True
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                attack = True
+            elif event.key in (pygame.K_PERIOD, pygame.K_RETURN):
+                stairs = True
+            else:
+                keys.append(event.key)
+        elif event.type == pygame.JOYBUTTONDOWN:
+            if event.button == 0:
+                attack = True
+            elif event.button == 1:
+                stairs = True
+    return quit, attack, stairs, keys
+
+def poll_input(joysticks, attack=False, stairs=False):
+    # Sample held keys and joysticks; attack and stairs come from this
+    # tick's events
+    keys = pygame.key.get_pressed()
+    buttons = (ATTACK if attack else 0) | (STAIRS if stairs else 0)
+    if keys[pygame.K_RIGHT]:
+        buttons |= RIGHT
+    if keys[pygame.K_LEFT]:
+        buttons |= LEFT
+    if keys[pygame.K_DOWN]:
+        buttons |= DOWN
+    if keys[pygame.K_UP]:
+        buttons |= UP
+    if keys[pygame.K_f]:
+        buttons |= FIRE
+    if keys[pygame.K_b]:
+        buttons |= THROW
+
+    # Left analog stick plus D-pad; buttons 2 and 3 fire and throw
+    axis_x = axis_y = 0.0
+    for joystick in joysticks:
+        axis_x += joystick.get_axis(0) + joystick.get_hat(0)[0]
+        axis_y += joystick.get_axis(1) + joystick.get_hat(0)[1]
+        if joystick.get_numbuttons() > 3:
+            if joystick.get_button(2):
+                buttons |= FIRE
+            if joystick.get_button(3):
+                buttons |= THROW
+    return InputState(buttons, _quantize(axis_x), _quantize(axis_y))
@@ -0,0 +1,121 @@
+import numpy as np
+from .constants import *
+from .fov import FieldOfView
+
+# Light colour per tile is quantized to LIGHT_LEVELS steps per channel and
+# packed into one code, (r * LIGHT_LEVELS + g) * LIGHT_LEVELS + b, which the
+# map renderer turns into a tinted wall or floor colour
+LIGHT_CODES = LIGHT_LEVELS ** 3
+
+class Light:
+    # A light source on a tile; colour is RGB 0-255, intensity scales it
+    __slots__ = ('x', 'y', 'radius', 'color', 'intensity')
+
+    def __init__(self, x, y, radius, color, intensity=1.0):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.color = color
+        self.intensity = intensity
+
+    def key(self):
+        return (self.x, self.y, self.radius, self.color, self.intensity)
+
+def room_lights(rooms):
+    # A static light in the middle of every room, colours cycling
+    return [Light(room.center_x, room.center_y, ROOM_LIGHT_RADIUS,
+                  ROOM_LIGHT_COLORS[i % len(ROOM_LIGHT_COLORS)], ROOM_LIGHT_INTENSITY)
+            for i, room in enumerate(rooms)]
+
+def light_palette():
+    # Colours for every renderer code of a lit map: 0 = not drawn,
+    # 1 = explored wall, then one visible wall and one visible floor colour
+    # per light code
+    levels = np.arange(LIGHT_LEVELS) / (LIGHT_LEVELS - 1)
+    light = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+    walls = np.array(VISIBLE_COLOR) * (LIGHT_AMBIENT + (1 - LIGHT_AMBIENT) * light)
+    floors = np.array(LIT_FLOOR_COLOR) * light
+    return np.concatenate([[BLACK, UNSEEN_COLOR], walls, floors]).round().astype(np.uint8)
+
+def quantize(rgb):
+    steps = np.clip(rgb * (LIGHT_LEVELS - 1) + 0.5, 0, LIGHT_LEVELS - 1).astype(np.uint16)
+    return (steps[..., 0] * LIGHT_LEVELS + steps[..., 1]) * LIGHT_LEVELS + steps[..., 2]
+
+class LightMap:
+    # Per-tile light from many sources. Static lights are summed into one
+    # grid when baked, so their number doesn't matter afterwards; dynamic
+    # lights are re-added each time they change, and only the tiles in
+    # their old and new windows are requantized. Each light reaches the
+    # tiles its shadowcast FOV sees, fading with distance. Lights keep their
+    # own FOV cache so they don't push the player's views out of the map's.
+    def __init__(self, game_map, static_lights=()):
+        self.game_map = game_map
+        self.fov = FieldOfView(game_map, cache_size=LIGHT_FOV_CACHE_SIZE)
+        shape = (game_map.width, game_map.height, 3)
+        self.static = np.zeros(shape, dtype=np.float32)
+        self.dynamic = np.zeros(shape, dtype=np.float32)
+        self.codes = np.zeros(shape[:2], dtype=np.uint16)
+        self.windows = []       # (x0, y0, x1, y1) touched by dynamic lights
+        self.dynamic_key = ()
+        self.renderer = game_map.renderer
+        self.renderer.light_map = self
+        self.bake(static_lights)
+
+    def bake(self, lights):
+        # Add static lights; cached map chunks are rebuilt with the new light
+        self._accumulate(self.static, lights)
+        self.codes[...] = quantize(self.static + self.dynamic)
+        self.renderer.invalidate()
+
+    def _accumulate(self, grid, lights):
+        # Adds every light to grid; lights of one radius share a falloff
+        # kernel and go in with one scatter
+        game_map = self.game_map
+        by_radius = {}
+        for light in lights:
+            by_radius.setdefault(light.radius, []).append(light)
+        for radius, group in by_radius.items():
+            offsets = np.arange(-radius, radius + 1)
+            distance = np.hypot(offsets[:, None], offsets[None, :])
+            kernel = np.clip(1 - distance / (radius + 1), 0, None) ** 2
+
+            # Line of sight of each light as a stack of kernel-sized masks
+            size = 2 * radius + 1
+            masks = np.zeros((len(group), size, size), dtype=bool)
+            for i, light in enumerate(group):
+                lit = self.fov.compute(light.x, light.y, radius)
+                if lit:
+                    tiles = np.array(list(lit))
+                    masks[i, tiles[:, 0] - light.x + radius, tiles[:, 1] - light.y + radius] = True
+
+            origin = np.array([(light.x, light.y) for light in group])
+            color = np.array([light.color for light in group], dtype=np.float32) / 255 * \
+                np.array([light.intensity for light in group], dtype=np.float32)[:, None]
+            which, lx, ly = np.nonzero(masks)
+            xs = origin[which, 0] + lx - radius
+            ys = origin[which, 1] + ly - radius
+            np.add.at(grid, (xs, ys), kernel[lx, ly][:, None] * color[which])
+
+    def update(self, lights):
+        # Replace the dynamic lights; a no-op while they stay the same
+        key = tuple(light.key() for light in lights)
+        if key == self.dynamic_key:
+            return
+        self.dynamic_key = key
+        game_map = self.game_map
+        windows = [(max(0, light.x - light.radius), max(0, light.y - light.radius),
+                    min(game_map.width, light.x + light.radius + 1),
+                    min(game_map.height, light.y + light.radius + 1)) for light in lights]
+        for x0, y0, x1, y1 in self.windows:
+            self.dynamic[x0:x1, y0:y1] = 0
+        self._accumulate(self.dynamic, lights)
+
+        # Requantize the touched tiles and repaint those in view that changed
+        dirty = self.renderer.dirty
+        for x0, y0, x1, y1 in self.windows + windows:
+            area = (slice(x0, x1), slice(y0, y1))
+            codes = quantize(self.static[area] + self.dynamic[area])
+            xs, ys = np.nonzero((codes != self.codes[area]) & game_map.visible[area])
+            self.codes[area] = codes
+            dirty.update(zip((xs + x0).tolist(), (ys + y0).tolist()))
+        self.windows = windows
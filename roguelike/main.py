@@ -1,8 +1,59 @@
+import argparse
+from functools import partial
+from .constants import *
 from .game import Game
+from .generators import GENERATORS
+from .replay import ReplayDesync, ReplayRecorder, replay
+from .savegame import AutoSaver, default_save_path, load_game
+from .simulation import run_decoupled
+
+def build_game(args):
+    autosaver = AutoSaver(args.save or default_save_path())
+    if args.load:
+        return load_game(args.load, autosaver=autosaver)
+    recorder = ReplayRecorder(args.record) if args.record else None
+    return Game(horde=args.horde, seed=args.seed, map_file=args.map,
+                endless=args.endless, recorder=recorder, autosaver=autosaver,
+                map_algorithm=args.generator)
 
 def main():
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser(description="Roguelike Adventure")
+    parser.add_argument('--horde', type=int, default=0, metavar='N',
+                        help="stress mode: start with N monsters and no further spawns")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="dungeon seed (default: random)")
+    parser.add_argument('--map', default=None, metavar='FILE',
+                        help="play a pre-generated .rlmap file")
+    parser.add_argument('--generator', choices=GENERATORS, default=MAP_ALGORITHM,
+                        help="map generation algorithm (default: %(default)s)")
+    parser.add_argument('--endless', action='store_true',
+                        help="stream an effectively unbounded dungeon in chunks")
+    parser.add_argument('--record', default=None, metavar='FILE',
+                        help="record the seed and every tick of input to FILE")
+    parser.add_argument('--replay', default=None, metavar='FILE',
+                        help="play back a recording on screen, checking for desyncs")
+    parser.add_argument('--load', default=None, metavar='FILE',
+                        help="continue a saved game")
+    parser.add_argument('--save', default=None, metavar='FILE',
+                        help="where autosaves and F5 saves go (default: ~/.local/share/roguelike/autosave.npz)")
+    parser.add_argument('--sim-process', action='store_true',
+                        help="run the simulation in its own process so slow ticks never stall drawing")
+    args = parser.parse_args()
+    if args.load and args.record:
+        parser.error("--record cannot be combined with --load")
+    
+    if args.replay:
+        try:
+            ticks, elapsed, desyncs = replay(args.replay, render=True)
+        except ReplayDesync as error:
+            raise SystemExit(str(error))
+        print(f"Replayed {ticks} ticks in {elapsed:.2f}s")
+        return
+    
+    if args.sim_process:
+        run_decoupled(partial(build_game, args))
+    else:
+        build_game(args).run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import os
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import numpy as np
+from .constants import *
+from .map_generator import GameMap, Rect
+from .generators import GENERATORS, make_generator
+
+# File layout: header, rooms as int32 (x1, y1, x2, y2) rows, zero padding
+# to a 64-byte boundary, then one byte per tile in [x, y] order. Tiles are
+# stored unpacked so they can be mapped straight into a NumPy array.
+MAGIC = b'RLMP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHxxqIIII')  # magic, version, seed, width, height, rooms, tiles offset
+MAP_FILE_SUFFIX = '.rlmap'
+NO_SEED = -1
+
+def cache_key(seed, params):
+    # Content address for a generated map: same seed and parameters, same file
+    description = json.dumps({'version': FORMAT_VERSION, 'seed': seed, 'params': params},
+                             sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+def default_cache_dir():
+    return os.environ.get('ROGUELIKE_MAP_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'roguelike', 'maps'))
+
+def save_map_file(path, game_map, seed=None):
+    rooms = np.array([(room.x1, room.y1, room.x2, room.y2) for room in game_map.rooms],
+                     dtype=np.int32).reshape(-1, 4)
+    tiles_offset = -(-(HEADER.size + rooms.nbytes) // 64) * 64
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, NO_SEED if seed is None else seed,
+                         game_map.width, game_map.height, len(rooms), tiles_offset)
+
+    # Write to a temporary file and rename so readers never see a partial map
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(rooms.tobytes())
+        f.write(b'\0' * (tiles_offset - HEADER.size - rooms.nbytes))
+        f.write(np.ascontiguousarray(game_map.tiles, dtype=bool).tobytes())
+    os.replace(tmp_path, path)
+
+def load_map_file(path):
+    # Map the file copy-on-write: tiles are used in place without parsing or
+    # copying, and later writes to the grid never reach the file
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, version, seed, width, height, room_count, tiles_offset = \
+        HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} map file")
+
+    rooms = np.frombuffer(buffer, dtype=np.int32, count=room_count * 4,
+                          offset=HEADER.size).reshape(-1, 4)
+    rooms = [Rect(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in rooms.tolist()]
+    tiles = np.frombuffer(buffer, dtype=bool, count=width * height,
+                          offset=tiles_offset).reshape(width, height)
+    return GameMap(width, height, tiles=tiles, rooms=rooms)
+
+class MapCache:
+    def __init__(self, cache_dir=None, max_bytes=MAP_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def path(self, seed, params):
+        return os.path.join(self.cache_dir, cache_key(seed, params) + MAP_FILE_SUFFIX)
+
+    def load(self, seed, params):
+        path = self.path(seed, params)
+        try:
+            game_map = load_map_file(path)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used for eviction
+        return game_map
+
+    def store(self, seed, params, game_map):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            save_map_file(self.path(seed, params), game_map, seed)
+            self.evict()
+        except OSError:
+            pass  # The cache is an optimization; never fail the game over it
+
+    def load_or_generate(self, generator):
+        game_map = self.load(generator.seed, generator.params)
+        if game_map is None:
+            game_map = generator.generate()
+            self.store(generator.seed, generator.params, game_map)
+        return game_map
+
+    def evict(self):
+        # Drop least recently used maps until the cache fits in max_bytes
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(MAP_FILE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a generated dungeon to a map file")
+    parser.add_argument('seed', type=int)
+    parser.add_argument('output', help=f"path of the {MAP_FILE_SUFFIX} file to write")
+    parser.add_argument('--width', type=int, default=MAP_WIDTH)
+    parser.add_argument('--height', type=int, default=MAP_HEIGHT)
+    parser.add_argument('--max-rooms', type=int, default=None,
+                        help=f"rooms, for the rooms algorithm (default: one per {ROOM_AREA} tiles)")
+    parser.add_argument('--generator', choices=GENERATORS, default=MAP_ALGORITHM,
+                        help="map generation algorithm (default: %(default)s)")
+    args = parser.parse_args()
+
+    options = ({'max_rooms': args.max_rooms}
+               if args.generator == 'rooms' and args.max_rooms is not None else {})
+    generator = make_generator(args.generator, seed=args.seed, width=args.width,
+                               height=args.height, **options)
+    save_map_file(args.output, generator.generate(), args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import pygame
 import random
+import numpy as np
 from .constants import *
+from .fov import FieldOfView
+from .map_renderer import MapRenderer
 
 class Rect:
     def __init__(self, x, y, width, height):
@@ -27,126 +30,222 @@ class Rect:
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
+class RoomIndex:
+    # Grid buckets over room rectangles so overlap checks only look at
+    # nearby rooms. Buckets at least as large as a room keep each room in
+    # at most four buckets.
+    def __init__(self, bucket_size):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.bounds = None  # (bx0, by0, bx1, by1) of the occupied buckets
+        
+    def _bucket_range(self, room):
+        size = self.bucket_size
+        for bx in range(room.x1 // size, room.x2 // size + 1):
+            for by in range(room.y1 // size, room.y2 // size + 1):
+                yield (bx, by)
+                
+    def add(self, room):
+        for bucket in self._bucket_range(room):
+            self.buckets.setdefault(bucket, []).append(room)
+        size = self.bucket_size
+        x0, y0, x1, y1 = room.x1 // size, room.y1 // size, room.x2 // size, room.y2 // size
+        if self.bounds is not None:
+            bx0, by0, bx1, by1 = self.bounds
+            x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        self.bounds = (x0, y0, x1, y1)
+            
+    def intersects(self, room):
+        buckets = self.buckets
+        for bucket in self._bucket_range(room):
+            for other in buckets.get(bucket, ()):
+                if room.intersects(other):
+                    return True
+        return False
+        
+    def nearest(self, x, y):
+        # Room whose centre is closest to tile (x, y), searching rings of
+        # buckets outwards. A centre in ring r is at least (r - 1) bucket
+        # sizes away, so the search stops once that exceeds the best found.
+        if self.bounds is None:
+            return None
+        size = self.bucket_size
+        buckets = self.buckets
+        cx, cy = x // size, y // size
+        bx0, by0, bx1, by1 = self.bounds
+        last_ring = max(cx - bx0, bx1 - cx, cy - by0, by1 - cy)
+        best, best_distance = None, None
+        for ring in range(last_ring + 1):
+            if best is not None and ((ring - 1) * size) ** 2 > best_distance:
+                break
+            for bx in range(cx - ring, cx + ring + 1):
+                step = 1 if bx in (cx - ring, cx + ring) else 2 * ring
+                for by in range(cy - ring, cy + ring + 1, max(step, 1)):
+                    for room in buckets.get((bx, by), ()):
+                        distance = (room.center_x - x) ** 2 + (room.center_y - y) ** 2
+                        if best is None or distance < best_distance:
+                            best, best_distance = room, distance
+        return best
+
 class GameMap:
-    def __init__(self, width, height):
+    def __init__(self, width, height, tiles=None, rooms=None):
         self.width = width
         self.height = height
-        self.tiles = [[True for y in range(height)] for x in range(width)]  # True = wall
-        self.visible = [[False for y in range(height)] for x in range(width)]
-        self.explored = [[False for y in range(height)] for x in range(width)]
+        # Grids are indexed [x, y]; True = wall
+        self.tiles = np.ones((width, height), dtype=bool) if tiles is None else tiles
+        self.visible = np.zeros((width, height), dtype=bool)
+        self.explored = np.zeros((width, height), dtype=bool)
+        self.rooms = [] if rooms is None else rooms
+        self._init_view()
+        
+    def _init_view(self):
+        # Sparse copy of `visible` as a set of (x, y) tiles
+        self.visible_tiles = frozenset()
+        self.fov = FieldOfView(self)
+        self.fov_origin = None
+        
+        # Called with the tiles whose visibility changed on each FOV update
+        self.fov_listeners = []
+        self.renderer = MapRenderer(self)
+        
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
         
     def is_wall(self, x, y):
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.tiles[x][y]
+            return self.tiles.item(x, y)
         return True
         
     def compute_fov(self, x, y, radius):
-        # Reset visibility
-        for i in range(self.width):
-            for j in range(self.height):
-                self.visible[i][j] = False
-                
-        # Ray casting in all directions
-        for angle in range(0, 360, 5):  # Cast a ray every 5 degrees
-            self._cast_ray(x, y, angle, radius)
-            
-    def _cast_ray(self, start_x, start_y, angle, max_distance):
-        import math
+        # Only recompute when the origin tile or radius changes
+        if (x, y, radius) == self.fov_origin:
+            return
+        self.show_fov((x, y, radius), self.fov.compute(x, y, radius))
         
-        # Convert angle to radians
-        rad = math.radians(angle)
+    def show_fov(self, origin, visible):
+        # Make `visible`, a set of (x, y) tiles, the view from origin;
+        # replicas of a map apply views computed elsewhere through this
+        self.fov_origin = origin
         
-        # Calculate direction vector
-        dx = math.cos(rad)
-        dy = math.sin(rad)
+        # Clear the previous visible set only, not the whole grid
+        if self.visible_tiles:
+            xs, ys = zip(*self.visible_tiles)
+            self.set_visible(np.array(xs), np.array(ys), False)
+        changed = self.visible_tiles ^ visible
+        self.visible_tiles = visible
+        if visible:
+            xs, ys = zip(*visible)
+            self.set_visible(np.array(xs), np.array(ys), True)
+        for listener in self.fov_listeners:
+            listener(changed)
+            
+    def set_visible(self, xs, ys, visible):
+        # Visible tiles also become explored
+        self.visible[xs, ys] = visible
+        if visible:
+            self.explored[xs, ys] = True
+            
+    def region(self, x0, y0, x1, y1):
+        # (tiles, explored, visible) views clipped to the map
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        area = (slice(x0, max(x0, x1)), slice(y0, max(y0, y1)))
+        return self.tiles[area], self.explored[area], self.visible[area]
         
-        # Start position (in tile coordinates)
-        x = float(start_x)
-        y = float(start_y)
+    def wall_window(self, x0, y0, x1, y1):
+        # Dense copy of tiles[x0:x1, y0:y1]; out-of-bounds tiles are walls
+        window = np.ones((x1 - x0, y1 - y0), dtype=bool)
+        tiles = self.region(x0, y0, x1, y1)[0]
+        ox, oy = max(0, -x0), max(0, -y0)
+        window[ox:ox + tiles.shape[0], oy:oy + tiles.shape[1]] = tiles
+        return window
         
-        # Mark starting position as visible
-        self.visible[int(x)][int(y)] = True
-        self.explored[int(x)][int(y)] = True
+    def walls_at(self, xs, ys):
+        # Vectorized is_wall for coordinate arrays
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        walls = np.ones(xs.shape, dtype=bool)
+        walls[inside] = self.tiles[xs[inside], ys[inside]]
+        return walls
         
-        # Cast the ray
-        for distance in range(max_distance):
-            # Move along the ray
-            x += dx
-            y += dy
-            
-            # Convert to integer coordinates
-            tile_x = int(x)
-            tile_y = int(y)
-            
-            # Stop if out of bounds
-            if not (0 <= tile_x < self.width and 0 <= tile_y < self.height):
-                break
-                
-            # Mark tile as visible and explored
-            self.visible[tile_x][tile_y] = True
-            self.explored[tile_x][tile_y] = True
-            
-            # Stop at walls
-            if self.tiles[tile_x][tile_y]:
-                break
+    def tile_states(self, xs, ys):
+        # (tiles, explored, visible) for arrays of in-bounds coordinates
+        return self.tiles[xs, ys], self.explored[xs, ys], self.visible[xs, ys]
         
     def draw(self, screen, camera):
-        # Calculate visible range based on camera position
-        start_x = max(0, camera.x // TILE_SIZE)
-        end_x = min(self.width, (camera.x + WINDOW_WIDTH) // TILE_SIZE + 1)
-        start_y = max(0, camera.y // TILE_SIZE)
-        end_y = min(self.height, (camera.y + WINDOW_HEIGHT) // TILE_SIZE + 1)
-        
-        # Only draw explored tiles
-        for x in range(start_x, end_x):
-            for y in range(start_y, end_y):
-                if self.explored[x][y]:
-                    if self.tiles[x][y]:  # Wall
-                        color = VISIBLE_COLOR if self.visible[x][y] else UNSEEN_COLOR
-                        pygame.draw.rect(screen, color,
-                                       (x * TILE_SIZE - camera.x,
-                                        y * TILE_SIZE - camera.y,
-                                        TILE_SIZE, TILE_SIZE))
+        self.renderer.draw(screen, camera)
 
 class MapGenerator:
-    def __init__(self):
-        self.game_map = GameMap(MAP_WIDTH, MAP_HEIGHT)
-        self.rooms = []
+    # Part of params, so cached maps from older generator code aren't
+    # served; bumped whenever the same seed gives a different map
+    VERSION = 2
+
+    def __init__(self, seed=None, width=MAP_WIDTH, height=MAP_HEIGHT,
+                 max_rooms=None, room_min_size=ROOM_MIN_SIZE,
+                 room_max_size=ROOM_MAX_SIZE, room_attempts=ROOM_ATTEMPTS):
+        # Each generator owns its RNG so a seed reproduces the same map.
+        # max_rooms defaults to one room per ROOM_AREA tiles.
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.width = width
+        self.height = height
+        self.max_rooms = max(1, width * height // ROOM_AREA) if max_rooms is None else max_rooms
+        self.room_attempts = room_attempts
+        self.room_min_size = room_min_size
+        self.room_max_size = room_max_size
+        
+        self.game_map = GameMap(width, height)
+        self.rooms = self.game_map.rooms
+        
+    @property
+    def params(self):
+        # Everything besides the seed that shapes the generated map
+        return {
+            'version': self.VERSION,
+            'width': self.width,
+            'height': self.height,
+            'max_rooms': self.max_rooms,
+            'room_attempts': self.room_attempts,
+            'room_min_size': self.room_min_size,
+            'room_max_size': self.room_max_size,
+        }
         
     def create_room(self, room):
         # Set tiles in room area to floor (False)
-        for x in range(room.x1 + 1, room.x2):
-            for y in range(room.y1 + 1, room.y2):
-                self.game_map.tiles[x][y] = False
+        self.game_map.tiles[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = False
                 
     def create_tunnel(self, start, end):
         x1, y1 = start
         x2, y2 = end
         
         # Horizontal tunnel
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            self.game_map.tiles[x][y1] = False
+        self.game_map.tiles[min(x1, x2):max(x1, x2) + 1, y1] = False
             
         # Vertical tunnel
-        for y in range(min(y1, y2), max(y1, y2) + 1):
-            self.game_map.tiles[x2][y] = False
+        self.game_map.tiles[x2, min(y1, y2):max(y1, y2) + 1] = False
             
     def generate(self):
-        for _ in range(MAX_ROOMS):
-            width = random.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-            height = random.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-            x = random.randint(0, MAP_WIDTH - width - 1)
-            y = random.randint(0, MAP_HEIGHT - height - 1)
+        rng = self.rng
+        room_index = RoomIndex(self.room_max_size + 1)
+        for _ in range(self.room_attempts * self.max_rooms):
+            if len(self.rooms) == self.max_rooms:
+                break
+            width = rng.randint(self.room_min_size, self.room_max_size)
+            height = rng.randint(self.room_min_size, self.room_max_size)
+            x = rng.randint(0, self.width - width - 1)
+            y = rng.randint(0, self.height - height - 1)
             
             new_room = Rect(x, y, width, height)
             
-            if not any(new_room.intersects(other) for other in self.rooms):
+            if not room_index.intersects(new_room):
                 self.create_room(new_room)
                 
-                if self.rooms:  # Connect to previous room
-                    prev_room = self.rooms[-1]
-                    self.create_tunnel(prev_room.center, new_room.center)
+                # Connect to the nearest room so far, which keeps corridors
+                # short however large the map
+                nearest = room_index.nearest(*new_room.center)
+                if nearest is not None:
+                    self.create_tunnel(nearest.center, new_room.center)
                     
+                room_index.add(new_room)
                 self.rooms.append(new_room)
                 
         return self.game_map
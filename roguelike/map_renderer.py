@@ -0,0 +1,101 @@
+import pygame
+import numpy as np
+from collections import OrderedDict
+from .constants import *
+from .lighting import LIGHT_CODES, light_palette
+
+# Colour index per tile: 0 = not drawn, 1 = explored wall, 2 = visible wall
+PALETTE = np.array([BLACK, UNSEEN_COLOR, VISIBLE_COLOR], dtype=np.uint8)
+LIT_PALETTE = light_palette()
+
+def color_codes(tiles, explored, visible, light=None):
+    walls = explored & tiles
+    if light is None:
+        return walls.astype(np.uint8) + (walls & visible)
+    # Lit maps: visible walls and floors are tinted by their light code
+    codes = walls.astype(np.uint16)
+    codes[visible] = 2 + light[visible] + np.where(tiles[visible], 0, LIGHT_CODES)
+    return codes
+
+class MapRenderer:
+    def __init__(self, game_map, chunk_size=MAP_CHUNK_SIZE,
+                 max_chunks=MAP_RENDER_CACHE_CHUNKS):
+        self.game_map = game_map
+        self.chunk_size = chunk_size
+        self.chunk_px = chunk_size * TILE_SIZE
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()  # (cx, cy) -> Surface, in LRU order
+        self.dirty = set()           # tiles changed since the last draw
+        self.light_map = None        # set by a LightMap lighting this map
+        game_map.fov_listeners.append(self.dirty.update)
+
+    @property
+    def palette(self):
+        return PALETTE if self.light_map is None else LIT_PALETTE
+
+    def invalidate(self):
+        # Drop every cached chunk, e.g. after walls change
+        self.chunks.clear()
+        self.dirty.clear()
+
+    def _build_chunk(self, cx, cy):
+        x0 = cx * self.chunk_size
+        y0 = cy * self.chunk_size
+        x1 = x0 + self.chunk_size
+        y1 = y0 + self.chunk_size
+        light = None if self.light_map is None else self.light_map.codes[x0:x1, y0:y1]
+        codes = color_codes(*self.game_map.region(x0, y0, x1, y1), light)
+        pixels = self.palette[codes].repeat(TILE_SIZE, axis=0).repeat(TILE_SIZE, axis=1)
+
+        surface = pygame.Surface((self.chunk_px, self.chunk_px))
+        surface.fill(BLACK)
+        if pixels.size:
+            target = surface.subsurface((0, 0, pixels.shape[0], pixels.shape[1]))
+            pygame.surfarray.blit_array(target, pixels)
+        return surface
+
+    def _flush_dirty(self):
+        # Repaint changed tiles, but only in chunks that are already cached
+        if not self.dirty:
+            return
+        chunk_size = self.chunk_size
+        xs, ys = np.array(list(self.dirty)).T
+        self.dirty.clear()
+        light = None if self.light_map is None else self.light_map.codes[xs, ys]
+        codes = color_codes(*self.game_map.tile_states(xs, ys), light)
+        palette = self.palette
+        for x, y, code in zip(xs.tolist(), ys.tolist(), codes.tolist()):
+            surface = self.chunks.get((x // chunk_size, y // chunk_size))
+            if surface is not None:
+                surface.fill(palette[code],
+                             ((x % chunk_size) * TILE_SIZE,
+                              (y % chunk_size) * TILE_SIZE,
+                              TILE_SIZE, TILE_SIZE))
+
+    def draw(self, screen, camera):
+        self._flush_dirty()
+
+        chunk_px = self.chunk_px
+        start_cx = max(0, camera.x // chunk_px)
+        end_cx = min((self.game_map.width - 1) // self.chunk_size,
+                     (camera.x + WINDOW_WIDTH) // chunk_px)
+        start_cy = max(0, camera.y // chunk_px)
+        end_cy = min((self.game_map.height - 1) // self.chunk_size,
+                     (camera.y + WINDOW_HEIGHT) // chunk_px)
+
+        blits = []
+        for cx in range(start_cx, end_cx + 1):
+            for cy in range(start_cy, end_cy + 1):
+                key = (cx, cy)
+                surface = self.chunks.get(key)
+                if surface is None:
+                    surface = self.chunks[key] = self._build_chunk(cx, cy)
+                else:
+                    self.chunks.move_to_end(key)
+                blits.append((surface, (cx * chunk_px - camera.x,
+                                        cy * chunk_px - camera.y)))
+        screen.blits(blits, doreturn=False)
+
+        # Evict the least recently drawn chunks
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
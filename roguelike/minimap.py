@@ -0,0 +1,100 @@
+import pygame
+import numpy as np
+from .constants import *
+
+# Colour per minimap code; a pixel covering several tiles takes the highest
+# code among them: 0 = unexplored, 1 = explored floor, 2 = explored wall,
+# 3 = visible floor, 4 = visible wall
+MINIMAP_PALETTE = np.array([BLACK, MINIMAP_FLOOR_COLOR, MINIMAP_WALL_COLOR,
+                            MINIMAP_VISIBLE_FLOOR_COLOR, VISIBLE_COLOR], dtype=np.uint8)
+
+class Minimap:
+    # Overview of the explored map. One pixel covers a `scale` x `scale`
+    # block of tiles; only blocks with tiles whose visibility changed are
+    # repainted, in bulk through surfarray. Maps larger than
+    # MINIMAP_MAX_TILES per side are shown as a window around the player.
+    def __init__(self, game_map, size=MINIMAP_SIZE):
+        self.game_map = game_map
+        self.window = min(max(game_map.width, game_map.height), MINIMAP_MAX_TILES)
+        self.scale = -(-self.window // size)
+        self.blocks = -(-self.window // self.scale)
+        self.base = pygame.Surface((self.blocks, self.blocks))
+        zoom = max(1, size // self.blocks)
+        self.display_size = (self.blocks * zoom, self.blocks * zoom)
+        self.display = None
+        self.origin = None  # top-left tile of the window
+        self.dirty = set()  # tiles changed since the last draw
+        game_map.fov_listeners.append(self.dirty.update)
+
+    def _recenter(self, tile_x, tile_y):
+        # Move the window when the player nears its edge; a no-op for maps
+        # that fit entirely
+        game_map = self.game_map
+        if self.window >= max(game_map.width, game_map.height):
+            origin = (0, 0)
+        else:
+            if self.origin is not None:
+                x0, y0 = self.origin
+                margin = self.window // 4
+                if (x0 + margin <= tile_x < x0 + self.window - margin and
+                        y0 + margin <= tile_y < y0 + self.window - margin):
+                    return False
+            # Block-aligned so a block always covers the same tiles
+            origin = tuple((max(0, t - self.window // 2) // self.scale) * self.scale
+                           for t in (tile_x, tile_y))
+        if origin == self.origin:
+            return False
+        self.origin = origin
+        return True
+
+    def _repaint(self, block_x, block_y):
+        # Recompute the given blocks (window-relative) from the map
+        scale = self.scale
+        game_map = self.game_map
+        offsets = np.arange(scale)
+        xs = (self.origin[0] + block_x[:, None, None] * scale + offsets[None, :, None])
+        ys = (self.origin[1] + block_y[:, None, None] * scale + offsets[None, None, :])
+        xs, ys = np.broadcast_arrays(xs, ys)
+        xs = np.clip(xs, 0, game_map.width - 1).ravel()
+        ys = np.clip(ys, 0, game_map.height - 1).ravel()
+        tiles, explored, visible = game_map.tile_states(xs, ys)
+        codes = explored * (1 + tiles.astype(np.uint8) + 2 * visible)
+        codes = codes.reshape(len(block_x), -1).max(axis=1)
+
+        pixels = pygame.surfarray.pixels3d(self.base)
+        pixels[block_x, block_y] = MINIMAP_PALETTE[codes]
+        del pixels  # unlock the surface
+
+    def update(self, tile_x, tile_y):
+        if self._recenter(tile_x, tile_y):
+            self.dirty.clear()
+            blocks = np.arange(self.blocks)
+            block_x, block_y = np.meshgrid(blocks, blocks, indexing='ij')
+            self._repaint(block_x.ravel(), block_y.ravel())
+        elif self.dirty:
+            xs, ys = np.array(list(self.dirty)).T
+            self.dirty.clear()
+            block_x = (xs - self.origin[0]) // self.scale
+            block_y = (ys - self.origin[1]) // self.scale
+            inside = ((block_x >= 0) & (block_x < self.blocks) &
+                      (block_y >= 0) & (block_y < self.blocks))
+            keys = np.unique(block_x[inside] * self.blocks + block_y[inside])
+            if not keys.size:
+                return
+            self._repaint(keys // self.blocks, keys % self.blocks)
+        else:
+            return
+        self.display = pygame.transform.scale(self.base, self.display_size)
+
+    def draw(self, screen, tile_x, tile_y):
+        self.update(tile_x, tile_y)
+        left = WINDOW_WIDTH - self.display_size[0] - MINIMAP_MARGIN
+        screen.blit(self.display, (left, MINIMAP_MARGIN))
+        pygame.draw.rect(screen, GRAY, (left - 1, MINIMAP_MARGIN - 1,
+                                        self.display_size[0] + 2, self.display_size[1] + 2), 1)
+
+        # Player marker
+        zoom = self.display_size[0] / self.blocks
+        marker_x = left + int((tile_x - self.origin[0]) / self.scale * zoom)
+        marker_y = MINIMAP_MARGIN + int((tile_y - self.origin[1]) / self.scale * zoom)
+        screen.fill(BLUE, (marker_x - 1, marker_y - 1, max(3, int(zoom)), max(3, int(zoom))))
@@ -0,0 +1,344 @@
+import pygame
+import numpy as np
+from .constants import *
+from .entities import Monster, MONSTER_TYPE_NAMES
+from .spatial_hash import PointGrid, SpatialHash
+from .particles import EffectLog, EFFECT_HIT, EFFECT_DEATH, EFFECT_SPAWN
+
+TYPE_HP = np.array([MONSTER_TYPES[name]['hp'] for name in MONSTER_TYPE_NAMES],
+                   dtype=np.int32)
+TYPE_DAMAGE = np.array([MONSTER_TYPES[name]['damage'] for name in MONSTER_TYPE_NAMES],
+                       dtype=np.int32)
+TYPE_SPEED = np.array([MONSTER_TYPES[name]['speed'] for name in MONSTER_TYPE_NAMES],
+                      dtype=np.float32)
+
+class StorePositions:
+    # Read-only slot -> (x, y) mapping handed to the spatial hash
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, index):
+        return (self.store.x.item(index), self.store.y.item(index))
+
+class MonsterStore:
+    # Structure-of-arrays monster storage. Each monster is a stable slot
+    # index into parallel arrays; positions are pixel centers. Dead slots
+    # are recycled through a free list.
+    FIELDS = {
+        'x': np.float32,
+        'y': np.float32,
+        'hp': np.int32,
+        'max_hp': np.int32,
+        'speed': np.float32,
+        'damage': np.int32,
+        'last_attack': np.int64,
+        'type_id': np.int8,
+        'alive': bool,
+        'cell_x': np.int32,
+        'cell_y': np.int32,
+    }
+
+    def __init__(self, capacity=MONSTER_STORE_CAPACITY):
+        self.capacity = 0
+        self.size = 0    # slots in use or freed, i.e. the high-water mark
+        self.count = 0   # live monsters
+        self.free = []
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._grow(capacity)
+
+        self.spatial_hash = SpatialHash(positions=StorePositions(self))
+        self.images = {}  # type_id -> Surface shared by every monster of a type
+        self.effects = EffectLog()  # hits, deaths and spawns for the renderer
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in self.alive_indices().tolist():
+            yield Monster(self, index)
+
+    def _grow(self, capacity):
+        for name, dtype in self.FIELDS.items():
+            grown = np.zeros(capacity, dtype=dtype)
+            grown[:self.capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def state(self):
+        # Copies of the used part of every field, plus the free list
+        state = {name: getattr(self, name)[:self.size].copy() for name in self.FIELDS}
+        state['free'] = np.array(self.free, dtype=np.int64)
+        return state
+
+    def restore(self, state):
+        # Replace the store's contents with arrays from state()
+        size = len(state['alive'])
+        capacity = MONSTER_STORE_CAPACITY
+        while capacity < size:
+            capacity *= 2
+        self.capacity = 0
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._grow(capacity)
+        for name in self.FIELDS:
+            getattr(self, name)[:size] = state[name]
+        self.size = size
+        self.free = state['free'].tolist()
+        self.count = int(self.alive[:size].sum())
+
+        self.spatial_hash = SpatialHash(positions=StorePositions(self))
+        insert = self.spatial_hash.insert
+        indices = self.alive_indices()
+        for index, x, y in zip(indices.tolist(), self.x[indices].tolist(),
+                               self.y[indices].tolist()):
+            insert(index, x, y)
+
+    def handle(self, index):
+        return Monster(self, index)
+
+    def alive_indices(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def image(self, type_id):
+        surface = self.images.get(type_id)
+        if surface is None:
+            surface = pygame.Surface((TILE_SIZE, TILE_SIZE))
+            surface.fill(MONSTER_TYPES[MONSTER_TYPE_NAMES[type_id]]['color'])
+            self.images[type_id] = surface
+        return surface
+
+    def spawn(self, x, y, monster_type='goblin'):
+        # (x, y) is the top-left pixel, as for the player
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow(self.capacity * 2)
+            index = self.size
+            self.size += 1
+
+        type_id = MONSTER_TYPE_NAMES.index(monster_type)
+        self.x[index] = x + TILE_SIZE / 2
+        self.y[index] = y + TILE_SIZE / 2
+        self.hp[index] = self.max_hp[index] = TYPE_HP[type_id]
+        self.speed[index] = TYPE_SPEED[type_id]
+        self.damage[index] = TYPE_DAMAGE[type_id]
+        self.last_attack[index] = 0
+        self.type_id[index] = type_id
+        self.alive[index] = True
+        self.cell_x[index], self.cell_y[index] = self.spatial_hash._cell(
+            self.x[index], self.y[index])
+        self.spatial_hash.insert(index, self.x[index], self.y[index])
+        self.count += 1
+        self.effects.add(EFFECT_SPAWN, self.x[index], self.y[index], type_id)
+        return Monster(self, index)
+
+    def spawn_many(self, xs, ys, type_ids):
+        # Vectorized spawn of many monsters at top-left pixels (xs, ys);
+        # returns the slot indices. Freed slots are reused first.
+        count = len(type_ids)
+        reused = min(count, len(self.free))
+        slots = self.free[len(self.free) - reused:][::-1]
+        del self.free[len(self.free) - reused:]
+        new = count - reused
+        if self.size + new > self.capacity:
+            capacity = self.capacity
+            while capacity < self.size + new:
+                capacity *= 2
+            self._grow(capacity)
+        indices = np.concatenate([np.array(slots, dtype=np.intp),
+                                  np.arange(self.size, self.size + new)])
+        self.size += new
+
+        type_ids = np.asarray(type_ids, dtype=np.intp)
+        self.x[indices] = np.asarray(xs) + TILE_SIZE / 2
+        self.y[indices] = np.asarray(ys) + TILE_SIZE / 2
+        self.hp[indices] = self.max_hp[indices] = TYPE_HP[type_ids]
+        self.speed[indices] = TYPE_SPEED[type_ids]
+        self.damage[indices] = TYPE_DAMAGE[type_ids]
+        self.last_attack[indices] = 0
+        self.type_id[indices] = type_ids
+        self.alive[indices] = True
+        cell_size = self.spatial_hash.cell_size
+        self.cell_x[indices] = self.x[indices] // cell_size
+        self.cell_y[indices] = self.y[indices] // cell_size
+        insert = self.spatial_hash.insert
+        for index, x, y in zip(indices.tolist(), self.x[indices].tolist(),
+                               self.y[indices].tolist()):
+            insert(index, x, y)
+        self.count += count
+        self.effects.add(EFFECT_SPAWN, self.x[indices], self.y[indices], type_ids)
+        return indices
+
+    def kill(self, index):
+        self.alive[index] = False
+        self.spatial_hash.remove(index)
+        self.free.append(index)
+        self.count -= 1
+
+    def despawn_unloaded(self, game_map):
+        # Drop monsters standing in chunks a streamed map has evicted
+        indices = self.alive_indices()
+        tile_x = (self.x[indices] // TILE_SIZE).astype(np.intp)
+        tile_y = (self.y[indices] // TILE_SIZE).astype(np.intp)
+        for index in indices[~game_map.loaded_at(tile_x, tile_y)].tolist():
+            self.kill(index)
+
+    def damage_monster(self, index, amount):
+        self.hp[index] -= amount
+        died = self.hp[index] <= 0
+        self.effects.add(EFFECT_DEATH if died else EFFECT_HIT, self.x[index], self.y[index],
+                         self.type_id[index])
+        if died:
+            self.kill(index)
+            return True  # Monster died
+        return False
+
+    def damage_in_rect(self, rect, amount):
+        # Damage every monster whose body overlaps rect, e.g. a player's
+        # attack area; returns the number killed. Candidates are monsters
+        # whose center could put them in the rect.
+        kills = 0
+        for index in self.spatial_hash.query_rect(rect.inflate(TILE_SIZE, TILE_SIZE)):
+            if rect.colliderect(self.handle(index).rect):
+                kills += self.damage_monster(index, amount)
+        return kills
+
+    def damage_many(self, indices, amounts):
+        # Vectorized damage_monster; indices may repeat, their damage adds
+        # up. Returns the number of monsters killed.
+        if not len(indices):
+            return 0
+        np.subtract.at(self.hp, indices, amounts)
+        hit = np.unique(indices)
+        died = self.hp[hit] <= 0
+        dead = hit[died]
+        for kind, group in ((EFFECT_HIT, hit[~died]), (EFFECT_DEATH, dead)):
+            self.effects.add(kind, self.x[group], self.y[group], self.type_id[group])
+        for index in dead.tolist():
+            self.kill(index)
+        return len(dead)
+
+    def update(self, player, game_map, flow_field, now, scheduler=None):
+        # Runs the monsters the scheduler picks (all of them without one)
+        # and returns their slot indices. Everything works on compact index
+        # arrays, so the cost follows the monsters updated rather than the
+        # size of the store.
+        if not self.count:
+            return np.zeros(0, dtype=np.intp)
+        player_x, player_y = player.rect.center
+
+        # Monsters that think this tick and how far their steps are scaled
+        if scheduler is None:
+            active = self.alive_indices()
+            scales = 1
+        else:
+            active, scales = scheduler.schedule(self, player, game_map)
+        scales = np.broadcast_to(np.asarray(scales, dtype=np.float32), active.shape)
+
+        # Attack: everyone in range whose cooldown has elapsed
+        in_range = np.array(self.spatial_hash.query_radius(player_x, player_y,
+                                                           MONSTER_ATTACK_RANGE), dtype=np.intp)
+        attackers = in_range[now - self.last_attack[in_range] >= MONSTER_ATTACK_COOLDOWN]
+        if attackers.size:
+            player.hp -= int(self.damage[attackers].sum())
+            self.last_attack[attackers] = now
+
+        # Move everyone else along the flow field, or straight at the player
+        moving = scales > 0
+        if in_range.size:
+            moving &= ~np.isin(active, in_range)
+        movers = active[moving]
+        if movers.size:
+            x = self.x[movers]
+            y = self.y[movers]
+            tile_x = (x // TILE_SIZE).astype(np.intp)
+            tile_y = (y // TILE_SIZE).astype(np.intp)
+            step_x, step_y, has_step = flow_field.steps_at(tile_x, tile_y)
+            dx = np.where(has_step, (tile_x + step_x + 0.5) * TILE_SIZE, player_x) - x
+            dy = np.where(has_step, (tile_y + step_y + 0.5) * TILE_SIZE, player_y) - y
+            distance = np.hypot(dx, dy)
+            step = np.minimum(self.speed[movers] * scales[moving], AI_MAX_STEP)
+            scale = np.divide(step, distance,
+                              out=np.zeros_like(distance), where=distance > 0)
+            self.move(movers, dx * scale, dy * scale, game_map)
+
+        self.separate(game_map, active)
+        self.sync_spatial_hash(active)
+        return active
+
+    def move(self, indices, dx, dy, game_map):
+        # Axis-separated movement against the tile grid, like the player
+        x = self.x[indices]
+        y = self.y[indices]
+        new_x = x + dx
+        blocked = game_map.walls_at((new_x // TILE_SIZE).astype(np.intp),
+                                    (y // TILE_SIZE).astype(np.intp))
+        x = np.where(blocked, x, new_x)
+        new_y = y + dy
+        blocked = game_map.walls_at((x // TILE_SIZE).astype(np.intp),
+                                    (new_y // TILE_SIZE).astype(np.intp))
+        y = np.where(blocked, y, new_y)
+        self.x[indices] = x
+        self.y[indices] = y
+
+    def sync_spatial_hash(self, indices=None):
+        # Only monsters that crossed a cell boundary touch the spatial hash
+        if indices is None:
+            indices = self.alive_indices()
+        cell_size = self.spatial_hash.cell_size
+        cell_x = (self.x[indices] // cell_size).astype(np.int32)
+        cell_y = (self.y[indices] // cell_size).astype(np.int32)
+        changed = (cell_x != self.cell_x[indices]) | (cell_y != self.cell_y[indices])
+        moved = indices[changed]
+        cell_x = cell_x[changed]
+        cell_y = cell_y[changed]
+        self.cell_x[moved] = cell_x
+        self.cell_y[moved] = cell_y
+        move_to_cell = self.spatial_hash.move_to_cell
+        for index, cell in zip(moved.tolist(), zip(cell_x.tolist(), cell_y.tolist())):
+            move_to_cell(index, cell)
+
+    def separate(self, game_map, indices=None):
+        # Push overlapping monsters apart: each pair closer than the
+        # separation radius moves apart by half the overlap each, summed
+        # over a monster's pairs. Candidate pairs come from a PointGrid with
+        # radius-sized cells, so only neighbouring cells are compared.
+        radius = MONSTER_SEPARATION_RADIUS
+        if indices is None:
+            indices = self.alive_indices()
+        if indices.size < 2:
+            return
+        x = self.x[indices].astype(np.float64)
+        y = self.y[indices].astype(np.float64)
+        first, second = PointGrid(x, y, radius).pairs(radius)
+        dx = x[first] - x[second]
+        dy = y[first] - y[second]
+        close = dx * dx + dy * dy < radius * radius
+        if not close.any():
+            return
+        first, second, dx, dy = first[close], second[close], dx[close], dy[close]
+        distance = np.hypot(dx, dy)
+
+        # Monsters on the exact same spot split along x
+        overlap = (radius - distance) / 2
+        stacked = distance == 0
+        dx[stacked] = 1
+        distance[stacked] = 1
+        push_x = dx / distance * overlap
+        push_y = dy / distance * overlap
+        total_x = np.zeros(len(indices))
+        total_y = np.zeros(len(indices))
+        np.add.at(total_x, first, push_x)
+        np.add.at(total_x, second, -push_x)
+        np.add.at(total_y, first, push_y)
+        np.add.at(total_y, second, -push_y)
+        pushed = np.flatnonzero((total_x != 0) | (total_y != 0))
+        self.move(indices[pushed], total_x[pushed], total_y[pushed], game_map)
+
+    def visible_indices(self, game_map):
+        indices = self.alive_indices()
+        tile_x = (self.x[indices] // TILE_SIZE).astype(np.intp)
+        tile_y = (self.y[indices] // TILE_SIZE).astype(np.intp)
+        return indices[game_map.tile_states(tile_x, tile_y)[2]]
@@ -0,0 +1,235 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import time
+import numpy as np
+import pygame
+from .constants import *
+from .entities import MONSTER_TYPE_NAMES
+
+# Something that happened to a monster this tick, for the renderer to
+# turn into particles. kind indexes EFFECT_NAMES.
+EFFECT = np.dtype([('kind', 'i1'), ('x', '<f4'), ('y', '<f4'), ('type_id', 'i1')])
+EFFECT_NAMES = list(PARTICLE_EFFECTS)
+EFFECT_HIT = EFFECT_NAMES.index('hit')
+EFFECT_DEATH = EFFECT_NAMES.index('death')
+EFFECT_SPAWN = EFFECT_NAMES.index('spawn')
+NO_EFFECTS = np.zeros(0, dtype=EFFECT)
+
+BURST_COUNT = np.array([PARTICLE_EFFECTS[name]['count'] for name in EFFECT_NAMES],
+                       dtype=np.intp)
+SPEED_RANGE = np.array([PARTICLE_EFFECTS[name]['speed'] for name in EFFECT_NAMES],
+                       dtype=np.float32)
+LIFETIME_RANGE = np.array([PARTICLE_EFFECTS[name]['lifetime'] for name in EFFECT_NAMES],
+                          dtype=np.float32)
+
+# Particle colors: one per effect with a color of its own, then one per
+# monster type. EFFECT_COLOR is an effect's palette entry, or -1 to use
+# the monster's.
+PALETTE = []
+EFFECT_COLOR = []
+for name in EFFECT_NAMES:
+    color = PARTICLE_EFFECTS[name]['color']
+    EFFECT_COLOR.append(-1 if color is None else len(PALETTE))
+    if color is not None:
+        PALETTE.append(color)
+EFFECT_COLOR = np.array(EFFECT_COLOR, dtype=np.int16)
+MONSTER_COLORS = len(PALETTE)
+PALETTE += [MONSTER_TYPES[name]['color'] for name in MONSTER_TYPE_NAMES]
+
+class EffectLog:
+    # Fixed-size buffer of the effects since it was last drained. Effects
+    # past capacity are dropped, so a log nobody drains (the server, the
+    # headless environment) stays small.
+    def __init__(self, capacity=EFFECT_LOG_CAPACITY):
+        self.effects = np.zeros(capacity, dtype=EFFECT)
+        self.count = 0
+
+    def add(self, kind, xs, ys, type_ids):
+        xs = np.atleast_1d(xs)
+        count = min(len(xs), len(self.effects) - self.count)
+        if count <= 0:
+            return
+        added = self.effects[self.count:self.count + count]
+        added['kind'] = kind
+        added['x'] = xs[:count]
+        added['y'] = np.atleast_1d(ys)[:count]
+        added['type_id'] = np.broadcast_to(type_ids, xs.shape)[:count]
+        self.count += count
+
+    def drain(self):
+        effects = self.effects[:self.count].copy()
+        self.count = 0
+        return effects
+
+def _sprites():
+    # One square per palette color and fade level, brightest first
+    sprites = []
+    for color in PALETTE:
+        for level in range(PARTICLE_FADE_STEPS):
+            scale = 1 - level / PARTICLE_FADE_STEPS
+            sprite = pygame.Surface((PARTICLE_SIZE, PARTICLE_SIZE))
+            sprite.fill(tuple(int(channel * scale) for channel in color))
+            sprites.append(sprite)
+    return sprites
+
+class ParticleSystem:
+    # A fixed pool of particles in parallel arrays. Live particles are kept
+    # packed at the front, so moving, aging and culling are a few array
+    # operations over [:count] and dead ones are squeezed out in one pass;
+    # nothing refers to a particle by slot, so unlike the monster and
+    # projectile stores there is no free list to keep.
+    FIELDS = {
+        'x': np.float32,
+        'y': np.float32,
+        'vx': np.float32,
+        'vy': np.float32,
+        'age': np.float32,
+        'lifetime': np.float32,
+        'color': np.int16,
+    }
+
+    def __init__(self, capacity=PARTICLE_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.count = 0
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        # Particles are only drawn, so their randomness is kept apart from
+        # the simulation's
+        self.rng = np.random.default_rng(seed)
+        self.sprites = None  # built on first draw, once a display exists
+        self.blit_ms = 0.0  # running average cost of one particle's blit
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, effects, budget=PARTICLE_EMIT_BUDGET):
+        # A burst for each effect while the budget and the pool last; the
+        # effects that don't fit get no particles at all
+        if not len(effects):
+            return
+        counts = BURST_COUNT[effects['kind']]
+        room = min(budget, self.capacity - self.count)
+        fits = np.cumsum(counts) <= room
+        effects, counts = effects[fits], counts[fits]
+        total = int(counts.sum())
+        if not total:
+            return
+
+        source = np.repeat(np.arange(len(effects)), counts)
+        kinds = effects['kind'][source]
+        rng = self.rng
+        angle = rng.random(total, dtype=np.float32) * np.float32(2 * np.pi)
+        low, high = SPEED_RANGE[kinds, 0], SPEED_RANGE[kinds, 1]
+        speed = low + (high - low) * rng.random(total, dtype=np.float32)
+        low, high = LIFETIME_RANGE[kinds, 0], LIFETIME_RANGE[kinds, 1]
+
+        new = slice(self.count, self.count + total)
+        self.x[new] = effects['x'][source]
+        self.y[new] = effects['y'][source]
+        self.vx[new] = np.cos(angle) * speed
+        self.vy[new] = np.sin(angle) * speed
+        self.age[new] = 0
+        self.lifetime[new] = low + (high - low) * rng.random(total, dtype=np.float32)
+        color = EFFECT_COLOR[kinds]
+        self.color[new] = np.where(color >= 0, color,
+                                   MONSTER_COLORS + effects['type_id'][source])
+        self.count += total
+
+    def update(self, dt):
+        # Advance every particle dt milliseconds and drop the expired ones
+        count = self.count
+        if not count:
+            return
+        x, y, vx, vy = self.x[:count], self.y[:count], self.vx[:count], self.vy[:count]
+        x += vx * dt
+        y += vy * dt
+        drag = np.float32(PARTICLE_DRAG ** dt)
+        vx *= drag
+        vy *= drag
+        age = self.age[:count]
+        age += dt
+        alive = age < self.lifetime[:count]
+        if alive.all():
+            return
+        kept = int(alive.sum())
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:kept] = array[:count][alive]
+        self.count = kept
+
+    def draw(self, screen, camera, budget=PARTICLE_DRAW_BUDGET):
+        # Blit on-screen particles in one call. Past the budget, or more
+        # than PARTICLE_DRAW_MS of blitting at the measured rate, every
+        # n-th is drawn. Returns the number drawn.
+        if self.sprites is None:
+            self.sprites = _sprites()
+        count = self.count
+        offset = PARTICLE_SIZE // 2
+        xs = self.x[:count].astype(np.int32) - (camera.x + offset)
+        ys = self.y[:count].astype(np.int32) - (camera.y + offset)
+        width, height = screen.get_size()
+        shown = np.flatnonzero((xs > -PARTICLE_SIZE) & (xs < width) &
+                               (ys > -PARTICLE_SIZE) & (ys < height))
+        if self.blit_ms:
+            budget = min(budget, max(1, int(PARTICLE_DRAW_MS / self.blit_ms)))
+        if len(shown) > budget:
+            shown = shown[::-(-len(shown) // budget)]
+        level = (self.age[shown] * PARTICLE_FADE_STEPS / self.lifetime[shown]).astype(np.intp)
+        index = self.color[shown] * PARTICLE_FADE_STEPS + np.minimum(level,
+                                                                     PARTICLE_FADE_STEPS - 1)
+        start = time.perf_counter()
+        screen.blits(zip(map(self.sprites.__getitem__, index.tolist()),
+                         zip(xs[shown].tolist(), ys[shown].tolist())), doreturn=False)
+        if len(shown) >= 256:  # too few to time reliably
+            cost = (time.perf_counter() - start) * 1000 / len(shown)
+            self.blit_ms = cost if not self.blit_ms else 0.9 * self.blit_ms + 0.1 * cost
+        return len(shown)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time particle updates and drawing under a steady stream of effects")
+    parser.add_argument('--particles', type=int, default=30000, help="particles kept alive")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from .camera import Camera
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    camera = Camera()
+    camera.center_on(0, 0)
+    particles = ParticleSystem(capacity=max(PARTICLE_CAPACITY, args.particles), seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    updates, draws = [], []
+    drawn = 0
+    for _ in range(args.frames):
+        # Deaths all over the screen to top the pool back up
+        missing = (args.particles - len(particles)) // int(BURST_COUNT[EFFECT_DEATH])
+        if missing > 0:
+            effects = np.zeros(missing, dtype=EFFECT)
+            effects['kind'] = EFFECT_DEATH
+            effects['x'] = rng.uniform(-WINDOW_WIDTH / 2, WINDOW_WIDTH / 2, missing)
+            effects['y'] = rng.uniform(-WINDOW_HEIGHT / 2, WINDOW_HEIGHT / 2, missing)
+            effects['type_id'] = rng.integers(len(MONSTER_TYPE_NAMES), size=missing)
+            particles.emit(effects, budget=args.particles)
+        start = time.perf_counter()
+        particles.update(1000 / RENDER_FPS)
+        middle = time.perf_counter()
+        screen.fill(BLACK)
+        drawn = particles.draw(screen, camera)
+        end = time.perf_counter()
+        updates.append((middle - start) * 1000)
+        draws.append((end - middle) * 1000)
+    pygame.quit()
+    print(f"{len(particles)} particles ({drawn} drawn): update p50 "
+          f"{np.percentile(updates, 50):.2f} ms, draw p50 {np.percentile(draws, 50):.2f} ms, "
+          f"p99 {np.percentile(np.add(updates, draws), 99):.2f} ms")
+
+if __name__ == "__main__":
+    main()
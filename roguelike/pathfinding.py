@@ -0,0 +1,177 @@
+import numpy as np
+from .constants import *
+
+# Neighbour offsets; the first four are orthogonal, the rest diagonal
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1),
+              (1, 1), (1, -1), (-1, 1), (-1, -1))
+UNREACHED = np.iinfo(np.int32).max
+
+def _shift(grid, dx, dy, fill):
+    # out[x, y] = grid[x + dx, y + dy], padding with `fill`
+    out = np.full_like(grid, fill)
+    w, h = grid.shape
+    out[max(0, -dx):w - max(0, dx), max(0, -dy):h - max(0, dy)] = \
+        grid[max(0, dx):w - max(0, -dx), max(0, dy):h - max(0, -dy)]
+    return out
+
+class FlowField:
+    # Dijkstra map towards a target tile, shared by every monster. The field
+    # covers a window of FLOW_FIELD_RADIUS tiles around the target, clipped
+    # to the map, and is built as a vectorized BFS wavefront, optionally
+    # spread over frames.
+    def __init__(self, game_map, radius=FLOW_FIELD_RADIUS,
+                 steps_per_frame=FLOW_FIELD_STEPS_PER_FRAME):
+        self.game_map = game_map
+        self.radius = radius
+        self.steps_per_frame = steps_per_frame
+
+        # Completed field
+        self.target = None
+        self.origin = (0, 0)
+        self.distance = None
+        self.step_x = None
+        self.step_y = None
+
+        # Field being built
+        self._build = None
+        self._pending_target = None
+
+    def update(self, target_x, target_y):
+        target = (target_x, target_y)
+        if self._build is None:
+            if target != self.target:
+                self._start(target)
+        elif target != self._build['target']:
+            # Finish the current build first so a moving target can't starve it
+            self._pending_target = target
+
+        if self._build is not None:
+            self._advance(self.steps_per_frame)
+            if self._build is None and self._pending_target is not None:
+                target, self._pending_target = self._pending_target, None
+                if target != self.target:
+                    self._start(target)
+                    self._advance(self.steps_per_frame)
+
+    def _start(self, target):
+        x, y = target
+        game_map = self.game_map
+        x0, y0 = max(0, x - self.radius), max(0, y - self.radius)
+        x1 = max(x0 + 1, min(game_map.width, x + self.radius + 1))
+        y1 = max(y0 + 1, min(game_map.height, y + self.radius + 1))
+        floor = ~game_map.wall_window(x0, y0, x1, y1)
+
+        # Diagonal moves may not cut wall corners
+        diagonal_ok = [floor & _shift(floor, dx, 0, False) & _shift(floor, 0, dy, False)
+                       for dx, dy in DIRECTIONS[4:]]
+
+        distance = np.full(floor.shape, UNREACHED, dtype=np.int32)
+        frontier = np.zeros(floor.shape, dtype=bool)
+        local = (x - x0, y - y0)
+        if 0 <= local[0] < floor.shape[0] and 0 <= local[1] < floor.shape[1] and floor[local]:
+            distance[local] = 0
+            frontier[local] = True
+
+        # Neighbour views into a one-tile padded copy of the frontier
+        width, height = floor.shape
+        padded = np.zeros((width + 2, height + 2), dtype=bool)
+        views = [padded[1 + dx:width + 1 + dx, 1 + dy:height + 1 + dy]
+                 for dx, dy in DIRECTIONS]
+
+        self._build = {
+            'target': target,
+            'origin': (x0, y0),
+            'floor': floor,
+            'diagonal_ok': diagonal_ok,
+            'distance': distance,
+            'frontier': frontier,
+            'unvisited': floor & ~frontier,
+            'depth': 0,
+            'padded': padded,
+            'views': views,
+        }
+
+    def _advance(self, steps):
+        build = self._build
+        distance = build['distance']
+        frontier = build['frontier']
+        unvisited = build['unvisited']
+        diagonal_ok = build['diagonal_ok']
+        padded = build['padded']
+        views = build['views']
+        depth = build['depth']
+        if steps <= 0:
+            steps = -1  # unlimited
+
+        scratch = np.empty_like(frontier)
+        reached = frontier.any()
+        while reached and steps != 0:
+            steps -= 1
+            padded[1:-1, 1:-1] = frontier
+            frontier = views[0] | views[1]
+            frontier |= views[2]
+            frontier |= views[3]
+            for view, ok in zip(views[4:], diagonal_ok):
+                np.logical_and(view, ok, out=scratch)
+                frontier |= scratch
+            frontier &= unvisited
+            unvisited ^= frontier
+            depth += 1
+            distance[frontier] = depth
+            reached = frontier.any()
+        build['frontier'] = frontier
+        build['depth'] = depth
+
+        if not reached:
+            self._finish()
+
+    def _finish(self):
+        build, self._build = self._build, None
+        distance = build['distance']
+
+        # Precompute each tile's best neighbour so a lookup is O(1)
+        candidates = []
+        for i, (dx, dy) in enumerate(DIRECTIONS):
+            neighbour = _shift(distance, dx, dy, UNREACHED)
+            if i >= 4:
+                neighbour[~build['diagonal_ok'][i - 4]] = UNREACHED
+            candidates.append(neighbour)
+        candidates = np.stack(candidates)
+        best = candidates.argmin(axis=0)
+        has_step = candidates.min(axis=0) < distance
+
+        offsets = np.array(DIRECTIONS, dtype=np.int8)
+        self.step_x = np.where(has_step, offsets[best, 0], 0).astype(np.int8)
+        self.step_y = np.where(has_step, offsets[best, 1], 0).astype(np.int8)
+        self.distance = distance
+        self.origin = build['origin']
+        self.target = build['target']
+
+    def next_step(self, x, y):
+        # Offset of the next tile towards the target, or None if the tile
+        # is outside the field, unreachable or already the target
+        if self.distance is None:
+            return None
+        lx = x - self.origin[0]
+        ly = y - self.origin[1]
+        width, height = self.distance.shape
+        if not (0 <= lx < width and 0 <= ly < height):
+            return None
+        dx = self.step_x.item(lx, ly)
+        dy = self.step_y.item(lx, ly)
+        if dx == 0 and dy == 0:
+            return None
+        return dx, dy
+
+    def steps_at(self, xs, ys):
+        # Vectorized next_step: (step_x, step_y, has_step) arrays
+        step_x = np.zeros(xs.shape, dtype=np.int8)
+        step_y = np.zeros(xs.shape, dtype=np.int8)
+        if self.distance is not None:
+            lx = xs - self.origin[0]
+            ly = ys - self.origin[1]
+            width, height = self.distance.shape
+            inside = (lx >= 0) & (lx < width) & (ly >= 0) & (ly < height)
+            step_x[inside] = self.step_x[lx[inside], ly[inside]]
+            step_y[inside] = self.step_y[lx[inside], ly[inside]]
+        return step_x, step_y, (step_x != 0) | (step_y != 0)
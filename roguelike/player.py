@@ -1,6 +1,24 @@
 import pygame
 from .constants import *
 
+# Unit vector of each facing, the direction shots travel
+FACING_VECTORS = {'right': (1, 0), 'left': (-1, 0), 'up': (0, -1), 'down': (0, 1)}
+
+def attack_area(rect, facing):
+    # Directional attack rectangle in front of a player at rect
+    if facing == 'right':
+        return pygame.Rect(rect.right, rect.centery - ATTACK_RANGE//2,
+                           ATTACK_RANGE, ATTACK_RANGE)
+    elif facing == 'left':
+        return pygame.Rect(rect.left - ATTACK_RANGE, rect.centery - ATTACK_RANGE//2,
+                           ATTACK_RANGE, ATTACK_RANGE)
+    elif facing == 'up':
+        return pygame.Rect(rect.centerx - ATTACK_RANGE//2, rect.top - ATTACK_RANGE,
+                           ATTACK_RANGE, ATTACK_RANGE)
+    else:  # down
+        return pygame.Rect(rect.centerx - ATTACK_RANGE//2, rect.bottom,
+                           ATTACK_RANGE, ATTACK_RANGE)
+
 class Player(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
@@ -11,47 +29,17 @@ class Player(pygame.sprite.Sprite):
         self.rect.y = y
         self.speed = PLAYER_SPEED
         self.hp = PLAYER_HP
-        self.attack_effect_time = 0
+        self.attack_effect_time = -ATTACK_EFFECT_DURATION
+        self.next_shot = 0  # simulated time the next shot may be fired
         self.facing = 'right'  # Can be: 'left', 'right', 'up', 'down'
         
-    def handle_event(self, event):
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                self.attack()
-        elif event.type == pygame.JOYBUTTONDOWN:
-            # Use button 0 (typically A/X button) for attack
-            if event.button == 0:
-                self.attack()
-                
-    def update(self, game_map):
+    def update(self, game_map, input_state):
         if self.hp <= 0:
             return  # Don't move if dead
             
-        dx = 0
-        dy = 0
-        
-        # Keyboard controls
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_RIGHT]:
-            dx += self.speed
-        if keys[pygame.K_LEFT]:
-            dx -= self.speed
-        if keys[pygame.K_DOWN]:
-            dy += self.speed
-        if keys[pygame.K_UP]:
-            dy -= self.speed
-            
-        # Joystick controls
-        for i in range(pygame.joystick.get_count()):
-            joystick = pygame.joystick.Joystick(i)
-            
-            # Left analog stick
-            dx += joystick.get_axis(0) * self.speed
-            dy += joystick.get_axis(1) * self.speed
-            
-            # D-pad
-            dx += joystick.get_hat(0)[0] * self.speed
-            dy += joystick.get_hat(0)[1] * self.speed
+        # Keyboard and joystick input, sampled once per tick by the game
+        dx = input_state.move_x * self.speed
+        dy = input_state.move_y * self.speed
         
         # Update facing direction based on movement
         if dx > 0:
@@ -77,68 +65,24 @@ class Player(pygame.sprite.Sprite):
         return game_map.is_wall(self.rect.centerx // TILE_SIZE, 
                               self.rect.centery // TILE_SIZE)
     
-    def attack(self):
+    def attack(self, now):
         # Start attack effect timer
-        self.attack_effect_time = pygame.time.get_ticks()
+        self.attack_effect_time = now
+        return attack_area(self.rect, self.facing)
         
-        # Create directional attack rectangle based on facing direction
-        if self.facing == 'right':
-            return pygame.Rect(
-                self.rect.right,
-                self.rect.centery - ATTACK_RANGE//2,
-                ATTACK_RANGE,
-                ATTACK_RANGE
-            )
-        elif self.facing == 'left':
-            return pygame.Rect(
-                self.rect.left - ATTACK_RANGE,
-                self.rect.centery - ATTACK_RANGE//2,
-                ATTACK_RANGE,
-                ATTACK_RANGE
-            )
-        elif self.facing == 'up':
-            return pygame.Rect(
-                self.rect.centerx - ATTACK_RANGE//2,
-                self.rect.top - ATTACK_RANGE,
-                ATTACK_RANGE,
-                ATTACK_RANGE
-            )
-        else:  # down
-            return pygame.Rect(
-                self.rect.centerx - ATTACK_RANGE//2,
-                self.rect.bottom,
-                ATTACK_RANGE,
-                ATTACK_RANGE
-            )
+    def shoot(self, projectiles, kind, now):
+        # Fire one projectile the way the player faces, if the shot
+        # cooldown has passed
+        if now < self.next_shot:
+            return
+        self.next_shot = now + PROJECTILE_TYPES[kind]['cooldown']
+        dx, dy = FACING_VECTORS[self.facing]
+        projectiles.fire(self.rect.centerx, self.rect.centery, dx, dy, kind, now)
         
-    def draw_attack_effect(self, screen, camera_offset):
-        current_time = pygame.time.get_ticks()
-        if current_time - self.attack_effect_time < ATTACK_EFFECT_DURATION:
-            # Draw directional attack effect
-            if self.facing == 'right':
-                pygame.draw.rect(screen, ATTACK_EFFECT_COLOR,
-                    (self.rect.right - camera_offset[0],
-                     self.rect.centery - ATTACK_RANGE//2 - camera_offset[1],
-                     ATTACK_RANGE,
-                     ATTACK_RANGE), 2)
-            elif self.facing == 'left':
-                pygame.draw.rect(screen, ATTACK_EFFECT_COLOR,
-                    (self.rect.left - ATTACK_RANGE - camera_offset[0],
-                     self.rect.centery - ATTACK_RANGE//2 - camera_offset[1],
-                     ATTACK_RANGE,
-                     ATTACK_RANGE), 2)
-            elif self.facing == 'up':
-                pygame.draw.rect(screen, ATTACK_EFFECT_COLOR,
-                    (self.rect.centerx - ATTACK_RANGE//2 - camera_offset[0],
-                     self.rect.top - ATTACK_RANGE - camera_offset[1],
-                     ATTACK_RANGE,
-                     ATTACK_RANGE), 2)
-            else:  # down
-                pygame.draw.rect(screen, ATTACK_EFFECT_COLOR,
-                    (self.rect.centerx - ATTACK_RANGE//2 - camera_offset[0],
-                     self.rect.bottom - camera_offset[1],
-                     ATTACK_RANGE,
-                     ATTACK_RANGE), 2)
+    def draw_attack_effect(self, screen, camera_offset, now):
+        if now - self.attack_effect_time < ATTACK_EFFECT_DURATION:
+            area = attack_area(self.rect, self.facing).move(-camera_offset[0], -camera_offset[1])
+            pygame.draw.rect(screen, ATTACK_EFFECT_COLOR, area, 2)
         
     def draw(self, screen):
         # Get camera offset from the game instance
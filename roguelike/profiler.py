@@ -0,0 +1,155 @@
+import time
+import pygame
+import numpy as np
+from .constants import *
+
+class _NullPhase:
+    # Shared no-op context used while profiling is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+class _Phase:
+    __slots__ = ('profiler', 'column', 'start')
+
+    def __init__(self, profiler, column):
+        self.profiler = profiler
+        self.column = column
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.current[self.column] += time.perf_counter_ns() - self.start
+        return False
+
+class FrameProfiler:
+    # Times named phases of each frame into a ring buffer. Sub-phases are
+    # named with dots ('update.fov') and shown indented under their parent.
+    def __init__(self, history=PROFILER_HISTORY, max_phases=PROFILER_MAX_PHASES):
+        self.enabled = False
+        self.history = history
+        self.names = []
+        self.phases = {}  # name -> _Phase
+        self.samples = np.zeros((history, max_phases), dtype=np.float32)  # ms
+        self.frame_times = np.zeros(history, dtype=np.float32)  # ms
+        self.current = np.zeros(max_phases, dtype=np.int64)  # ns, this frame
+        self.frames = 0
+        self.frame_start = None
+        self.counters = {}
+
+        self.font = None
+        self.panel = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frame_start = None
+        self.panel = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            if len(self.names) == len(self.current):
+                return NULL_PHASE  # out of columns; drop the phase
+            phase = self.phases[name] = _Phase(self, len(self.names))
+            self.names.append(name)
+        return phase
+
+    def count(self, name, value):
+        # Extra per-frame numbers shown in the overlay, e.g. monster count
+        if self.enabled:
+            self.counters[name] = value
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self.frame_start is not None:
+            # Close the previous frame: start-to-start time includes vsync/tick
+            row = self.frames % self.history
+            self.samples[row] = self.current / 1e6
+            self.frame_times[row] = (now - self.frame_start) / 1e6
+            self.frames += 1
+        self.current[:] = 0
+        self.frame_start = now
+
+    def summary(self):
+        # (name, last ms, p50 ms, p99 ms) per phase over the buffered frames
+        filled = min(self.frames, self.history)
+        if not filled:
+            return [], 0.0, 0.0, 0.0
+        samples = self.samples[:filled, :len(self.names)]
+        last = self.samples[(self.frames - 1) % self.history]
+        p50, p99 = np.percentile(samples, (50, 99), axis=0)
+        rows = [(name, float(last[i]), float(p50[i]), float(p99[i]))
+                for i, name in enumerate(self.names)]
+        frame_times = self.frame_times[:filled]
+        fps = 1000.0 / max(float(frame_times.mean()), 1e-6)
+        frame_p50, frame_p99 = np.percentile(frame_times, (50, 99))
+        return rows, fps, float(frame_p50), float(frame_p99)
+
+    def draw(self, screen):
+        if not self.enabled:
+            return
+        # The panel is only rebuilt every few frames to keep the overlay cheap
+        if self.panel is None or self.frames % PROFILER_OVERLAY_REFRESH == 0:
+            self.panel = self.build_panel()
+        screen.blit(self.panel, (8, 8))
+
+    def build_panel(self):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        rows, fps, frame_p50, frame_p99 = self.summary()
+        budget = 1000.0 / FPS
+        line_height = 16
+        columns = (150, 200, 250, 300)  # x of last, p50, p99 and the bar
+        width = 370
+
+        header = [f"FPS {fps:.1f}   frame p50 {frame_p50:.2f} ms  p99 {frame_p99:.2f} ms"]
+        header += [f"{name} {value}" for name, value in self.counters.items()]
+        height = line_height * (len(header) + len(rows) + 1) + PROFILER_GRAPH_HEIGHT + 16
+        panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 180))
+
+        y = 4
+        for line in header:
+            panel.blit(self.font.render(line, True, WHITE), (6, y))
+            y += line_height
+        for x, label in zip(columns, ('last', 'p50', 'p99')):
+            panel.blit(self.font.render(label, True, WHITE), (x, y))
+        y += line_height
+
+        for name, last, p50, p99 in rows:
+            indent = 12 * name.count('.')
+            panel.blit(self.font.render(name.rsplit('.', 1)[-1], True, WHITE), (6 + indent, y))
+            for x, value in zip(columns, (last, p50, p99)):
+                panel.blit(self.font.render(f"{value:.2f}", True, WHITE), (x, y))
+            # Bar of the phase's p99 as a share of the frame budget
+            bar = int(min(p99 / budget, 1.0) * (width - columns[3] - 6))
+            pygame.draw.rect(panel, PROFILER_BAR_COLOR, (columns[3], y + 3, bar, 8))
+            y += line_height
+
+        # Frame time graph, newest on the right; the red line is the budget
+        graph_top = y + 6
+        filled = min(self.frames, self.history)
+        if filled > 1:
+            order = np.arange(self.frames - filled, self.frames) % self.history
+            scale = PROFILER_GRAPH_HEIGHT / (2 * budget)
+            xs = np.linspace(6, width - 6, filled)
+            ys = graph_top + PROFILER_GRAPH_HEIGHT - np.minimum(
+                self.frame_times[order] * scale, PROFILER_GRAPH_HEIGHT)
+            pygame.draw.lines(panel, PROFILER_GRAPH_COLOR, False,
+                              np.column_stack((xs, ys)).tolist())
+        budget_y = graph_top + PROFILER_GRAPH_HEIGHT // 2
+        pygame.draw.line(panel, RED, (6, budget_y), (width - 6, budget_y))
+        return panel
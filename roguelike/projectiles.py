@@ -0,0 +1,293 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import time
+import numpy as np
+from .constants import *
+from .spatial_hash import PointGrid
+
+PROJECTILE_TYPE_NAMES = list(PROJECTILE_TYPES)
+TYPE_SPEED = np.array([PROJECTILE_TYPES[name]['speed'] for name in PROJECTILE_TYPE_NAMES],
+                      dtype=np.float32)
+TYPE_DAMAGE = np.array([PROJECTILE_TYPES[name]['damage'] for name in PROJECTILE_TYPE_NAMES],
+                       dtype=np.int32)
+TYPE_BLAST = np.array([PROJECTILE_TYPES[name]['blast_radius'] for name in PROJECTILE_TYPE_NAMES],
+                      dtype=np.float32)
+TYPE_LIFETIME = np.array([PROJECTILE_TYPES[name]['lifetime'] for name in PROJECTILE_TYPE_NAMES],
+                         dtype=np.int64)
+
+# Recent explosions, kept for drawing until BLAST_EFFECT_DURATION has passed
+BLAST = np.dtype([('x', '<f4'), ('y', '<f4'), ('radius', '<f4'), ('time', '<i8')])
+
+def raymarch(game_map, x, y, vx, vy):
+    # Fraction of this tick's move (x, y) -> (x + vx, y + vy) after which
+    # each projectile enters a wall tile, or inf. A grid traversal
+    # (Amanatides & Woo) stepped for the whole batch at once: each pass
+    # crosses one tile boundary for every projectile still in flight.
+    tile_x = (x // TILE_SIZE).astype(np.intp)
+    tile_y = (y // TILE_SIZE).astype(np.intp)
+    step_x = np.sign(vx).astype(np.intp)
+    step_y = np.sign(vy).astype(np.intp)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_max_x = np.where(vx != 0, ((tile_x + (step_x > 0)) * TILE_SIZE - x) / vx, np.inf)
+        t_max_y = np.where(vy != 0, ((tile_y + (step_y > 0)) * TILE_SIZE - y) / vy, np.inf)
+        t_delta_x = np.where(vx != 0, TILE_SIZE / np.abs(vx), np.inf)
+        t_delta_y = np.where(vy != 0, TILE_SIZE / np.abs(vy), np.inf)
+
+    # Anything starting inside a wall stops at once
+    hit = np.where(game_map.walls_at(tile_x, tile_y), 0.0, np.inf)
+    active = np.flatnonzero(np.isinf(hit))
+    while active.size:
+        along_x = t_max_x[active] < t_max_y[active]
+        t = np.where(along_x, t_max_x[active], t_max_y[active])
+        within = t <= 1
+        active, along_x, t = active[within], along_x[within], t[within]
+        cross_x, cross_y = active[along_x], active[~along_x]
+        tile_x[cross_x] += step_x[cross_x]
+        t_max_x[cross_x] += t_delta_x[cross_x]
+        tile_y[cross_y] += step_y[cross_y]
+        t_max_y[cross_y] += t_delta_y[cross_y]
+        wall = game_map.walls_at(tile_x[active], tile_y[active])
+        hit[active[wall]] = t[wall]
+        active = active[~wall]
+    return hit
+
+class ProjectileStore:
+    # Structure-of-arrays pool of projectiles in flight, like MonsterStore:
+    # a shot takes a free slot and a spent one goes back on the free list,
+    # so firing allocates nothing once the pool has grown. Positions are
+    # pixel centers, velocities pixels per tick. Each tick moves every
+    # projectile at once: a grid march finds the wall it would enter, a
+    # sorted-cell broadphase finds the monsters near its path, and the
+    # earliest of the two stops it. Bombs burst where they stop or expire.
+    FIELDS = {
+        'x': np.float32,
+        'y': np.float32,
+        'vx': np.float32,
+        'vy': np.float32,
+        'damage': np.int32,
+        'blast': np.float32,
+        'expires': np.int64,
+        'kind': np.int8,
+        'alive': bool,
+    }
+
+    def __init__(self, capacity=PROJECTILE_STORE_CAPACITY):
+        self.capacity = 0
+        self.size = 0    # slots in use or freed, i.e. the high-water mark
+        self.count = 0   # projectiles in flight
+        self.free = []
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._grow(capacity)
+        self.blasts = np.zeros(0, dtype=BLAST)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, capacity):
+        for name, dtype in self.FIELDS.items():
+            grown = np.zeros(capacity, dtype=dtype)
+            grown[:self.capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def state(self):
+        # Copies of the used part of every field, plus the free list
+        state = {name: getattr(self, name)[:self.size].copy() for name in self.FIELDS}
+        state['free'] = np.array(self.free, dtype=np.int64)
+        return state
+
+    def restore(self, state):
+        size = len(state['alive'])
+        capacity = PROJECTILE_STORE_CAPACITY
+        while capacity < size:
+            capacity *= 2
+        self.capacity = 0
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._grow(capacity)
+        for name in self.FIELDS:
+            getattr(self, name)[:size] = state[name]
+        self.size = size
+        self.free = state['free'].tolist()
+        self.count = int(self.alive[:size].sum())
+        self.blasts = np.zeros(0, dtype=BLAST)
+
+    def clear(self):
+        # Drop everything in flight, e.g. when the player changes floor
+        self.alive[:self.size] = False
+        self.size = 0
+        self.count = 0
+        self.free = []
+        self.blasts = np.zeros(0, dtype=BLAST)
+
+    def alive_indices(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def fire(self, x, y, dx, dy, kind, now):
+        # One shot from (x, y) along the unit vector (dx, dy)
+        return self.fire_many(np.array([x]), np.array([y]), np.array([dx]), np.array([dy]),
+                              np.array([PROJECTILE_TYPE_NAMES.index(kind)]), now)
+
+    def fire_many(self, xs, ys, dxs, dys, kind_ids, now):
+        # Vectorized fire; returns the slot indices. Freed slots are reused
+        # first.
+        count = len(kind_ids)
+        reused = min(count, len(self.free))
+        slots = self.free[len(self.free) - reused:][::-1]
+        del self.free[len(self.free) - reused:]
+        new = count - reused
+        if self.size + new > self.capacity:
+            capacity = self.capacity
+            while capacity < self.size + new:
+                capacity *= 2
+            self._grow(capacity)
+        indices = np.concatenate([np.array(slots, dtype=np.intp),
+                                  np.arange(self.size, self.size + new)])
+        self.size += new
+
+        kind_ids = np.asarray(kind_ids, dtype=np.intp)
+        speed = TYPE_SPEED[kind_ids]
+        self.x[indices] = xs
+        self.y[indices] = ys
+        self.vx[indices] = np.asarray(dxs) * speed
+        self.vy[indices] = np.asarray(dys) * speed
+        self.damage[indices] = TYPE_DAMAGE[kind_ids]
+        self.blast[indices] = TYPE_BLAST[kind_ids]
+        self.expires[indices] = now + TYPE_LIFETIME[kind_ids]
+        self.kind[indices] = kind_ids
+        self.alive[indices] = True
+        self.count += count
+        return indices
+
+    def explode(self, xs, ys, radii, damages, monsters, now, grid=None):
+        # Area damage: every monster within a blast's radius of its center
+        # takes its damage. Returns (monster indices, damage), with repeats
+        # for monsters caught in several blasts; nothing is applied yet.
+        blasts = np.empty(len(xs), dtype=BLAST)
+        blasts['x'], blasts['y'], blasts['radius'], blasts['time'] = xs, ys, radii, now
+        self.blasts = np.concatenate([self.blasts, blasts])
+        living = monsters.alive_indices()
+        if not len(xs) or not len(living):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int32)
+        if grid is None:
+            grid = PointGrid(monsters.x[living], monsters.y[living])
+        query, point = grid.near(xs, ys, float(radii.max()))
+        targets = living[point]
+        inside = ((monsters.x[targets] - xs[query]) ** 2 +
+                  (monsters.y[targets] - ys[query]) ** 2) <= radii[query] ** 2
+        return targets[inside], damages[query[inside]]
+
+    def update(self, game_map, monsters, now):
+        # Move, collide and retire every projectile; returns monsters killed
+        if len(self.blasts):
+            self.blasts = self.blasts[now - self.blasts['time'] < BLAST_EFFECT_DURATION]
+        if not self.count:
+            return 0
+        indices = self.alive_indices()
+        x, y = self.x[indices], self.y[indices]
+        vx, vy = self.vx[indices], self.vy[indices]
+        t_wall = raymarch(game_map, x, y, vx, vy)
+
+        # Broadphase around the middle of each path, wide enough for the
+        # longest path this tick, then the exact segment-to-center test
+        living = monsters.alive_indices()
+        t_hit = np.full(len(indices), np.inf)
+        target = np.full(len(indices), -1)
+        grid = None
+        if len(living):
+            grid = PointGrid(monsters.x[living], monsters.y[living])
+            speed_sq = vx * vx + vy * vy
+            reach = float(np.sqrt(speed_sq.max())) / 2 + PROJECTILE_HIT_RADIUS
+            query, point = grid.near(x + vx / 2, y + vy / 2, reach)
+            candidates = living[point]
+            rel_x = monsters.x[candidates] - x[query]
+            rel_y = monsters.y[candidates] - y[query]
+            t = np.clip((rel_x * vx[query] + rel_y * vy[query]) /
+                        np.maximum(speed_sq[query], 1e-6), 0, 1)
+            miss_x = rel_x - t * vx[query]
+            miss_y = rel_y - t * vy[query]
+            hits = ((miss_x * miss_x + miss_y * miss_y <= PROJECTILE_HIT_RADIUS ** 2) &
+                    (t <= t_wall[query]))
+            query, candidates, t = query[hits], candidates[hits], t[hits]
+            # Each projectile stops at the first monster along its path
+            order = np.lexsort((t, query))
+            first = order[np.unique(query[order], return_index=True)[1]]
+            t_hit[query[first]] = t[first]
+            target[query[first]] = candidates[first]
+
+        hit = target >= 0
+        stop = np.minimum(np.where(hit, t_hit, t_wall), 1.0)
+        end_x = x + vx * stop
+        end_y = y + vy * stop
+        spent = hit | (t_wall <= 1) | (now >= self.expires[indices])
+        self.x[indices] = end_x
+        self.y[indices] = end_y
+
+        # Direct hits from plain shots, then bursts of spent bombs; all the
+        # damage lands together so a monster dies once
+        blast = self.blast[indices]
+        damage = self.damage[indices]
+        direct = hit & (blast == 0)
+        victims, amounts = [target[direct]], [damage[direct]]
+        bursting = spent & (blast > 0)
+        if bursting.any():
+            caught, burst_damage = self.explode(end_x[bursting], end_y[bursting], blast[bursting],
+                                                damage[bursting], monsters, now, grid)
+            victims.append(caught)
+            amounts.append(burst_damage)
+        kills = monsters.damage_many(np.concatenate(victims), np.concatenate(amounts))
+
+        retired = indices[spent]
+        self.alive[retired] = False
+        self.free.extend(retired.tolist())
+        self.count -= len(retired)
+        return kills
+
+def main():
+    parser = argparse.ArgumentParser(description="Time projectile updates with many shots in flight")
+    parser.add_argument('--projectiles', type=int, default=5000, help="shots kept in flight")
+    parser.add_argument('--horde', type=int, default=5000, help="monsters on the map")
+    parser.add_argument('--ticks', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=200)
+    args = parser.parse_args()
+
+    from .generators import make_generator
+    from .monster_store import MonsterStore
+    from .entities import MONSTER_TYPE_NAMES
+
+    rng = np.random.default_rng(args.seed)
+    game_map = make_generator('caves', seed=args.seed, width=args.width,
+                              height=args.height).generate()
+    floor_x, floor_y = np.nonzero(~game_map.tiles)
+    monsters = MonsterStore()
+    picks = rng.integers(len(floor_x), size=args.horde)
+    monsters.spawn_many(floor_x[picks] * TILE_SIZE, floor_y[picks] * TILE_SIZE,
+                        rng.integers(len(MONSTER_TYPE_NAMES), size=args.horde))
+    store = ProjectileStore()
+
+    times = []
+    kills = 0
+    for tick in range(args.ticks):
+        now = tick * 1000 // FPS
+        missing = args.projectiles - len(store)
+        if missing > 0:
+            picks = rng.integers(len(floor_x), size=missing)
+            angle = rng.random(missing) * 2 * np.pi
+            store.fire_many((floor_x[picks] + 0.5) * TILE_SIZE, (floor_y[picks] + 0.5) * TILE_SIZE,
+                            np.cos(angle), np.sin(angle),
+                            rng.integers(len(PROJECTILE_TYPE_NAMES), size=missing), now)
+        start = time.perf_counter()
+        kills += store.update(game_map, monsters, now)
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    print(f"{args.projectiles} projectiles, {args.horde} monsters: update p50 "
+          f"{np.percentile(times, 50):.2f} ms, p99 {np.percentile(times, 99):.2f} ms; "
+          f"{kills} kills, {len(monsters)} monsters left")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import struct
+import numpy as np
+
+# Server -> client frames are a u32 length followed by a snapshot: a header
+# then arrays in header order. Snapshots are deltas against what the same
+# client was last sent; the stream is TCP, so nothing is ever lost or
+# reordered and no acknowledgements are needed.
+FRAME = struct.Struct('<I')
+WELCOME = struct.Struct('<I')  # client id, sent once before the first frame
+SNAPSHOT_HEADER = struct.Struct('<IiihHHHHH')  # tick, player x, y, hp, then array lengths
+NEW_TILE = np.dtype([('x', '<u2'), ('y', '<u2'), ('wall', 'u1')])
+TILE = np.dtype([('x', '<u2'), ('y', '<u2')])
+ENTITY = np.dtype([('id', '<u4'), ('x', '<i4'), ('y', '<i4'), ('hp', '<i2'), ('kind', 'u1')])
+REMOVED = np.dtype('<u4')
+
+# Entity ids: monsters use their store slot, players are offset past them
+PLAYER_ID_BASE = 1 << 24
+PLAYER_KIND = 255
+
+def encode_snapshot(tick, player, new_tiles, entered, left, changed, removed):
+    # Lists of tuples in, one frame of bytes out
+    arrays = (np.array(new_tiles, dtype=NEW_TILE), np.array(entered, dtype=TILE),
+              np.array(left, dtype=TILE), np.array(changed, dtype=ENTITY),
+              np.array(removed, dtype=REMOVED))
+    header = SNAPSHOT_HEADER.pack(tick, player[0], player[1], player[2],
+                                  *(len(array) for array in arrays))
+    payload = b''.join([header] + [array.tobytes() for array in arrays])
+    return FRAME.pack(len(payload)) + payload
+
+def decode_snapshot(payload):
+    # Returns (tick, (x, y, hp), new_tiles, entered, left, changed, removed)
+    tick, x, y, hp, *counts = SNAPSHOT_HEADER.unpack_from(payload)
+    offset = SNAPSHOT_HEADER.size
+    arrays = []
+    for dtype, count in zip((NEW_TILE, TILE, TILE, ENTITY, REMOVED), counts):
+        arrays.append(np.frombuffer(payload, dtype=dtype, count=count, offset=offset))
+        offset += dtype.itemsize * count
+    return (tick, (x, y, hp), *arrays)
+
+class ClientView:
+    # What a client knows of the world, rebuilt from snapshot deltas
+    def __init__(self):
+        self.tick = 0
+        self.player = None
+        self.tiles = {}       # (x, y) -> wall, for every tile ever seen
+        self.visible = set()  # tiles currently in view
+        self.entities = {}    # id -> (x, y, hp, kind) of entities in view
+
+    def apply(self, payload):
+        tick, player, new_tiles, entered, left, changed, removed = decode_snapshot(payload)
+        self.tick = tick
+        self.player = player
+        for x, y, wall in new_tiles.tolist():
+            self.tiles[(x, y)] = bool(wall)
+        self.visible.difference_update(left.tolist())
+        self.visible.update(entered.tolist())
+        for entity_id, x, y, hp, kind in changed.tolist():
+            self.entities[entity_id] = (x, y, hp, kind)
+        for entity_id in removed.tolist():
+            self.entities.pop(entity_id, None)
@@ -0,0 +1,57 @@
+import numpy as np
+
+def label_regions(floor):
+    # Label 4-connected floor regions of a [x, y] bool grid. Floor is split
+    # into vertical runs per column, runs that overlap in neighbouring
+    # columns are merged by min-label propagation, and labels are painted
+    # back onto the tiles. Returns (labels, sizes): labels is -1 on walls
+    # and 0..n-1 on floor, sizes[i] is the tile count of region i.
+    width, height = floor.shape
+    labels = np.full((width, height), -1, dtype=np.int32)
+    if not floor.any():
+        return labels, np.zeros(0, dtype=np.int64)
+
+    padded = np.zeros((width, height + 2), dtype=np.int8)
+    padded[:, 1:-1] = floor
+    edges = np.diff(padded, axis=1)
+    run_x, run_start = np.nonzero(edges == 1)
+    run_end = np.nonzero(edges == -1)[1]  # exclusive; same order as the starts
+    run_count = len(run_x)
+
+    # Runs in column x + 1 overlapping runs in column x. Keys order runs by
+    # column then row, and runs within a column never overlap each other.
+    stride = height + 1
+    start_keys = run_x.astype(np.int64) * stride + run_start
+    end_keys = run_x.astype(np.int64) * stride + run_end
+    has_left = run_x > 0
+    right_runs = np.flatnonzero(has_left)
+    left_column = (run_x[right_runs] - 1).astype(np.int64) * stride
+    first = np.searchsorted(end_keys, left_column + run_start[right_runs], 'right')
+    last = np.searchsorted(start_keys, left_column + run_end[right_runs], 'left')
+    counts = np.maximum(last - first, 0)
+    total = counts.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    edge_a = np.repeat(right_runs, counts)
+    edge_b = np.repeat(first, counts) + offsets
+
+    # Hook every run onto the smallest label it touches until stable
+    run_labels = np.arange(run_count)
+    while True:
+        smallest = np.minimum(run_labels[edge_a], run_labels[edge_b])
+        updated = run_labels.copy()
+        np.minimum.at(updated, edge_a, smallest)
+        np.minimum.at(updated, edge_b, smallest)
+        updated = updated[updated]  # pointer jumping
+        if np.array_equal(updated, run_labels):
+            break
+        run_labels = updated
+
+    # Compact labels to 0..n-1 and paint runs back onto the grid
+    roots, run_labels = np.unique(run_labels, return_inverse=True)
+    lengths = run_end - run_start
+    tile_x = np.repeat(run_x, lengths)
+    tile_y = np.repeat(run_start, lengths) + (
+        np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+    labels[tile_x, tile_y] = np.repeat(run_labels, lengths)
+    sizes = np.bincount(run_labels, weights=lengths, minlength=len(roots)).astype(np.int64)
+    return labels, sizes
@@ -0,0 +1,184 @@
+import time
+import pygame
+import numpy as np
+from .constants import *
+from .camera import Camera
+from .lighting import Light
+from .particles import ParticleSystem
+from .player import attack_area
+from .sprite_batch import EntityBatch
+
+def player_lights(frame):
+    # The player's torch, plus a flash while the attack effect shows
+    x, y, hp, facing, attack_time = frame.player
+    tile_x = (x + TILE_SIZE // 2) // TILE_SIZE
+    tile_y = (y + TILE_SIZE // 2) // TILE_SIZE
+    lights = [Light(tile_x, tile_y, PLAYER_LIGHT_RADIUS, PLAYER_LIGHT_COLOR,
+                    PLAYER_LIGHT_INTENSITY)]
+    if frame.time - attack_time < ATTACK_EFFECT_DURATION:
+        lights.append(Light(tile_x, tile_y, ATTACK_LIGHT_RADIUS, ATTACK_EFFECT_COLOR))
+    return lights
+
+def _blend(before, after, alpha):
+    # Moves shorter than FRAME_SNAP_DISTANCE are interpolated, longer ones
+    # (stairs, respawned slots) jump straight to the new position
+    near = (np.abs(after[0] - before[0]) + np.abs(after[1] - before[1])) < FRAME_SNAP_DISTANCE
+    return tuple(np.where(near, b + (a - b) * alpha, a) for b, a in zip(before, after))
+
+def _blend_by_id(before, after, alpha):
+    # (xs, ys) of `after`'s entities, blended from the rows of `before`
+    # with the same id; both are sorted by id, new ids don't move
+    xs, ys = after['x'], after['y']
+    if len(before) and len(after):
+        at = np.minimum(np.searchsorted(before['id'], after['id']), len(before) - 1)
+        matched = before['id'][at] == after['id']
+        xs, ys = _blend((np.where(matched, before['x'][at], xs),
+                         np.where(matched, before['y'][at], ys)), (xs, ys), alpha)
+    return xs, ys
+
+class Renderer:
+    # Draws frames on a floor's map: the map, stairs, player and monsters
+    # placed between the previous and latest frame, particles, the minimap
+    # and the profiler overlay. It only reads frames and the floor's drawing state,
+    # so the floor may be a replica kept in step with another process.
+    def __init__(self, screen, profiler):
+        self.screen = screen
+        self.profiler = profiler
+        self.camera = Camera()
+        self.entity_batch = EntityBatch()
+        self.show_minimap = MINIMAP_ENABLED
+        self.player_image = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        self.player_image.fill(BLUE)
+        self.projectile_images = []
+        for name in PROJECTILE_TYPES:
+            image = pygame.Surface((PROJECTILE_SIZE, PROJECTILE_SIZE))
+            image.fill(PROJECTILE_TYPES[name]['color'])
+            self.projectile_images.append(image)
+        # Particles run on the wall clock between drawn frames
+        self.particles = ParticleSystem()
+        self.particle_depth = None
+        self.last_draw = None
+
+    def handle_key(self, key):
+        # Display toggles; returns True if the key was one of them
+        if key == pygame.K_F3:
+            self.profiler.toggle()
+        elif key == pygame.K_m:
+            self.show_minimap = not self.show_minimap
+        else:
+            return False
+        return True
+
+    def positions(self, previous, latest, alpha):
+        # (player x, player y, monster (xs, ys), projectile (xs, ys)) at
+        # alpha of the way from previous to latest
+        x, y = latest.player[:2]
+        monsters = latest.monsters
+        projectiles = latest.projectiles
+        if previous is None or previous.depth != latest.depth or alpha >= 1:
+            return (x, y, (monsters['x'], monsters['y']),
+                    (projectiles['x'], projectiles['y']))
+        x, y = (int(v) for v in _blend(previous.player[:2], (x, y), alpha))
+        return (x, y, _blend_by_id(previous.monsters, monsters, alpha),
+                _blend_by_id(previous.projectiles, projectiles, alpha))
+
+    def draw(self, floor, previous, latest, alpha=1.0, effects=None):
+        # effects are those of every frame since the last draw, from
+        # FrameBuffer.take_effects()
+        profiler = self.profiler
+        screen = self.screen
+        camera = self.camera
+        game_map = floor.game_map
+        x, y, (monster_x, monster_y), shots = self.positions(previous, latest, alpha)
+        camera.center_on(x + TILE_SIZE // 2, y + TILE_SIZE // 2)
+
+        screen.fill(BLACK)
+        if floor.light_map is not None:
+            with profiler.phase('draw.light'):
+                floor.light_map.update(player_lights(latest))
+        with profiler.phase('draw.map'):
+            game_map.draw(screen, camera)
+            self.draw_stairs(floor)
+
+        # Draw player with camera offset, attack effect, and health bar
+        _, _, hp, facing, attack_time = latest.player
+        player_rect = pygame.Rect(x - camera.x, y - camera.y, TILE_SIZE, TILE_SIZE)
+        screen.blit(self.player_image, player_rect)
+        if latest.time - attack_time < ATTACK_EFFECT_DURATION:
+            pygame.draw.rect(screen, ATTACK_EFFECT_COLOR, attack_area(player_rect, facing), 2)
+
+        # Draw health bar at correct screen position
+        health_x = player_rect.x
+        health_y = player_rect.y - HEALTH_BAR_OFFSET - HEALTH_BAR_HEIGHT
+        health_width = int(HEALTH_BAR_WIDTH * (hp / PLAYER_HP))
+
+        # Background (empty health)
+        pygame.draw.rect(screen, RED,
+                         (health_x, health_y, HEALTH_BAR_WIDTH, HEALTH_BAR_HEIGHT))
+        # Foreground (current health)
+        if health_width > 0:
+            pygame.draw.rect(screen, GREEN,
+                             (health_x, health_y, health_width, HEALTH_BAR_HEIGHT))
+
+        # Frames only hold visible monsters; each comes with its health bar
+        with profiler.phase('draw.monsters'):
+            monsters = latest.monsters
+            self.entity_batch.draw_arrays(screen, monster_x, monster_y, monsters['hp'],
+                                          monsters['max_hp'], monsters['type_id'], camera)
+
+        with profiler.phase('draw.projectiles'):
+            self.draw_projectiles(latest, shots)
+
+        with profiler.phase('draw.particles'):
+            self.draw_particles(latest, effects)
+
+        if self.show_minimap:
+            with profiler.phase('draw.minimap'):
+                floor.minimap.draw(screen, (latest.player[0] + TILE_SIZE // 2) // TILE_SIZE,
+                                   (latest.player[1] + TILE_SIZE // 2) // TILE_SIZE)
+
+        with profiler.phase('draw.overlay'):
+            profiler.draw(screen)
+        with profiler.phase('draw.flip'):
+            pygame.display.flip()
+
+    def draw_projectiles(self, frame, positions):
+        # Projectiles centered on their positions in one blits call, then a
+        # ring for each recent blast that widens to its full radius
+        offset = PROJECTILE_SIZE // 2
+        xs = np.asarray(positions[0], dtype=np.int32) - self.camera.x - offset
+        ys = np.asarray(positions[1], dtype=np.int32) - self.camera.y - offset
+        images = self.projectile_images
+        self.screen.blits([(images[kind], (x, y)) for kind, x, y in
+                           zip(frame.projectiles['kind'].tolist(), xs.tolist(), ys.tolist())],
+                          doreturn=False)
+        for blast in frame.blasts.tolist():
+            bx, by, radius, fired = blast
+            grown = min(1.0, (frame.time - fired) / BLAST_EFFECT_DURATION + 0.25)
+            pygame.draw.circle(self.screen, PROJECTILE_TYPES['bomb']['color'],
+                               (int(bx) - self.camera.x, int(by) - self.camera.y),
+                               max(1, int(radius * grown)), 2)
+
+    def draw_particles(self, latest, effects):
+        particles = self.particles
+        if latest.depth != self.particle_depth:
+            particles.clear()
+            self.particle_depth = latest.depth
+        if effects is not None:
+            particles.emit(effects)
+
+        now = time.perf_counter()
+        if self.last_draw is not None:
+            particles.update(min(PARTICLE_MAX_STEP, (now - self.last_draw) * 1000))
+        self.last_draw = now
+        drawn = particles.draw(self.screen, self.camera)
+        self.profiler.count('particles', f"{drawn} / {len(particles)}")
+
+    def draw_stairs(self, floor):
+        for stairs, color in ((floor.stairs_down, STAIRS_DOWN_COLOR),
+                              (floor.stairs_up, STAIRS_UP_COLOR)):
+            if stairs is not None and floor.game_map.explored[stairs]:
+                x, y = stairs
+                self.screen.fill(color, (x * TILE_SIZE - self.camera.x + 4,
+                                         y * TILE_SIZE - self.camera.y + 4,
+                                         TILE_SIZE - 8, TILE_SIZE - 8))
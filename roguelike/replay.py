@@ -0,0 +1,134 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import gzip
+import struct
+import time
+import pygame
+from .constants import *
+from .input_state import InputState
+
+# A replay is a gzip stream: header, optional map path, map algorithm name, then tagged
+# records. Each tick writes an input record before the game updates, and
+# every REPLAY_CHECKSUM_INTERVAL ticks a checksum record follows it.
+MAGIC = b'RLRP'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHqIBHB')  # magic, version, seed, horde, endless, map path bytes, algorithm bytes
+INPUT = b'I'
+CHECKSUM = b'C'
+CHECKSUM_RECORD = struct.Struct('<II')  # tick, crc32
+
+class ReplayDesync(Exception):
+    pass
+
+class ReplayRecorder:
+    def __init__(self, path, checksum_interval=REPLAY_CHECKSUM_INTERVAL):
+        self.file = gzip.open(path, 'wb')
+        self.checksum_interval = checksum_interval
+
+    def start(self, game):
+        # Called by the game once its seed and map are settled
+        map_path = (game.map_file or '').encode()
+        algorithm = game.map_algorithm.encode()
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, game.seed, game.horde,
+                                    game.endless, len(map_path), len(algorithm)))
+        self.file.write(map_path)
+        self.file.write(algorithm)
+
+    def record(self, input_state):
+        self.file.write(INPUT + input_state.pack())
+
+    def tick(self, game):
+        if game.ticks % self.checksum_interval == 0:
+            self.file.write(CHECKSUM + CHECKSUM_RECORD.pack(game.ticks,
+                                                            game.state_checksum()))
+
+    def close(self):
+        self.file.close()
+
+class ReplayReader:
+    def __init__(self, path):
+        self.file = gzip.open(path, 'rb')
+        magic, version, self.seed, self.horde, endless, path_length, algorithm_length = \
+            HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} replay")
+        self.endless = bool(endless)
+        self.map_file = self.file.read(path_length).decode() or None
+        self.map_algorithm = self.file.read(algorithm_length).decode()
+
+    def __iter__(self):
+        # Yields (INPUT, InputState) and (CHECKSUM, (tick, crc32))
+        read = self.file.read
+        while True:
+            tag = read(1)
+            if not tag:
+                return
+            if tag == INPUT:
+                yield tag, InputState.unpack(read(InputState.FORMAT.size))
+            elif tag == CHECKSUM:
+                yield tag, CHECKSUM_RECORD.unpack(read(CHECKSUM_RECORD.size))
+            else:
+                raise ValueError(f"corrupt replay record {tag!r}")
+
+    def close(self):
+        self.file.close()
+
+def replay(path, render=False, strict=True):
+    # Drive a Game from a replay on the simulated clock, as fast as possible
+    # or, when rendering, at FPS like live play. Returns (ticks, seconds,
+    # desyncs); raises ReplayDesync on the first mismatch when strict.
+    from .game import Game
+
+    reader = ReplayReader(path)
+    game = Game(horde=reader.horde, seed=reader.seed, map_file=reader.map_file,
+                endless=reader.endless, map_algorithm=reader.map_algorithm,
+                headless=not render)
+    desyncs = []
+    start = time.perf_counter()
+    try:
+        for tag, value in reader:
+            if tag == INPUT:
+                game.input = value
+                game.update()
+                if render:
+                    game.draw()
+                    pygame.event.pump()
+                    game.clock.tick(FPS)
+            else:
+                tick, expected = value
+                actual = game.state_checksum()
+                if tick != game.ticks or actual != expected:
+                    if strict:
+                        raise ReplayDesync(
+                            f"desync at tick {tick}: expected {expected:08x}, "
+                            f"got {actual:08x} at tick {game.ticks}")
+                    desyncs.append(tick)
+    finally:
+        reader.close()
+        game.close()
+    return game.ticks, time.perf_counter() - start, desyncs
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded run headlessly and check for desyncs")
+    parser.add_argument('replay', help="file written by --record")
+    parser.add_argument('--render', action='store_true', help="also draw every tick")
+    parser.add_argument('--keep-going', action='store_true',
+                        help="report every desynced checksum instead of stopping at the first")
+    args = parser.parse_args()
+
+    if not args.render:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        ticks, elapsed, desyncs = replay(args.replay, render=args.render,
+                                         strict=not args.keep_going)
+    except ReplayDesync as error:
+        raise SystemExit(str(error))
+    print(f"Replayed {ticks} ticks in {elapsed:.2f}s ({ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    if desyncs:
+        print(f"{len(desyncs)} desynced checksums, first at tick {desyncs[0]}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import json
+import threading
+import numpy as np
+from .constants import *
+from .map_generator import GameMap, Rect
+from .chunked_map import ChunkedGameMap
+
+# A save is an .npz archive of flat arrays: bit-packed tile and explored
+# grids, one array per monster field and a small JSON header, plus every
+# other floor visited in the run. Visibility is not stored; it is
+# recomputed by the first FOV update after loading.
+SAVE_VERSION = 1
+
+def default_save_path():
+    return os.environ.get('ROGUELIKE_SAVE',
+                          os.path.join(os.path.expanduser('~'), '.local', 'share',
+                                       'roguelike', 'autosave.npz'))
+
+def capture(game):
+    # Copy everything a save needs into arrays. Cheap enough to run on the
+    # main thread between frames; compression and I/O happen in write().
+    game_map = game.game_map
+    player = game.player
+    header = {
+        'version': SAVE_VERSION,
+        'seed': game.seed,
+        'horde': game.horde,
+        'endless': game.endless,
+        'map_algorithm': game.map_algorithm,
+        'depth': game.depth,
+        'ticks': game.ticks,
+        'last_spawn_time': game.last_spawn_time,
+        'ai_tick': game.ai_scheduler.tick,
+        'width': game_map.width,
+        'height': game_map.height,
+        'player': {
+            'x': player.rect.x,
+            'y': player.rect.y,
+            'hp': player.hp,
+            'facing': player.facing,
+            'attack_effect_time': player.attack_effect_time,
+            'next_shot': player.next_shot,
+        },
+        'rng': game.rng.getstate(),
+        'spawner_rng': game.spawner.rng.bit_generator.state,
+    }
+    arrays = {'header': np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)}
+
+    if isinstance(game_map, ChunkedGameMap):
+        # Endless maps regenerate from the seed; only exploration is saved
+        arrays['chunk_keys'], arrays['chunk_explored'] = game_map.explored_chunks()
+    else:
+        arrays['tiles'] = np.packbits(game_map.tiles)
+        arrays['explored'] = np.packbits(game_map.explored)
+        arrays['rooms'] = np.array([(room.x1, room.y1, room.x2, room.y2)
+                                    for room in game_map.rooms], dtype=np.int32).reshape(-1, 4)
+
+    for name, array in game.monsters.state().items():
+        arrays['monster_' + name] = array
+    for name, array in game.projectiles.state().items():
+        arrays['projectile_' + name] = array
+    if game.floors is not None:
+        arrays.update(game.floors.snapshot())
+    return arrays
+
+def write(path, arrays):
+    # Compress and write atomically; safe to call from a worker thread
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+def save_game(game, path):
+    write(path, capture(game))
+
+def _unpack(packed, width, height):
+    return np.unpackbits(packed, count=width * height).reshape(width, height).view(bool)
+
+def load_game(path, **game_options):
+    # Returns a Game restored from a save; extra options go to Game()
+    from .game import Game
+
+    with np.load(path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    header = json.loads(arrays['header'].tobytes())
+    if header['version'] != SAVE_VERSION:
+        raise ValueError(f"{path} is not a version {SAVE_VERSION} save")
+    width, height = header['width'], header['height']
+
+    if header['endless']:
+        game_map = ChunkedGameMap(header['seed'])
+        game_map.restore_explored(arrays['chunk_keys'], arrays['chunk_explored'])
+    else:
+        rooms = [Rect(x1, y1, x2 - x1, y2 - y1)
+                 for x1, y1, x2, y2 in arrays['rooms'].tolist()]
+        game_map = GameMap(width, height, tiles=_unpack(arrays['tiles'], width, height),
+                           rooms=rooms)
+        game_map.explored[...] = _unpack(arrays['explored'], width, height)
+
+    game = Game(horde=header['horde'], seed=header['seed'], endless=header['endless'],
+                game_map=game_map, populate=False, depth=header['depth'],
+                map_algorithm=header.get('map_algorithm', MAP_ALGORITHM), **game_options)
+    game.ticks = header['ticks']
+    game.time = game.ticks * 1000 // FPS
+    game.last_spawn_time = header['last_spawn_time']
+    game.ai_scheduler.tick = header['ai_tick']
+    version, state, gauss = header['rng']
+    game.rng.setstate((version, tuple(state), gauss))
+    game.spawner.rng.bit_generator.state = header['spawner_rng']
+
+    player = game.player
+    player.rect.x = header['player']['x']
+    player.rect.y = header['player']['y']
+    player.hp = header['player']['hp']
+    player.facing = header['player']['facing']
+    player.attack_effect_time = header['player']['attack_effect_time']
+    player.next_shot = header['player'].get('next_shot', 0)
+
+    if header['endless']:
+        game.game_map.stream(player.rect.centerx // TILE_SIZE,
+                             player.rect.centery // TILE_SIZE)
+        game.spawner.refresh()
+    game.monsters.restore({name[len('monster_'):]: array for name, array in arrays.items()
+                           if name.startswith('monster_')})
+    if 'projectile_alive' in arrays:
+        game.projectiles.restore({name[len('projectile_'):]: array
+                                  for name, array in arrays.items()
+                                  if name.startswith('projectile_')})
+    if game.floors is not None and 'floors_live' in arrays:
+        game.floors.restore(arrays)
+    return game
+
+class AutoSaver:
+    # Periodic saves: the snapshot is captured on the main thread, then a
+    # background thread compresses and writes it. A save still in flight
+    # makes the next one wait for the following interval.
+    def __init__(self, path, interval=AUTOSAVE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_save_time = None
+        self.thread = None
+        self.error = None
+
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def save(self, game):
+        if self.busy():
+            return False
+        arrays = capture(game)
+        self.last_save_time = game.time
+        self.thread = threading.Thread(target=self._write, args=(arrays,), daemon=True)
+        self.thread.start()
+        return True
+
+    def _write(self, arrays):
+        try:
+            write(self.path, arrays)
+            self.error = None
+        except OSError as error:
+            self.error = error  # a failed autosave must not end the game
+
+    def update(self, game):
+        if self.last_save_time is None:
+            self.last_save_time = game.time  # count from the first tick
+        elif self.interval and game.time - self.last_save_time >= self.interval:
+            self.save(game)
+
+    def close(self):
+        # Let an in-flight save finish before the process exits
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,372 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import asyncio
+import random
+import time
+from collections import OrderedDict
+import numpy as np
+from .constants import *
+from .player import Player
+from .generators import GENERATORS, make_generator
+from .map_cache import MapCache
+from .monster_store import MonsterStore
+from .spawner import Spawner
+from .pathfinding import FlowField
+from .fov import FieldOfView
+from .input_state import InputState, ATTACK, RIGHT, LEFT, DOWN, UP
+from .protocol import (FRAME, WELCOME, ENTITY, PLAYER_ID_BASE, PLAYER_KIND, ClientView,
+                       encode_snapshot)
+
+class RemotePlayer:
+    # Server-side state of one connected client: its avatar, latest input
+    # and a mirror of everything it has been sent so snapshots can be deltas
+    def __init__(self, client_id, x, y, game_map):
+        self.client_id = client_id
+        self.player = Player(x, y)
+        self.input = InputState()
+        self.flow_field = FlowField(game_map, radius=SERVER_ACTIVE_RADIUS)
+        self.known = set()    # tiles whose wall bit was sent
+        self.visible = frozenset()
+        self.entities = np.empty(0, dtype=ENTITY)  # rows last sent, by id
+        self.writer = None
+        self.bytes_sent = 0
+
+class _Assigned:
+    # Scheduler handed to MonsterStore.update: the monsters a player drives
+    def __init__(self, indices):
+        self.indices = indices
+
+    def schedule(self, store, player, game_map):
+        return self.indices, 1
+
+class ServerWorld:
+    # Authoritative multiplayer simulation. Monsters are only simulated
+    # within SERVER_ACTIVE_RADIUS of a player, each driven by its nearest
+    # player, so the cost of a tick follows the players rather than the
+    # size of the map or the monster count.
+    def __init__(self, seed, horde=0, width=MAP_WIDTH, height=MAP_HEIGHT,
+                 map_algorithm=MAP_ALGORITHM):
+        self.seed = seed
+        generator = make_generator(map_algorithm, seed=seed, width=width, height=height)
+        self.game_map = (MapCache().load_or_generate(generator) if MAP_CACHE_ENABLED
+                         else generator.generate())
+        self.fov = FieldOfView(self.game_map, cache_size=SERVER_FOV_CACHE_SIZE)
+        start = self.game_map.rooms[0]
+        self.spawn_point = (start.center_x * TILE_SIZE, start.center_y * TILE_SIZE)
+
+        self.monsters = MonsterStore()
+        self.spawner = Spawner(self.game_map, self.monsters, seed)
+        reference = Player(*self.spawn_point)
+        if horde:
+            self.spawner.spawn_many(reference, horde)
+        else:
+            rng = random.Random(seed)
+            for room_id in range(self.spawner.index.room_count):
+                for _ in range(rng.randint(*MONSTERS_PER_ROOM)):
+                    self.spawner.spawn(reference, room_id)
+
+        self.players = {}  # client id -> RemotePlayer
+        self.next_client_id = 0
+        self.ticks = 0
+        self.time = 0
+        self._tiles = None
+        self._tiles_tick = -1
+        self._view_masks = OrderedDict()
+
+    def join(self):
+        remote = RemotePlayer(self.next_client_id, *self.spawn_point, self.game_map)
+        self.players[remote.client_id] = remote
+        self.next_client_id += 1
+        return remote
+
+    def leave(self, remote):
+        self.players.pop(remote.client_id, None)
+
+    def assign_monsters(self):
+        # Monster slot indices per player: each live monster within
+        # SERVER_ACTIVE_RADIUS of a player goes to the nearest one. Each
+        # player's candidates come from the spatial hash around it, so the
+        # work follows the monsters near players, not the whole store.
+        store = self.monsters
+        reach = SERVER_ACTIVE_RADIUS * TILE_SIZE
+        centers = np.array([remote.player.rect.center for remote in self.players.values()],
+                           dtype=np.float64).reshape(-1, 2)
+        found = [np.array(store.spatial_hash.query_radius(x, y, reach), dtype=np.intp)
+                 for x, y in centers.tolist()]
+        if not found:
+            return []
+        indices = np.concatenate(found)
+        owners = np.repeat(np.arange(len(found)), [len(near) for near in found])
+
+        # Monsters near several players go to the nearest
+        distance_sq = ((store.x[indices] - centers[owners, 0]) ** 2 +
+                       (store.y[indices] - centers[owners, 1]) ** 2)
+        order = np.lexsort((distance_sq, indices))
+        indices, owners = indices[order], owners[order]
+        first = np.r_[True, indices[1:] != indices[:-1]]
+        indices, owners = indices[first], owners[first]
+
+        by_owner = np.argsort(owners, kind='stable')
+        return np.split(indices[by_owner],
+                        np.searchsorted(owners[by_owner], np.arange(1, len(found))))
+
+    def tick(self):
+        store = self.monsters
+        for remote in self.players.values():
+            player = remote.player
+            if player.hp <= 0:
+                # Respawn at the start with full health
+                player.hp = PLAYER_HP
+                player.rect.topleft = self.spawn_point
+            if remote.input.attack:
+                self.attack(player)
+                remote.input = InputState(remote.input.buttons & ~ATTACK,
+                                          remote.input.axis_x, remote.input.axis_y)
+            player.update(self.game_map, remote.input)
+
+        for remote, indices in zip(self.players.values(), self.assign_monsters()):
+            if not len(indices):
+                continue  # nobody to chase this player; skip its flow field
+            player = remote.player
+            remote.flow_field.update(player.rect.centerx // TILE_SIZE,
+                                     player.rect.centery // TILE_SIZE)
+            store.update(player, self.game_map, remote.flow_field, self.time,
+                         _Assigned(indices))
+        self.ticks += 1
+        self.time = self.ticks * 1000 // SERVER_TICK_RATE
+
+    def monster_tiles(self):
+        # Live slot indices and tile coordinates sorted by tile column,
+        # computed once per tick and shared by every client's snapshot
+        if self._tiles_tick != self.ticks:
+            store = self.monsters
+            indices = store.alive_indices()
+            tile_x = (store.x[indices] // TILE_SIZE).astype(np.intp)
+            order = np.argsort(tile_x, kind='stable')
+            self._tiles = (indices[order], tile_x[order],
+                           (store.y[indices[order]] // TILE_SIZE).astype(np.intp))
+            self._tiles_tick = self.ticks
+        return self._tiles
+
+    def view_mask(self, tile_x, tile_y, visible):
+        # Visible set as a boolean window centred on the viewer, cached by
+        # origin like the FOV itself
+        key = (tile_x, tile_y)
+        mask = self._view_masks.get(key)
+        if mask is not None:
+            self._view_masks.move_to_end(key)
+            return mask
+        mask = np.zeros((2 * FOV_RADIUS + 1, 2 * FOV_RADIUS + 1), dtype=bool)
+        if visible:
+            tiles = np.array(list(visible))
+            mask[tiles[:, 0] - (tile_x - FOV_RADIUS), tiles[:, 1] - (tile_y - FOV_RADIUS)] = True
+        self._view_masks[key] = mask
+        if len(self._view_masks) > SERVER_FOV_CACHE_SIZE:
+            self._view_masks.popitem(last=False)
+        return mask
+
+    def attack(self, player):
+        self.monsters.damage_in_rect(player.attack(self.time), PLAYER_ATTACK_DAMAGE)
+
+    def snapshot(self, remote):
+        # Delta frame for one client: only what changed inside its view
+        player = remote.player
+        tile_x = player.rect.centerx // TILE_SIZE
+        tile_y = player.rect.centery // TILE_SIZE
+        visible = self.fov.compute(tile_x, tile_y, FOV_RADIUS)
+        entered = visible - remote.visible
+        left = remote.visible - visible
+        remote.visible = visible
+        new_tiles = [(x, y, self.game_map.tiles.item(x, y))
+                     for x, y in entered if (x, y) not in remote.known]
+        remote.known.update(entered)
+
+        # Entities standing on visible tiles, as ENTITY rows sorted by id
+        indices, monster_x, monster_y = self.monster_tiles()
+        low, high = np.searchsorted(monster_x, (tile_x - FOV_RADIUS, tile_x + FOV_RADIUS + 1))
+        local_x = monster_x[low:high] - (tile_x - FOV_RADIUS)
+        local_y = monster_y[low:high] - (tile_y - FOV_RADIUS)
+        near = np.flatnonzero((local_y >= 0) & (local_y <= 2 * FOV_RADIUS))
+        near = near[self.view_mask(tile_x, tile_y, visible)[local_x[near], local_y[near]]]
+        store = self.monsters
+        shown = np.sort(indices[low:high][near])
+        others = [(PLAYER_ID_BASE + other.client_id, *other.player.rect.center,
+                   other.player.hp, PLAYER_KIND)
+                  for other in self.players.values() if other is not remote and
+                  (other.player.rect.centerx // TILE_SIZE,
+                   other.player.rect.centery // TILE_SIZE) in visible]
+        # Monsters by slot, then players, whose ids are all above any slot
+        current = np.empty(len(shown) + len(others), dtype=ENTITY)
+        current[len(shown):] = others
+        current['id'][:len(shown)] = shown
+        current['x'][:len(shown)] = store.x[shown]
+        current['y'][:len(shown)] = store.y[shown]
+        current['hp'][:len(shown)] = store.hp[shown]
+        current['kind'][:len(shown)] = store.type_id[shown]
+
+        # Delta against the rows sent last tick
+        sent = remote.entities
+        if len(sent) and len(current):
+            position = np.minimum(np.searchsorted(sent['id'], current['id']), len(sent) - 1)
+            changed = current[sent[position] != current]
+            removed = sent['id'][~np.isin(sent['id'], current['id'], assume_unique=True)]
+        else:
+            changed = current
+            removed = sent['id']
+        remote.entities = current
+
+        return encode_snapshot(self.ticks, (player.rect.x, player.rect.y, player.hp),
+                               new_tiles, list(entered), list(left), changed, removed)
+
+class GameServer:
+    # Runs a ServerWorld at SERVER_TICK_RATE over asyncio TCP streams.
+    # Clients send 3-byte InputState records whenever they like; the most
+    # recent one is used each tick.
+    def __init__(self, world, host='127.0.0.1', port=0):
+        self.world = world
+        self.host = host
+        self.port = port
+        self.server = None
+        self.tick_times = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, reader, writer):
+        remote = self.world.join()
+        remote.writer = writer
+        writer.write(WELCOME.pack(remote.client_id))
+        try:
+            while True:
+                data = await reader.readexactly(InputState.FORMAT.size)
+                previous = remote.input
+                remote.input = InputState.unpack(data)
+                if previous.attack:
+                    remote.input.buttons |= ATTACK  # don't drop an unprocessed attack
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.world.leave(remote)
+            writer.close()
+
+    async def run(self, ticks=None):
+        loop = asyncio.get_running_loop()
+        interval = 1 / SERVER_TICK_RATE
+        next_tick = loop.time()
+        while ticks is None or self.world.ticks < ticks:
+            start = time.perf_counter()
+            self.world.tick()
+            for remote in list(self.world.players.values()):
+                frame = self.world.snapshot(remote)
+                remote.bytes_sent += len(frame)
+                remote.writer.write(frame)
+                if remote.writer.transport.get_write_buffer_size() > SERVER_MAX_BUFFER:
+                    remote.writer.close()  # too far behind; drop the client
+                    self.world.leave(remote)
+            self.tick_times.append(time.perf_counter() - start)
+            next_tick += interval
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+class SimulatedClient:
+    # Test client that wanders randomly, attacks now and then and mirrors
+    # the world from snapshots
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.client_id = None
+        self.view = ClientView()
+        self.frames = 0
+        self.bytes_received = 0
+
+    async def run(self, host, port, stop):
+        reader, writer = await asyncio.open_connection(host, port)
+        buttons = 0
+        try:
+            self.client_id, = WELCOME.unpack(await reader.readexactly(WELCOME.size))
+            while not stop.is_set():
+                length, = FRAME.unpack(await reader.readexactly(FRAME.size))
+                payload = await reader.readexactly(length)
+                self.view.apply(payload)
+                self.frames += 1
+                self.bytes_received += FRAME.size + length
+                if self.frames % 20 == 1:
+                    buttons = self.rng.choice([RIGHT, LEFT, DOWN, UP, RIGHT | DOWN, LEFT | UP])
+                attack = ATTACK if self.rng.random() < 0.05 else 0
+                writer.write(InputState(buttons | attack).pack())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def run_harness(world, clients, ticks):
+    server = GameServer(world)
+    await server.start()
+    stop = asyncio.Event()
+    simulated = [SimulatedClient(seed) for seed in range(clients)]
+    tasks = [asyncio.create_task(client.run(server.host, server.port, stop))
+             for client in simulated]
+    while len(world.players) < clients:
+        await asyncio.sleep(0.01)
+    await server.run(world.ticks + ticks)
+    # Let clients drain their sockets, then check each view matches what the
+    # server believes it sent
+    for _ in range(500):
+        if all(client.view.tick == world.ticks for client in simulated):
+            break
+        await asyncio.sleep(0.01)
+    stop.set()
+    mismatched = sum(client.view.entities != {row[0]: row[1:] for row in
+                                              remote.entities.tolist()} or
+                     client.view.visible != set(remote.visible)
+                     for client in simulated
+                     for remote in [world.players[client.client_id]])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await server.close()
+    return server, simulated, mismatched
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multiplayer server with simulated clients")
+    parser.add_argument('--clients', type=int, default=16,
+                        help="simulated clients to run against the server (0: serve forever)")
+    parser.add_argument('--ticks', type=int, default=300, help="ticks to run the harness for")
+    parser.add_argument('--port', type=int, default=0, help="port when serving real clients")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--horde', type=int, default=0, metavar='N',
+                        help="spawn N monsters instead of the usual per-room spawns")
+    parser.add_argument('--width', type=int, default=MAP_WIDTH)
+    parser.add_argument('--height', type=int, default=MAP_HEIGHT)
+    parser.add_argument('--generator', choices=GENERATORS, default=MAP_ALGORITHM,
+                        help="map generation algorithm (default: %(default)s)")
+    args = parser.parse_args()
+
+    world = ServerWorld(args.seed, args.horde, args.width, args.height, args.generator)
+    if not args.clients:
+        async def serve():
+            server = GameServer(world, port=args.port)
+            await server.start()
+            print(f"Serving on {server.host}:{server.port}")
+            await server.run()
+        asyncio.run(serve())
+        return
+
+    server, clients, mismatched = asyncio.run(run_harness(world, args.clients, args.ticks))
+    tick_ms = np.array(server.tick_times) * 1000
+    frames = sum(client.frames for client in clients)
+    received = sum(client.bytes_received for client in clients)
+    print(f"{args.clients} clients, {len(world.monsters)} monsters, "
+          f"{world.game_map.width}x{world.game_map.height} map, {len(tick_ms)} ticks")
+    print(f"server tick: p50 {np.percentile(tick_ms, 50):.2f} ms, "
+          f"p99 {np.percentile(tick_ms, 99):.2f} ms")
+    print(f"snapshot: {received / max(frames, 1):.0f} bytes per client per tick")
+    print(f"client views out of sync: {mismatched}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+import pygame
+from .constants import *
+from .chunked_map import ChunkedGameMap
+from .floors import Floor, _build_map
+from .frames import FrameBuffer
+from .input_state import InputState, poll_input, read_events
+from .profiler import FrameProfiler
+from .renderer import Renderer
+
+# The simulation in its own process. It ticks at FPS on its own clock and
+# sends every tick's frame down a pipe; the window process keeps a replica
+# of the current floor's map in step with the frames and draws between the
+# last two, so a slow tick delays the next frame's contents but never the
+# frame rate. Messages are (kind, payload) tuples: 'floor', 'frame' and
+# 'end' from the simulation; 'input', 'save' and 'quit' to it.
+
+def floor_message(game):
+    # What the window needs to rebuild the current floor's map: the tiles
+    # and exploration so far, or just the seed of an endless map
+    floor = game.floor
+    game_map = floor.game_map
+    message = {'depth': floor.depth, 'stairs': floor.stairs_down is not None,
+               'lit': floor.light_map is not None}
+    if game.endless:
+        message['seed'] = game_map.seed
+        message['explored'] = game_map.explored_chunks()
+        return message
+    message.update({
+        'width': game_map.width,
+        'height': game_map.height,
+        'tiles': np.packbits(game_map.tiles),
+        'explored': np.packbits(game_map.explored),
+        'rooms': np.array([(room.x1, room.y1, room.x2, room.y2) for room in game_map.rooms],
+                          dtype=np.int32).reshape(-1, 4),
+    })
+    return message
+
+def replica_floor(message):
+    # Floor for drawing only: no monsters, spawner or simulation
+    if 'seed' in message:
+        game_map = ChunkedGameMap(message['seed'])
+        game_map.restore_explored(*message['explored'])
+    else:
+        width, height = message['width'], message['height']
+        game_map = _build_map(width, height, message['tiles'], message['rooms'])
+        game_map.explored[...] = np.unpackbits(
+            message['explored'], count=width * height).reshape(width, height)
+    return Floor(message['depth'], game_map, None, None,
+                 stairs=message['stairs'], lit=message['lit'])
+
+def apply_frame(floor, frame):
+    # Bring a replica's view up to a frame; every frame is applied, so
+    # tiles seen only between drawn frames still become explored
+    game_map = floor.game_map
+    if isinstance(game_map, ChunkedGameMap):
+        game_map.stream((frame.player[0] + TILE_SIZE // 2) // TILE_SIZE,
+                        (frame.player[1] + TILE_SIZE // 2) // TILE_SIZE)
+    if frame.fov_origin is not None and frame.fov_origin != game_map.fov_origin:
+        game_map.show_fov(frame.fov_origin, frozenset(map(tuple, frame.visible.tolist())))
+
+def _simulate(connection, make_game):
+    # Simulation process: a headless Game driven by the window's input
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    game = make_game()
+    floor = None
+    pending = InputState()
+    tick_seconds = 1 / FPS
+    next_tick = time.perf_counter()
+    try:
+        while game.running:
+            # Take input until the next tick is due
+            while connection.poll(max(0.0, next_tick - time.perf_counter())):
+                kind, payload = connection.recv()
+                if kind == 'input':
+                    pending = pending.then(InputState.unpack(payload))
+                elif kind == 'save' and game.autosaver is not None:
+                    game.autosaver.save(game)
+                elif kind == 'quit':
+                    game.running = False
+                    break
+            if not game.running:
+                break
+
+            game.input = pending
+            game.step()
+            pending = pending.held()
+            if game.floor is not floor:
+                floor = game.floor
+                connection.send(('floor', floor_message(game)))
+            connection.send(('frame', game.frames.latest))
+
+            # Nothing is drawn here; don't let repaint queues grow
+            game.game_map.renderer.dirty.clear()
+            game.minimap.dirty.clear()
+
+            next_tick += tick_seconds
+            if time.perf_counter() - next_tick > SIM_MAX_CATCHUP_TICKS * tick_seconds:
+                next_tick = time.perf_counter()  # drop the backlog
+        connection.send(('end', None))
+    except (BrokenPipeError, EOFError):
+        pass  # the window went away
+    finally:
+        game.close()
+        connection.close()
+
+def run_decoupled(make_game):
+    # Play with the simulation in a child process. make_game must be
+    # picklable; it is called there to build the Game.
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pygame.display.set_caption("Roguelike Adventure")
+    clock = pygame.time.Clock()
+    profiler = FrameProfiler()
+    renderer = Renderer(screen, profiler)
+    frames = FrameBuffer()
+    pygame.joystick.init()
+    joysticks = [pygame.joystick.Joystick(i) for i in range(pygame.joystick.get_count())]
+    for joystick in joysticks:
+        joystick.init()
+
+    # Spawned rather than forked: this process already has a display open.
+    # Not a daemon, as it runs the floor prefetch pool of its own.
+    context = multiprocessing.get_context('spawn')
+    connection, child = context.Pipe()
+    process = context.Process(target=_simulate, args=(child, make_game))
+    process.start()
+    child.close()
+
+    floor = None
+    running = True
+    try:
+        while running:
+            profiler.begin_frame()
+            with profiler.phase('events'):
+                quit, attack, stairs, keys = read_events()
+                if quit:
+                    break
+                for key in keys:
+                    if key == pygame.K_F5:
+                        connection.send(('save', None))
+                    else:
+                        renderer.handle_key(key)
+                connection.send(('input', poll_input(joysticks, attack, stairs).pack()))
+
+            with profiler.phase('receive'):
+                while running and connection.poll():
+                    kind, payload = connection.recv()
+                    if kind == 'floor':
+                        if floor is not None and isinstance(floor.game_map, ChunkedGameMap):
+                            floor.game_map.close()
+                        floor = replica_floor(payload)
+                        pygame.display.set_caption(f"Roguelike Adventure - Floor {floor.depth + 1}")
+                    elif kind == 'frame':
+                        apply_frame(floor, payload)
+                        frames.publish(payload)
+                    elif kind == 'end':
+                        running = False
+
+            if frames.latest is not None:
+                profiler.count('sim ms', f"{frames.latest.sim_ms:.2f}")
+                with profiler.phase('draw'):
+                    renderer.draw(floor, frames.previous, frames.latest, frames.alpha(),
+                                  frames.take_effects())
+            with profiler.phase('wait'):
+                clock.tick(RENDER_FPS)
+    except (BrokenPipeError, EOFError):
+        pass  # the simulation died; its traceback is on stderr
+    finally:
+        try:
+            connection.send(('quit', None))
+        except (BrokenPipeError, OSError):
+            pass
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+        connection.close()
+        if floor is not None and isinstance(floor.game_map, ChunkedGameMap):
+            floor.game_map.close()
+        pygame.quit()
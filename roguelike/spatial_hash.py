@@ -0,0 +1,173 @@
+import numpy as np
+from .constants import *
+
+class SpatialHash:
+    # Uniform grid of cells mapping to the keys whose point lies inside.
+    # Keys are any hashable entity; positions are pixel coordinates.
+    # Owners that already store positions can pass a `positions` mapping
+    # (key -> (x, y)) and call move() only when a key changes cell.
+    def __init__(self, cell_size=TILE_SIZE, positions=None):
+        self.cell_size = cell_size
+        self.cells = {}      # (cx, cy) -> set of keys
+        self.key_cells = {}  # key -> (cx, cy)
+        self.tracks_positions = positions is None
+        self.positions = {} if positions is None else positions
+
+    def __len__(self):
+        return len(self.key_cells)
+
+    def __contains__(self, key):
+        return key in self.key_cells
+
+    def _cell(self, x, y):
+        return (int(x) // self.cell_size, int(y) // self.cell_size)
+
+    def insert(self, key, x, y):
+        cell = self._cell(x, y)
+        if self.tracks_positions:
+            self.positions[key] = (x, y)
+        self.key_cells[key] = cell
+        self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        if self.tracks_positions:
+            del self.positions[key]
+        cell = self.key_cells.pop(key)
+        bucket = self.cells[cell]
+        bucket.discard(key)
+        if not bucket:
+            del self.cells[cell]
+
+    def move(self, key, x, y):
+        # Cheap when the key stays in its cell, which is the common case
+        if self.tracks_positions:
+            self.positions[key] = (x, y)
+        self.move_to_cell(key, self._cell(x, y))
+
+    def move_to_cell(self, key, cell):
+        old_cell = self.key_cells[key]
+        if cell == old_cell:
+            return
+        bucket = self.cells[old_cell]
+        bucket.discard(key)
+        if not bucket:
+            del self.cells[old_cell]
+        self.key_cells[key] = cell
+        self.cells.setdefault(cell, set()).add(key)
+
+    def _keys_in_cells(self, left, top, right, bottom):
+        cell_size = self.cell_size
+        cells = self.cells
+        x0, x1 = int(left) // cell_size, int(right) // cell_size
+        y0, y1 = int(top) // cell_size, int(bottom) // cell_size
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            # Wide query over a sparse grid: cheaper to walk the occupied
+            # cells, in the same order as the loop below
+            for cell in sorted(cell for cell in cells
+                               if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1):
+                yield from cells[cell]
+            return
+        get = cells.get
+        rows = range(y0, y1 + 1)
+        for cx in range(x0, x1 + 1):
+            for cy in rows:
+                bucket = get((cx, cy))
+                if bucket:
+                    yield from bucket
+
+    def query_rect(self, rect):
+        # Keys whose point lies inside a pygame.Rect
+        positions = self.positions
+        result = []
+        for key in self._keys_in_cells(rect.left, rect.top, rect.right, rect.bottom):
+            x, y = positions[key]
+            if rect.left <= x < rect.right and rect.top <= y < rect.bottom:
+                result.append(key)
+        return result
+
+    def query_radius(self, x, y, radius):
+        # Keys whose point lies within `radius` of (x, y)
+        positions = self.positions
+        radius_sq = radius * radius
+        result = []
+        for key in self._keys_in_cells(x - radius, y - radius, x + radius, y + radius):
+            kx, ky = positions[key]
+            if (kx - x) ** 2 + (ky - y) ** 2 <= radius_sq:
+                result.append(key)
+        return result
+
+class PointGrid:
+    # Points binned into square cells and sorted by cell, answering "which
+    # points lie near these positions" for a whole batch of positions with
+    # one searchsorted per neighbouring cell offset instead of a loop per
+    # query. Only occupied cells are stored, so unbounded maps cost nothing.
+    def __init__(self, x, y, cell_size=PROJECTILE_GRID_CELL):
+        self.cell_size = cell_size
+        keys = self._keys(x // cell_size, y // cell_size)
+        self.order = np.argsort(keys, kind='stable')
+        keys = keys[self.order]
+        self.starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else \
+            np.zeros(0, dtype=np.intp)
+        self.cells = keys[self.starts]
+        self.counts = np.diff(np.r_[self.starts, len(keys)])
+
+    @staticmethod
+    def _keys(cell_x, cell_y):
+        return (cell_x.astype(np.int64) << 32) + cell_y.astype(np.int64)
+
+    def near(self, x, y, reach):
+        # (query, point) index pairs for every point in a cell within reach
+        # of each query position; callers make the exact test
+        if not len(self.cells):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        span = int(np.ceil(reach / self.cell_size))
+        keys = self._keys(x // self.cell_size, y // self.cell_size)
+        # Sorted queries stay sorted under a constant cell offset, which
+        # keeps every searchsorted a cache-friendly merge
+        by_key = np.argsort(keys, kind='stable')
+        keys = keys[by_key]
+        queries, starts, counts = [], [], []
+        last = len(self.cells) - 1
+        for ox in range(-span, span + 1):
+            for oy in range(-span, span + 1):
+                shifted = keys + ((ox << 32) + oy)
+                at = np.minimum(np.searchsorted(self.cells, shifted), last)
+                match = self.cells[at] == shifted
+                at = at[match]
+                queries.append(by_key[match])
+                starts.append(self.starts[at])
+                counts.append(self.counts[at])
+        count = np.concatenate(counts)
+        query = np.repeat(np.concatenate(queries), count)
+        offset = np.arange(len(query)) - np.repeat(np.cumsum(count) - count, count)
+        return query, self.order[np.repeat(np.concatenate(starts), count) + offset]
+
+    def pairs(self, reach):
+        # (point, point) index pairs for every two points in cells within
+        # reach of each other, each pair once; callers make the exact test.
+        # A cell is paired with itself and with the neighbours ahead of it
+        # only, so no pair turns up twice.
+        if not len(self.cells):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        span = int(np.ceil(reach / self.cell_size))
+        last = len(self.cells) - 1
+        firsts, seconds = [], []
+        for ox in range(0, span + 1):
+            for oy in range(-span if ox else 0, span + 1):
+                shifted = self.cells + ((ox << 32) + oy)
+                at = np.minimum(np.searchsorted(self.cells, shifted), last)
+                here = np.flatnonzero(self.cells[at] == shifted)
+                there = at[here]
+                # Every point of one cell against every point of the other
+                size = self.counts[here] * self.counts[there]
+                index = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+                here = np.repeat(here, size)
+                there = np.repeat(there, size)
+                first = index // self.counts[there]
+                second = index % self.counts[there]
+                if ox == oy == 0:
+                    keep = first < second
+                    first, second, here, there = first[keep], second[keep], here[keep], there[keep]
+                firsts.append(self.order[self.starts[here] + first])
+                seconds.append(self.order[self.starts[there] + second])
+        return np.concatenate(firsts), np.concatenate(seconds)
@@ -0,0 +1,131 @@
+import numpy as np
+from .constants import *
+from .entities import MONSTER_TYPE_NAMES
+
+class AliasTable:
+    # Vose's alias method: O(n) setup, then O(1) weighted sampling
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        count = len(weights)
+        scaled = weights * count / weights.sum()
+        self.prob = np.ones(count)
+        self.alias = np.arange(count)
+        small = [i for i in range(count) if scaled[i] < 1]
+        large = [i for i in range(count) if scaled[i] >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+
+    def sample(self, rng, size=None):
+        column = rng.integers(len(self.prob), size=size)
+        keep = rng.random(size) < self.prob[column]
+        return np.where(keep, column, self.alias[column])
+
+MONSTER_TYPE_TABLE = AliasTable([MONSTER_TYPES[name]['spawn_weight']
+                                 for name in MONSTER_TYPE_NAMES])
+
+class SpawnIndex:
+    # Floor tiles inside every room but the first (the player's), stored
+    # flat and grouped by room so spawn queries are array operations
+    def __init__(self, game_map, rooms):
+        bounds = np.array([(room.x1, room.y1, room.x2, room.y2) for room in rooms[1:]],
+                          dtype=np.intp).reshape(-1, 4)
+        self.room_count = len(bounds)
+
+        # Interior tiles of all rooms at once: room i owns sizes[i]
+        # consecutive entries, laid out column by column
+        heights = np.maximum(bounds[:, 3] - bounds[:, 1] - 1, 0)
+        sizes = np.maximum(bounds[:, 2] - bounds[:, 0] - 1, 0) * heights
+        room = np.repeat(np.arange(self.room_count), sizes)
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        x = bounds[room, 0] + 1 + local // heights[room]
+        y = bounds[room, 1] + 1 + local % heights[room]
+
+        floor = ~game_map.walls_at(x, y)
+        self.x = x[floor]
+        self.y = y[floor]
+        self.room = room[floor]
+
+    def valid(self, player_x, player_y):
+        # Positions of tiles far enough from the player's top-left pixel,
+        # the same test the old spawn attempts made after the fact. They
+        # stay grouped by room.
+        dx = self.x * TILE_SIZE - player_x
+        dy = self.y * TILE_SIZE - player_y
+        valid = dx * dx + dy * dy >= SPAWN_DISTANCE_FROM_PLAYER * SPAWN_DISTANCE_FROM_PLAYER
+        return np.flatnonzero(valid)
+
+class Spawner:
+    # Places monsters on indexed floor tiles: a uniformly chosen room, then
+    # a uniformly chosen valid tile in it, with types from the alias table
+    def __init__(self, game_map, monsters, seed):
+        self.game_map = game_map
+        self.monsters = monsters
+        self.rng = np.random.default_rng(seed)
+        self.refresh()
+
+    def refresh(self):
+        # Rebuild the index after the map's rooms change
+        self.index = SpawnIndex(self.game_map, self.game_map.rooms)
+        self.valid_origin = None
+
+    def valid_tiles(self, player):
+        # (valid tiles, per-room counts and starts into them, rooms with
+        # any), worked out once per player position so a pass spawning
+        # many monsters only indexes into them
+        origin = (player.rect.x, player.rect.y)
+        if origin != self.valid_origin:
+            valid = self.index.valid(*origin)
+            counts = np.bincount(self.index.room[valid], minlength=self.index.room_count)
+            self.valid = (valid, counts, np.cumsum(counts) - counts, np.flatnonzero(counts))
+            self.valid_origin = origin
+        return self.valid
+
+    def sample_tiles(self, player, count, room_id=None):
+        # Returns index positions of `count` sampled tiles, or none if no
+        # tile is valid
+        valid, counts, starts, rooms = self.valid_tiles(player)
+        if room_id is None:
+            if not rooms.size:
+                return rooms
+            picked = rooms[self.rng.integers(len(rooms), size=count)]
+        else:
+            if not counts[room_id]:
+                return rooms[:0]
+            picked = np.full(count, room_id)
+        offsets = (self.rng.random(count) * counts[picked]).astype(np.intp)
+        return valid[starts[picked] + offsets]
+
+    def spawn(self, player, room_id=None, allow_stacking=False):
+        # One monster, or None if no valid free tile turned up
+        for tile in self.sample_tiles(player, SPAWN_ATTEMPTS, room_id).tolist():
+            x = int(self.index.x[tile]) * TILE_SIZE
+            y = int(self.index.y[tile]) * TILE_SIZE
+            if (allow_stacking or not self.monsters.spatial_hash.query_radius(
+                    x + TILE_SIZE // 2, y + TILE_SIZE // 2, TILE_SIZE // 2)):
+                type_id = int(MONSTER_TYPE_TABLE.sample(self.rng))
+                return self.monsters.spawn(x, y, MONSTER_TYPE_NAMES[type_id])
+        return None
+
+    def spawn_many(self, player, count, allow_stacking=True):
+        # Bulk spawn in one pass; returns the new slot indices. Without
+        # stacking, tiles already holding a monster (or sampled twice) are
+        # skipped, so fewer than `count` may spawn.
+        tiles = self.sample_tiles(player, count)
+        if not allow_stacking and tiles.size:
+            tiles = np.unique(tiles)
+            store = self.monsters
+            alive = store.alive_indices()
+            occupied = np.zeros(len(self.index.x), dtype=bool)
+            keys = (store.x[alive] // TILE_SIZE).astype(np.int64) * (1 << 32) + \
+                (store.y[alive] // TILE_SIZE).astype(np.int64)
+            tile_keys = self.index.x.astype(np.int64) * (1 << 32) + self.index.y
+            occupied[np.isin(tile_keys, keys)] = True
+            tiles = tiles[~occupied[tiles]]
+        type_ids = MONSTER_TYPE_TABLE.sample(self.rng, tiles.size)
+        return self.monsters.spawn_many(self.index.x[tiles] * TILE_SIZE,
+                                        self.index.y[tiles] * TILE_SIZE, type_ids)
@@ -0,0 +1,62 @@
+from itertools import repeat
+import pygame
+import numpy as np
+from .constants import *
+from .entities import MONSTER_TYPE_NAMES
+
+# Frames are a monster tile with its health bar above it, so each monster
+# draws as one blit. Pixels outside the tile and the bar are keyed out.
+BAR_LEVELS = HEALTH_BAR_WIDTH + 1  # one frame per filled bar width in pixels
+FRAME_WIDTH = max(TILE_SIZE, HEALTH_BAR_WIDTH)
+FRAME_TOP = HEALTH_BAR_OFFSET + HEALTH_BAR_HEIGHT  # tile offset inside a frame
+FRAME_HEIGHT = FRAME_TOP + TILE_SIZE
+COLOR_KEY = (255, 0, 255)
+
+class SpriteAtlas:
+    # One surface holding a frame per (monster type, health bar width):
+    # a row per type, a column per bar level
+    def __init__(self):
+        self.surface = pygame.Surface((FRAME_WIDTH * BAR_LEVELS,
+                                       FRAME_HEIGHT * len(MONSTER_TYPE_NAMES)))
+        self.surface.fill(COLOR_KEY)
+        self.areas = []  # type_id * BAR_LEVELS + level -> source rect
+        for type_id, name in enumerate(MONSTER_TYPE_NAMES):
+            color = MONSTER_TYPES[name]['color']
+            for level in range(BAR_LEVELS):
+                x = level * FRAME_WIDTH
+                y = type_id * FRAME_HEIGHT
+                self.surface.fill(color, (x, y + FRAME_TOP, TILE_SIZE, TILE_SIZE))
+                self.surface.fill(RED, (x, y, HEALTH_BAR_WIDTH, HEALTH_BAR_HEIGHT))
+                if level:
+                    self.surface.fill(GREEN, (x, y, level, HEALTH_BAR_HEIGHT))
+                self.areas.append((x, y, FRAME_WIDTH, FRAME_HEIGHT))
+        self.surface.set_colorkey(COLOR_KEY, pygame.RLEACCEL)
+
+class EntityBatch:
+    # Draws monsters straight from a MonsterStore, or from plain arrays,
+    # with a single blits call
+    def __init__(self):
+        self.atlas = None
+
+    def draw(self, screen, store, indices, camera):
+        self.draw_arrays(screen, store.x[indices], store.y[indices], store.hp[indices],
+                         store.max_hp[indices], store.type_id[indices], camera)
+
+    def draw_arrays(self, screen, x, y, hp, max_hp, type_id, camera):
+        if not len(x):
+            return
+        if self.atlas is None:
+            self.atlas = SpriteAtlas()  # needs an initialized display
+
+        # Same placement as Monster.rect and draw_health_bar
+        left = x.astype(np.int32) - (TILE_SIZE // 2 + camera.x)
+        top = y.astype(np.int32) - (TILE_SIZE // 2 + FRAME_TOP + camera.y)
+        hp = np.clip(hp, 0, max_hp)
+        levels = HEALTH_BAR_WIDTH * hp // np.maximum(max_hp, 1)
+        frames = type_id.astype(np.intp) * BAR_LEVELS + levels
+
+        areas = self.atlas.areas
+        screen.blits(zip(repeat(self.atlas.surface),
+                         zip(left.tolist(), top.tolist()),
+                         [areas[frame] for frame in frames.tolist()]),
+                     doreturn=False)